@@ -1,8 +1,113 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
+from mechanism_index import MechanismIndex
+from multi_compare import MultiComparison
+from result_cache import cached_result
+from sankey_lod import LINK_BUDGET, NODE_BUDGET, OTHER, OTHER_NODE_COLOR, fold_flow
+import perf
+
+# Comparison Sankey color codes: node membership (grey = none, red = A only, blue = B only, purple = shared)
+GREY, RED, BLUE, PURPLE = 0, 1, 2, 3
+COMPARISON_NODE_COLORS = np.array(['grey', 'red', 'blue', 'purple'], dtype=object)
+COMPARISON_LINK_COLORS = np.array(['silver', 'red', 'blue', 'purple'], dtype=object)
+COMPARISON_LINK_RGBA = np.array(['silver', 'rgba(255,0,0,0.4)', 'rgba(0,0,255,0.4)', 'rgba(128,0,128,0.4)'], dtype=object)
+
+# Single-prescription Sankey layers
+SINGLE_NODE_TYPES = {'herb': 'Herb', 'compound': 'Ingredient', 'target': 'Target', 'action': 'Action'}
+# N-way comparison: nodes shared by every selected prescription / by a subset; exclusive nodes take
+# their prescription's color. Overlap regions shown in the UpSet view.
+MULTI_SHARED_COLOR = '#800080'  # Purple
+MULTI_SUBSET_COLOR = '#A0A0A0'  # Grey
+UPSET_MAX_REGIONS = 30
+
+
+def _palette(n):
+    import plotly.express as px
+    colors = px.colors.qualitative.Alphabet
+    return [colors[i % len(colors)] for i in range(n)]
+
+
+def _rgba(hex_color, alpha):
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r},{g},{b},{alpha})"
+
+
+# Key columns of the per-prescription flow tensor (PrescriptionAnalyzer.get_flow)
+FLOW_PATH = ('prescription', 'herb', 'compound', 'target', 'action')
+
+SINGLE_NODE_COLORS = {
+    'herb': '#2ECC71',      # Green
+    'compound': '#F39C12',  # Orange
+    'target': '#E74C3C',    # Red
+    'action': '#9B59B6',    # Purple
+}
+
+
+def _layer_nodes(ids):
+    """Sorted unique non-missing IDs of a Sankey layer (IDs are ordered like the sorted names)."""
+    return np.unique(ids[ids >= 0])
+
+
+def _distinct_paths(flow, keys):
+    """
+    Collapses merged rows to their distinct ID paths over `keys`, with the summed ('amount') and
+    largest ('max_amount') Amount of the rows on each path.
+    """
+    if len(flow[keys[0]]) == 0:
+        return {**{key: np.zeros(0, dtype=np.int64) for key in keys},
+                'amount': np.zeros(0), 'max_amount': np.zeros(0)}
+    # One mixed-radix int64 key per row (IDs shifted by one for the -1 sentinel) when it fits;
+    # np.unique over a 1-D key is far faster than over stacked columns
+    radix = [int(flow[key].max()) + 2 for key in keys]
+    if np.prod(np.array(radix, dtype=float)) < 2 ** 62:
+        code = np.zeros(len(flow[keys[0]]), dtype=np.int64)
+        for key, base in zip(keys, radix):
+            code = code * base + (flow[key] + 1)
+        uniques, inverse = np.unique(code, return_inverse=True)
+        paths = np.empty((len(keys), len(uniques)), dtype=np.int64)
+        for i in range(len(keys) - 1, -1, -1):
+            uniques, paths[i] = np.divmod(uniques, radix[i])
+        paths -= 1
+    else:
+        paths, inverse = np.unique(np.stack([flow[key] for key in keys]), axis=1, return_inverse=True)
+    inverse = inverse.ravel()
+    amount = np.bincount(inverse, weights=np.nan_to_num(flow['amount']), minlength=paths.shape[1])
+    max_amount = np.full(paths.shape[1], -np.inf)
+    np.fmax.at(max_amount, inverse, flow['amount'])
+    return {
+        **dict(zip(keys, paths)),
+        'amount': amount,
+        'max_amount': np.where(np.isneginf(max_amount), np.nan, max_amount),
+    }
+
+
+def _aggregate_links(src, tgt, values, src_nodes, tgt_nodes, how='sum'):
+    """
+    Groups (src, tgt) ID pairs and aggregates their values without Python loops.
+    Returns (source position in src_nodes, target position in tgt_nodes, value), sorted by (source, target)
+    and restricted to positive values.
+    """
+    keep = (src >= 0) & (tgt >= 0)
+    s = np.searchsorted(src_nodes, src[keep])
+    t = np.searchsorted(tgt_nodes, tgt[keep])
+    key = s * len(tgt_nodes) + t
+    pairs, inverse = np.unique(key, return_inverse=True)
+    vals = values[keep]
+    if how == 'sum':
+        agg = np.bincount(inverse, weights=np.nan_to_num(vals), minlength=len(pairs))
+    else:
+        agg = np.full(len(pairs), -np.inf)
+        np.fmax.at(agg, inverse, vals)
+    positive = agg > 0
+    pairs = pairs[positive]
+    n_tgt = max(len(tgt_nodes), 1)
+    return pairs // n_tgt, pairs % n_tgt, agg[positive]
+
+
 class PrescriptionAnalyzer:
-    def __init__(self, df_pres, df_herb, pres_a, pres_b):
+    def __init__(self, df_pres, df_herb, pres_a, pres_b, index=None, cache=None):
         self.raw_pres = df_pres
         self.raw_herb = df_herb
         self.pres_a = pres_a
@@ -20,194 +125,116 @@ class PrescriptionAnalyzer:
         self.col_herb_loop = 'Core_Action'
         self.col_herb_desc = 'KM_Efficacy'
 
+        # Pre-joined integer-ID index; pass a shared one (built once per dataset) to avoid rebuilding
+        self.index = index if index is not None else MechanismIndex(
+            df_pres, df_herb,
+            col_pres_name=self.col_pres_name, col_pres_herb=self.col_pres_herb, col_pres_amount=self.col_pres_amount,
+            col_herb_name=self.col_herb_name, col_herb_ing=self.col_herb_ing,
+            col_herb_target=self.col_herb_target, col_herb_loop=self.col_herb_loop
+        )
+
+        # Optional ResultCache shared across sessions; entries are keyed by the dataset version
+        self.cache = cache
+        self.dataset_version = df_pres.attrs.get('dataset_version')
+
+    @perf.timed()
     def get_filtered_data(self):
-        # Filter for A and B
-        df = self.raw_pres[self.raw_pres[self.col_pres_name].isin([self.pres_a, self.pres_b])].copy()
-        
-        # Integrated structure: everything is already in df_herb
-        df = pd.merge(df, self.raw_herb, left_on=self.col_pres_herb, right_on=self.col_herb_name, how='left')
-        
-        return df
+        # Filter for A and B joined with the integrated Herb_Library (sliced from the index)
+        return self.index.merged_frame([self.pres_a, self.pres_b])
 
-    def get_structure(self):
-        # We need nodes and links
-        # Levels: Prescription -> Herb -> Ingredient -> Loop/Pathway (using Loop as final node for now, or Target)
-        # User asked: [Prescription] -> [Herb] -> [Ingredient] -> [Pathway/Loop Node]
-        
-        df = self.get_filtered_data()
-        
-        # Determine unique sets for coloring
-        # For each Herb, Ingredient, Loop: Is it in A? Is it in B?
-        
-        # Helpers to get sets
-        def get_items(pres_name, col):
-            return set(df[df[self.col_pres_name] == pres_name][col].dropna())
-        
-        herbs_a = get_items(self.pres_a, self.col_pres_herb)
-        herbs_b = get_items(self.pres_b, self.col_pres_herb)
-        
-        ings_a = get_items(self.pres_a, self.col_herb_ing)
-        ings_b = get_items(self.pres_b, self.col_herb_ing)
-        
-        loops_a = get_items(self.pres_a, self.col_herb_loop)
-        loops_b = get_items(self.pres_b, self.col_herb_loop)
-        
-        # Assign colors
-        def get_color(item, set_a, set_b):
-            in_a = item in set_a
-            in_b = item in set_b
-            if in_a and in_b:
-                return "purple"
-            elif in_a:
-                return "red"
-            elif in_b:
-                return "blue"
-            else:
-                return "grey"
-        
-        # Build Node List
-        # We need unique nodes with indices
-        
-        # Prescriptions
-        nodes = []
-        nodes.append({'label': self.pres_a, 'color': 'red', 'type': 'Prescription'})
-        nodes.append({'label': self.pres_b, 'color': 'blue', 'type': 'Prescription'})
-        
-        # Map keys: (Level, Name) -> Index
-        node_map = {('Prescription', self.pres_a): 0, ('Prescription', self.pres_b): 1}
-        
-        def add_nodes(items, set_a, set_b, n_type):
-            sorted_items = sorted(list(set_a | set_b))
-            start_idx = len(nodes)
-            for i, item in enumerate(sorted_items):
-                 nodes.append({
-                     'label': item,
-                     'color': get_color(item, set_a, set_b),
-                     'type': n_type
-                 })
-                 node_map[(n_type, item)] = start_idx + i
-        
-        add_nodes(herbs_a | herbs_b, herbs_a, herbs_b, 'Herb')
-        add_nodes(ings_a | ings_b, ings_a, ings_b, 'Ingredient')
-        add_nodes(loops_a | loops_b, loops_a, loops_b, 'Pathway')
-        
-        # Build Links
-        links = []
-        
-        # 1. Pres -> Herb
-        # Group by Pres, Herb to get summed Amount
-        grp1 = df.groupby([self.col_pres_name, self.col_pres_herb])[self.col_pres_amount].sum().reset_index()
-        for _, row in grp1.iterrows():
-            src_name = row[self.col_pres_name]
-            tgt_name = row[self.col_pres_herb]
-            val = row[self.col_pres_amount]
-            
-            src_key = ('Prescription', src_name)
-            tgt_key = ('Herb', tgt_name)
-            
-            if pd.notna(src_name) and pd.notna(tgt_name) and val > 0:
-                # Link color based on Source (Prescription) is easiest, or relationship.
-                # Requirement: "Prescription A related paths are Red..."
-                # Link color usually matches source for flow clarity in this case.
-                c = 'red' if src_name == self.pres_a else 'blue'
-                if src_key in node_map and tgt_key in node_map:
-                    links.append({'source': node_map[src_key], 'target': node_map[tgt_key], 'value': val, 'color': c})
-
-        # 2. Herb -> Ingredient
-        # Problem: Amounts are definitions. We should propagate the "Flow" from the specific prescription.
-        # But Sankey in Plotly sums incoming. 
-        # If we just link Herb(Purple) -> Ing(Purple), what color?
-        # The prompt says: "Two prescription shared path -> Purple".
-        # So strictly, we should have separate links if we want to show the 'Red flow' vs 'Blue flow' through a shared node.
-        # However, standard Sankey merges flows at nodes. 
-        # To strictly show separate Red/Blue paths, we'd need to duplicate nodes (Herb_A, Herb_B), but that defeats the purpose of "Shared Node".
-        # So we stick to standard Sankey: Shared Node = Purple. 
-        # Links: If the node is Shared, the outgoing link color is tricky.
-        # usually we make the link color semi-transparent grey or purple if both contribute.
-        # Simply: 
-        # If Link connects (Red -> Red) -> Red
-        # (Blue -> Blue) -> Blue
-        # (Purple -> Purple) -> Purple?
-        # (Red -> Purple) -> Red
-        # (Purple -> Red) -> Red (Shouldn't happen)
-        # (Purple -> Purple) -> Purple.
-        
-        # Let's aggregate flows.
-        # Actually, best way to calculate flow volume for (Herb -> Ing) is to sum the Amounts of that Herb from A and B.
-        # But wait, Herb X has Amount 10 in A, 20 in B. Total 30.
-        # Herb X contains Ing Y, Ing Z.
-        # We flow 30 to Y and 30 to Z? Or split?
-        # I will just default to count or sum. 
-        # Let's just create defined links based on existence.
-        # Weight/Value: The user said "Line thickness reflects Amount".
-        # So for Herb -> Ing, use Sum(Amount of Herb).
-        
-        # Iterate over all Unique (Herb, Ing) pairs in the library (that are in our subset)
-        # Value = Sum of Amounts of this Herb in our filtered DF.
-        
-        grp2 = df.groupby([self.col_pres_herb, self.col_herb_ing])[self.col_pres_amount].sum().reset_index()
-        for _, row in grp2.iterrows():
-            src_name = row[self.col_pres_herb]
-            tgt_name = row[self.col_herb_ing]
-            val = row[self.col_pres_amount]
-            
-            src_key = ('Herb', src_name)
-            tgt_key = ('Ingredient', tgt_name)
-            
-            if pd.notna(src_name) and pd.notna(tgt_name) and val > 0:
-                # Color logic for link
-                # If src is Red (only A), link is Red.
-                # If src is Blue (only B), link is Blue.
-                # If src is Purple (Both), check Target.
-                # Actually simpler: check if this specific (Herb->Ing) connection exists in A-chain? 
-                # Yes, if Herb is present in A.
-                # Is it in B-chain? Yes, if Herb is present in B.
-                # Herb is the determinant because Ingredient is intrinsic to Herb.
-                src_color = get_color(src_name, herbs_a, herbs_b)
-                # If src is purple, the link carries both flows. Color it purple? 
-                # Or maybe gradient? Plotly supports 'scales'.
-                # Let's use src color.
-                if src_key in node_map and tgt_key in node_map:
-                    links.append({'source': node_map[src_key], 'target': node_map[tgt_key], 'value': val, 'color': src_color.replace('grey', 'silver')})
+    @perf.timed()
+    def get_sankey_data(self):
+        """
+        Comparison Sankey as arrays ready for go.Sankey:
+        Prescription -> Herb -> Ingredient -> Pathway (Core Action).
+        Returns (nodes, links): nodes = dict(label, color, type), links = dict(source, target, value, color_code)
+        where color_code indexes COMPARISON_COLORS (grey/red/blue/purple).
+        """
+        flow = self.index.flow_ids([self.pres_a, self.pres_b])
+        id_a = self.index.pres_ids([self.pres_a])
+        id_b = self.index.pres_ids([self.pres_b])
+        rows_a = np.isin(flow['prescription'], id_a)
+        rows_b = np.isin(flow['prescription'], id_b)
+
+        # Node color by membership: Shared -> purple, only A -> red, only B -> blue
+        def layer(ids):
+            nodes = _layer_nodes(ids)
+            in_a = np.isin(nodes, ids[rows_a])
+            in_b = np.isin(nodes, ids[rows_b])
+            return nodes, np.select([in_a & in_b, in_a, in_b], [PURPLE, RED, BLUE], GREY)
+
+        herbs, herb_colors = layer(flow['herb'])
+        ings, ing_colors = layer(flow['compound'])
+        loops, loop_colors = layer(flow['action'])
+
+        # Prescription nodes first (A, B), then each layer in sorted order
+        offsets = np.cumsum([2, len(herbs), len(ings)])
+        nodes = {
+            'label': np.concatenate([[self.pres_a, self.pres_b],
+                                     self.index.herb_names[herbs], self.index.compound_names[ings],
+                                     self.index.action_names[loops]]).astype(object),
+            'color': COMPARISON_NODE_COLORS[np.concatenate([[RED, BLUE], herb_colors, ing_colors, loop_colors])],
+            'type': np.repeat(['Prescription', 'Herb', 'Ingredient', 'Pathway'],
+                              [2, len(herbs), len(ings), len(loops)]).astype(object),
+        }
+
+        # 1. Pres -> Herb (summed Amount). Link color follows the source prescription.
+        pres_nodes = _layer_nodes(flow['prescription'])
+        s1, t1, v1 = _aggregate_links(flow['prescription'], flow['herb'], flow['amount'], pres_nodes, herbs)
+        src_pres = pres_nodes[s1]
+        src1 = np.where(np.isin(src_pres, id_b), 1, 0)
+        color1 = np.where(np.isin(src_pres, id_a), RED, BLUE)
+
+        # 2. Herb -> Ingredient: the herb is the determinant, as ingredients are intrinsic to it.
+        # Flow volume = Sum(Amount of this Herb) in the selected prescriptions.
+        s2, t2, v2 = _aggregate_links(flow['herb'], flow['compound'], flow['amount'], herbs, ings)
 
         # 3. Ingredient -> Core Action (Pathology Loop)
-        # Grouped by 핵심작용 to reduce target-protein level clutter
-        grp3 = df.groupby([self.col_herb_ing, self.col_herb_loop])[self.col_pres_amount].sum().reset_index()
-        for _, row in grp3.iterrows():
-            src_name = row[self.col_herb_ing]
-            tgt_name = row[self.col_herb_loop]
-            val = row[self.col_pres_amount]
-            
-            src_key = ('Ingredient', src_name)
-            tgt_key = ('Pathway', tgt_name)
-            
-            if pd.notna(src_name) and pd.notna(tgt_name) and val > 0:
-                src_color = get_color(src_name, ings_a, ings_b)
-                if src_key in node_map and tgt_key in node_map:
-                    links.append({'source': node_map[src_key], 'target': node_map[tgt_key], 'value': val, 'color': src_color.replace('grey', 'silver')})
-                
+        s3, t3, v3 = _aggregate_links(flow['compound'], flow['action'], flow['amount'], ings, loops)
+
+        links = {
+            'source': np.concatenate([src1, offsets[0] + s2, offsets[1] + s3]),
+            'target': np.concatenate([offsets[0] + t1, offsets[1] + t2, offsets[2] + t3]),
+            'value': np.concatenate([v1, v2, v3]),
+            'color_code': np.concatenate([color1, herb_colors[s2], ing_colors[s3]]),
+        }
         return nodes, links
 
+    @perf.timed()
+    def get_structure(self):
+        # We need nodes and links
+        # Levels: Prescription -> Herb -> Ingredient -> Loop/Pathway
+        # Shared nodes are purple; a link takes the color of its source (grey links are drawn silver).
+        nodes, links = self.get_sankey_data()
+        node_list = [
+            {'label': label, 'color': color, 'type': n_type}
+            for label, color, n_type in zip(nodes['label'], nodes['color'], nodes['type'])
+        ]
+        link_list = [
+            {'source': src, 'target': tgt, 'value': val, 'color': color}
+            for src, tgt, val, color in zip(links['source'].tolist(), links['target'].tolist(),
+                                            links['value'].tolist(),
+                                            COMPARISON_LINK_COLORS[links['color_code']].tolist())
+        ]
+        return node_list, link_list
+
+    @perf.timed()
     def generate_sankey(self):
-        nodes, links = self.get_structure()
-        
-        # Plotly format
-        # node = dict(label=[...], color=[...])
-        # link = dict(source=[...], target=[...], value=[...], color=[...])
+        nodes, links = self.get_sankey_data()
         
         node_dict = {
-            'label': [n['label'] for n in nodes],
-            'color': [n['color'] for n in nodes],
+            'label': nodes['label'],
+            'color': nodes['color'],
             'pad': 40,  # Further increased padding
             'thickness': 12, # Even slimmer nodes to give more room for labels
             'line': dict(color="black", width=0.5)
         }
         
         link_dict = {
-            'source': [l['source'] for l in links],
-            'target': [l['target'] for l in links],
-            'value': [l['value'] for l in links],
-            'color': [l['color'].replace('red', 'rgba(255,0,0,0.4)').replace('blue', 'rgba(0,0,255,0.4)').replace('purple', 'rgba(128,0,128,0.4)') for l in links] # Add transparency
+            'source': links['source'],
+            'target': links['target'],
+            'value': links['value'],
+            'color': COMPARISON_LINK_RGBA[links['color_code']] # Add transparency
         }
         
         fig = go.Figure(data=[go.Sankey(
@@ -223,33 +250,204 @@ class PrescriptionAnalyzer:
         )
         return fig
 
+    @perf.timed()
+    def get_multi_sankey_data(self, pres_names, node_budget=NODE_BUDGET, link_budget=LINK_BUDGET):
+        """
+        N-way comparison Sankey as arrays ready for go.Sankey:
+        Prescriptions -> Herb -> Ingredient -> Pathway (Core Action).
+        Nodes are colored by overlap region (MultiComparison): shared by all (purple), exclusive to one
+        prescription (its color), shared by a subset (grey); links take the color of their source.
+        Ingredients and actions beyond the node / link budget are folded into "Other (k items)" nodes.
+        Returns (nodes, links): nodes = dict(label, color, type), links = dict(source, target, value, color).
+        """
+        comparison = MultiComparison(self.index, pres_names)
+        palette = np.array(_palette(len(comparison.pres_names)), dtype=object)
+        chain = ('prescription', 'herb', 'compound', 'action')
+        flow, buckets = fold_flow(_distinct_paths(comparison.flow, chain), node_budget, link_budget, chain=chain)
+        names = {'herb': self.index.herb_names, 'compound': self.index.compound_names,
+                 'action': self.index.action_names}
+        layers = ['herb', 'compound', 'action']
+        layer_nodes = {key: _layer_nodes(flow[key]) for key in layers}
+
+        def layer_colors(key):
+            ids = layer_nodes[key]
+            real = ids[ids != OTHER]
+            masks = comparison.masks[key][np.searchsorted(comparison.features[key], real)]
+            owner = np.log2(np.maximum(masks, 1).astype(float)).astype(int)
+            colors = np.where(masks == comparison.all_mask, MULTI_SHARED_COLOR,
+                              np.where(np.bitwise_count(masks) == 1, palette[np.minimum(owner, len(palette) - 1)],
+                                       MULTI_SUBSET_COLOR))
+            return np.append(colors.astype(object), [OTHER_NODE_COLOR] * (len(ids) - len(real)))
+
+        def labels(key):
+            ids = layer_nodes[key]
+            if key not in buckets:
+                return np.asarray(names[key][ids], dtype=object)
+            return np.append(np.asarray(names[key][ids[:-1]], dtype=object), f"Other ({len(buckets[key])} items)")
+
+        n_pres = len(comparison.pres_names)
+        sizes = [n_pres] + [len(layer_nodes[key]) for key in layers]
+        offsets = dict(zip(layers, np.cumsum(sizes)[:-1]))
+        colors = np.concatenate([palette] + [layer_colors(key) for key in layers]).astype(object)
+        nodes = {
+            'label': np.concatenate([np.array(comparison.pres_names, dtype=object)] + [labels(key) for key in layers]),
+            'color': colors,
+            'type': np.repeat(['Prescription', 'Herb', 'Ingredient', 'Pathway'], sizes).astype(object),
+        }
+
+        # 1. Prescription -> Herb: prescription nodes are in selection order
+        pres_ids = self.index.pres_names.get_indexer(pd.Index(comparison.pres_names, dtype=object))
+        order = np.argsort(pres_ids)
+        s1, t1, v1 = _aggregate_links(flow['prescription'], flow['herb'], flow['amount'], pres_ids[order],
+                                      layer_nodes['herb'])
+        sources, targets, values = [order[s1]], [offsets['herb'] + t1], [v1]
+        # 2. Herb -> Ingredient, 3. Ingredient -> Core Action
+        for src_key, tgt_key in [('herb', 'compound'), ('compound', 'action')]:
+            s, t, v = _aggregate_links(flow[src_key], flow[tgt_key], flow['amount'],
+                                       layer_nodes[src_key], layer_nodes[tgt_key])
+            sources.append(offsets[src_key] + s)
+            targets.append(offsets[tgt_key] + t)
+            values.append(v)
+
+        source = np.concatenate(sources)
+        links = {
+            'source': source,
+            'target': np.concatenate(targets),
+            'value': np.concatenate(values),
+            'color': np.array([_rgba(c, 0.35) for c in colors], dtype=object)[source],
+        }
+        return nodes, links
+
+    @perf.timed()
+    @cached_result()
+    def generate_multi_sankey(self, pres_names, node_budget=NODE_BUDGET, link_budget=LINK_BUDGET):
+        nodes, links = self.get_multi_sankey_data(pres_names, node_budget, link_budget)
+        fig = go.Figure(data=[go.Sankey(
+            node=dict(
+                label=nodes['label'],
+                color=nodes['color'],
+                pad=20,
+                thickness=12,
+                line=dict(color="black", width=0.5)
+            ),
+            link=dict(
+                source=links['source'],
+                target=links['target'],
+                value=links['value'],
+                color=links['color'],
+                hovertemplate="Flow Volume: %{value:.1f}<extra></extra>"
+            )
+        )])
+        fig.update_layout(
+            title_text=f"{len(set(pres_names))}-Formula Comparison",
+            font_size=12,
+            height=900 if len(nodes['label']) < 80 else 1200,
+            margin=dict(l=40, r=40, t=80, b=40)
+        )
+        return fig
+
+    @perf.timed()
+    @cached_result()
+    def get_overlap_regions(self, pres_names, layer='herb'):
+        """Overlap lattice regions of the selected prescriptions in one layer (see MultiComparison.regions)."""
+        return MultiComparison(self.index, pres_names).regions(layer)
+
+    @perf.timed()
+    @cached_result()
+    def generate_upset(self, pres_names, layer='herb', max_regions=UPSET_MAX_REGIONS):
+        """
+        UpSet view of the overlap regions: region sizes (top), the member prescriptions of each region
+        as a dot matrix (bottom) and each prescription's set size (left).
+        """
+        from plotly.subplots import make_subplots
+        comparison = MultiComparison(self.index, pres_names)
+        regions = comparison.regions(layer).head(max_regions)
+        names = comparison.pres_names
+        palette = _palette(len(names))
+        x = np.arange(len(regions))
+        y = np.arange(len(names))[::-1]  # first prescription on top
+
+        fig = make_subplots(rows=2, cols=2, column_widths=[0.2, 0.8], row_heights=[0.6, 0.4],
+                            specs=[[None, {}], [{}, {}]], shared_xaxes=True, shared_yaxes=True,
+                            horizontal_spacing=0.01, vertical_spacing=0.02)
+        preview = [", ".join(items[:10]) + (" …" if len(items) > 10 else "") for items in regions['Items']]
+        fig.add_trace(go.Bar(
+            x=x, y=regions['Count'], marker_color=MULTI_SUBSET_COLOR, text=regions['Count'],
+            customdata=np.stack([[" ∩ ".join(m) for m in regions['Members']], preview], axis=-1)
+            if len(regions) else None,
+            hovertemplate="%{customdata[0]}<br>%{y} items: %{customdata[1]}<extra></extra>",
+        ), row=1, col=2)
+
+        # Dot matrix: every (region, prescription) cell grey, members filled and joined by a line
+        grid_x, grid_y = np.meshgrid(x, y)
+        fig.add_trace(go.Scatter(x=grid_x.ravel(), y=grid_y.ravel(), mode='markers',
+                                 marker=dict(color='#E5E5E5', size=10), hoverinfo='skip'), row=2, col=2)
+        for i, mask in enumerate(regions['Mask']):
+            members = [j for j in range(len(names)) if int(mask) >> j & 1]
+            fig.add_trace(go.Scatter(
+                x=[i] * len(members), y=y[members], mode='lines+markers',
+                line=dict(color='#333333', width=2), marker=dict(color=[palette[j] for j in members], size=10),
+                hoverinfo='skip',
+            ), row=2, col=2)
+
+        fig.add_trace(go.Bar(
+            x=comparison.set_sizes(layer), y=y, orientation='h', marker_color=palette,
+            hovertemplate="%{x} items<extra></extra>",
+        ), row=2, col=1)
+        fig.update_xaxes(autorange='reversed', row=2, col=1)
+        fig.update_xaxes(showticklabels=False, row=2, col=2)
+        fig.update_yaxes(tickvals=y, ticktext=names, row=2, col=1)
+        fig.update_layout(
+            title_text=f"{SINGLE_NODE_TYPES.get(layer, layer.title())} Overlap ({len(regions)} regions)",
+            showlegend=False,
+            height=420 + 28 * len(names),
+            margin=dict(l=40, r=20, t=80, b=20),
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)'
+        )
+        return fig
+
+    @perf.timed()
     def get_common_insights(self):
-        df = self.get_filtered_data()
-        
-        # Filter for Prescription A and B separately
-        df_a = df[df[self.col_pres_name] == self.pres_a]
-        df_b = df[df[self.col_pres_name] == self.pres_b]
+        # Targets / actions reached by Prescription A and B separately (from their flow tensors)
+        flow_a = self.get_flow(self.pres_a)
+        flow_b = self.get_flow(self.pres_b)
         
         # Common Loops
-        loops_a = set(df_a[self.col_herb_loop].dropna())
-        loops_b = set(df_b[self.col_herb_loop].dropna())
-        common_loops = list(loops_a.intersection(loops_b))
+        loops = np.intersect1d(flow_a['action'], flow_b['action'])
+        common_loops = self.index.names_for('action', loops)
         
         # Common Targets
-        targets_a = set(df_a[self.col_herb_target].dropna())
-        targets_b = set(df_b[self.col_herb_target].dropna())
-        common_targets = list(targets_a.intersection(targets_b))
+        targets = np.intersect1d(flow_a['target'], flow_b['target'])
+        common_targets = self.index.names_for('target', targets)
         
         return common_targets, common_loops
 
+    @perf.timed()
+    @cached_result()
     def get_inference_data(self, target_pres):
-        # Filter raw prescription data
-        df = self.raw_pres[self.raw_pres[self.col_pres_name] == target_pres].copy()
-        
-        # Merge with integrated Herb Library
-        df = pd.merge(df, self.raw_herb, left_on=self.col_pres_herb, right_on=self.col_herb_name, how='left')
-        
-        return df
+        # Prescription rows joined with the integrated Herb Library (sliced from the index)
+        return self.index.merged_frame([target_pres])
+
+    @perf.timed()
+    @cached_result()
+    def get_inference_evidence(self, target_pres):
+        """
+        Distinct (compound, target, action, efficacy) evidence of each herb, deduplicated and grouped once.
+        Returns the rows sorted by herb and {herb: (start, stop)}, their row range in it.
+        """
+        df = self.get_inference_data(target_pres)
+        cols = [self.col_pres_herb] + [c for c in (self.col_herb_ing, self.col_herb_target, self.col_herb_loop,
+                                                   self.col_herb_desc) if c in df.columns]
+        evidence = (df[cols].dropna(subset=[self.col_pres_herb]).drop_duplicates()
+                    .sort_values(self.col_pres_herb, kind='stable').reset_index(drop=True))
+        sizes = evidence.groupby(self.col_pres_herb, sort=True, observed=True).size()
+        stops = np.cumsum(sizes.to_numpy())
+        ranges = {herb: (int(stop - size), int(stop)) for herb, size, stop in zip(sizes.index, sizes, stops)}
+        return evidence, ranges
+
+    @perf.timed()
+    @cached_result('pres_a', 'pres_b')
     def get_comparison_profiles(self):
         df = self.get_filtered_data()
         
@@ -267,15 +465,15 @@ class PrescriptionAnalyzer:
         # 2. Functional Profile (Herb Names on X-axis, Amount on Y-axis)
         # We need to know which actions are associated with each herb
         def get_formatted_actions(df_herb):
-            return df_herb.groupby(self.col_pres_herb)[self.col_herb_loop].apply(
+            return df_herb.groupby(self.col_pres_herb, observed=True)[self.col_herb_loop].apply(
                 lambda x: "<br>• " + "<br>• ".join(sorted(set(x.dropna())))
             ).to_dict()
 
         herb_actions_a = get_formatted_actions(df_a)
         herb_actions_b = get_formatted_actions(df_b)
         
-        amounts_a = df_a.groupby(self.col_pres_herb)[self.col_pres_amount].max().to_dict()
-        amounts_b = df_b.groupby(self.col_pres_herb)[self.col_pres_amount].max().to_dict()
+        amounts_a = df_a.groupby(self.col_pres_herb, observed=True)[self.col_pres_amount].max().to_dict()
+        amounts_b = df_b.groupby(self.col_pres_herb, observed=True)[self.col_pres_amount].max().to_dict()
         
         all_herbs = sorted(list(herbs_a | herbs_b))
         
@@ -301,130 +499,181 @@ class PrescriptionAnalyzer:
             'actions': comparison_data
         }
 
-    def get_single_structure(self, target_pres, mode='deep'):
-        # mode: 'deep' (5 levels) or 'condensed' (3 levels: Pres -> Herb -> Core Action)
-        df = self.raw_pres[self.raw_pres[self.col_pres_name] == target_pres].copy()
-        df = pd.merge(df, self.raw_herb, left_on=self.col_pres_herb, right_on=self.col_herb_name, how='left')
-        
-        nodes = []
-        node_map = {} # (Type, Name) -> Index
-        
-        # 1. Prescription Node
-        nodes.append({'label': target_pres, 'color': '#2E2E2E', 'type': 'Prescription'})
-        node_map[('Prescription', target_pres)] = 0
-        
-        # Helper to add layer nodes
-        def add_layer_nodes(items, n_type, color):
-            start_idx = len(nodes)
-            unique_items = sorted(list(set(items.dropna())))
-            for i, item in enumerate(unique_items):
-                nodes.append({'label': item, 'color': color, 'type': n_type})
-                node_map[(n_type, item)] = start_idx + i
-
-        add_layer_nodes(df[self.col_pres_herb], 'Herb', '#2ECC71') # Green
-        
+    @perf.timed()
+    @cached_result(index_ids=True)
+    def get_flow(self, target_pres):
+        """
+        Deep flow tensor of one prescription: its distinct Prescription -> Herb -> Compound -> Target -> Action
+        paths (integer IDs, -1 = missing) with the summed ('amount') and largest ('max_amount') herb amount
+        of the merged rows on each path. Computed once per prescription; the deep and condensed Sankeys,
+        the sunburst and the common insights are aggregations of it.
+        """
+        return _distinct_paths(self.index.flow_ids([target_pres]), FLOW_PATH)
+
+    def _herb_action_amounts(self, flow):
+        """Condensed projection of a flow tensor: (herb IDs, action IDs, largest herb amount) per pair."""
+        herb_nodes, action_nodes = _layer_nodes(flow['herb']), _layer_nodes(flow['action'])
+        h, a, v = _aggregate_links(flow['herb'], flow['action'], flow['max_amount'], herb_nodes, action_nodes,
+                                   how='max')
+        return herb_nodes[h], action_nodes[a], v
+
+    @perf.timed()
+    @cached_result()
+    def get_single_lod_buckets(self, target_pres, node_budget=NODE_BUDGET, link_budget=LINK_BUDGET, drill=()):
+        """Names folded into each "Other" node of the deep Sankey at this level of detail, by flow volume."""
+        names = {'compound': self.index.compound_names, 'target': self.index.target_names,
+                 'action': self.index.action_names}
+        _, buckets = fold_flow(self.get_flow(target_pres), node_budget, link_budget, drill)
+        return {layer: names[layer][members].tolist() for layer, members in buckets.items()}
+
+    @perf.timed()
+    def get_single_sankey_data(self, target_pres, mode='deep', node_budget=NODE_BUDGET, link_budget=LINK_BUDGET,
+                               drill=()):
+        """
+        Single-prescription Sankey as arrays ready for go.Sankey.
+        mode: 'deep' (5 levels) or 'condensed' (3 levels: Pres -> Herb -> Core Action)
+        Deep mode keeps the graph within `node_budget` / `link_budget` by folding the smallest compounds
+        and targets into "Other (k items)" nodes (see sankey_lod.fold_flow; None = full graph);
+        `drill` expands those buckets.
+        Returns (nodes, links): nodes = dict(label, color, type), links = dict(source, target, value, color).
+        """
+        flow = self.get_flow(target_pres)
+        buckets = {}
         if mode == 'deep':
-            add_layer_nodes(df[self.col_herb_ing], 'Ingredient', '#F39C12') # Orange
-            add_layer_nodes(df[self.col_herb_target], 'Target', '#E74C3C') # Red
-        
-        add_layer_nodes(df[self.col_herb_loop], 'Action', '#9B59B6') # Purple
-        
-        links = []
-        
+            flow, buckets = fold_flow(flow, node_budget, link_budget, drill)
+        names = {
+            'herb': self.index.herb_names, 'compound': self.index.compound_names,
+            'target': self.index.target_names, 'action': self.index.action_names,
+        }
+        layers = ['herb', 'compound', 'target', 'action'] if mode == 'deep' else ['herb', 'action']
+
+        # Node indexing: Prescription node 0, then each layer's sorted IDs at its offset
+        layer_nodes = {key: _layer_nodes(flow[key]) for key in layers}
+        sizes = [1] + [len(layer_nodes[key]) for key in layers]
+        offsets = dict(zip(layers, np.cumsum(sizes)[:-1]))
+
+        def labels(key):
+            ids = layer_nodes[key]
+            if key not in buckets:
+                return np.asarray(names[key][ids], dtype=object)
+            # The "Other" node is the layer's last
+            return np.append(np.asarray(names[key][ids[:-1]], dtype=object), f"Other ({len(buckets[key])} items)")
+
+        nodes = {
+            'label': np.concatenate([[target_pres]] + [labels(key) for key in layers]).astype(object),
+            'color': np.repeat(['#2E2E2E'] + [SINGLE_NODE_COLORS[key] for key in layers], sizes).astype(object),
+            'type': np.repeat(['Prescription'] + [SINGLE_NODE_TYPES[key] for key in layers], sizes).astype(object),
+        }
+        for key in buckets:
+            nodes['color'][offsets[key] + sizes[layers.index(key) + 1] - 1] = OTHER_NODE_COLOR
+
+        sources, targets, values, colors = [], [], [], []
+
+        def add_links(src, tgt, val, color):
+            keep = val > 0
+            sources.append(src[keep])
+            targets.append(tgt[keep])
+            values.append(val[keep])
+            colors.append(np.full(int(keep.sum()), color, dtype=object))
+
         # 1. Pres -> Herb
-        grp1 = df.groupby(self.col_pres_herb)[self.col_pres_amount].sum().reset_index()
-        for _, row in grp1.iterrows():
-            src, tgt, val = target_pres, row[self.col_pres_herb], row[self.col_pres_amount]
-            if (('Prescription', src) in node_map) and (('Herb', tgt) in node_map) and val > 0:
-                links.append({'source': node_map[('Prescription', src)], 'target': node_map[('Herb', tgt)], 'value': val, 'color': 'rgba(46, 204, 113, 0.2)'})
-        
+        pres_nodes = _layer_nodes(flow['prescription'])
+        _, t, v = _aggregate_links(flow['prescription'], flow['herb'], flow['amount'], pres_nodes, layer_nodes['herb'])
+        add_links(np.zeros(len(t), dtype=np.int64), offsets['herb'] + t, v, 'rgba(46, 204, 113, 0.2)')
+
         if mode == 'deep':
-            # 2. Herb -> Ingredient
-            grp2 = df.groupby([self.col_pres_herb, self.col_herb_ing])[self.col_pres_amount].sum().reset_index()
-            for _, row in grp2.iterrows():
-                src, tgt, val = row[self.col_pres_herb], row[self.col_herb_ing], row[self.col_pres_amount]
-                if (('Herb', src) in node_map) and (('Ingredient', tgt) in node_map) and val > 0:
-                    links.append({'source': node_map[('Herb', src)], 'target': node_map[('Ingredient', tgt)], 'value': val, 'color': 'rgba(243, 156, 18, 0.1)'})
-            
-            # 3. Ingredient -> Target
-            grp3 = df.groupby([self.col_herb_ing, self.col_herb_target])[self.col_pres_amount].sum().reset_index()
-            for _, row in grp3.iterrows():
-                src, tgt, val = row[self.col_herb_ing], row[self.col_herb_target], row[self.col_pres_amount]
-                if (('Ingredient', src) in node_map) and (('Target', tgt) in node_map) and val > 0:
-                    links.append({'source': node_map[('Ingredient', src)], 'target': node_map[('Target', tgt)], 'value': val, 'color': 'rgba(231, 76, 60, 0.05)'})
-            
-            # 4. Target -> Action
-            grp4 = df.groupby([self.col_herb_target, self.col_herb_loop])[self.col_pres_amount].sum().reset_index()
-            for _, row in grp4.iterrows():
-                src, tgt, val = row[self.col_herb_target], row[self.col_herb_loop], row[self.col_pres_amount]
-                if (('Target', src) in node_map) and (('Action', tgt) in node_map) and val > 0:
-                    links.append({'source': node_map[('Target', src)], 'target': node_map[('Action', tgt)], 'value': val, 'color': 'rgba(155, 89, 182, 0.1)'})
+            # 2. Herb -> Ingredient, 3. Ingredient -> Target, 4. Target -> Action
+            for src_key, tgt_key, color in [('herb', 'compound', 'rgba(243, 156, 18, 0.1)'),
+                                            ('compound', 'target', 'rgba(231, 76, 60, 0.05)'),
+                                            ('target', 'action', 'rgba(155, 89, 182, 0.1)')]:
+                s, t, v = _aggregate_links(flow[src_key], flow[tgt_key], flow['amount'],
+                                           layer_nodes[src_key], layer_nodes[tgt_key])
+                add_links(offsets[src_key] + s, offsets[tgt_key] + t, v, color)
         else:
-            # Condensed Mode: Herb -> Action directly
-            # Group by Herb and Action, use max amount for sizing
-            grp_condensed = df.groupby([self.col_pres_herb, self.col_herb_loop])[self.col_pres_amount].max().reset_index()
-            
-            # Count actions per herb to distribute flow evenly
-            herb_action_counts = df.groupby(self.col_pres_herb)[self.col_herb_loop].nunique().to_dict()
-
-            for _, row in grp_condensed.iterrows():
-                h_name, a_name, h_amt = row[self.col_pres_herb], row[self.col_herb_loop], row[self.col_pres_amount]
-                
-                # Distribute amount across actions to keep flow consistent and visually balanced
-                div = herb_action_counts.get(h_name, 1)
-                val = h_amt / div
-                
-                if (('Herb', h_name) in node_map) and (('Action', a_name) in node_map) and val > 0:
-                    # Use a more vibrant color for condensed links
-                    links.append({
-                        'source': node_map[('Herb', h_name)], 
-                        'target': node_map[('Action', a_name)], 
-                        'value': val, 
-                        'color': 'rgba(155, 89, 182, 0.4)' 
-                    })
-
-                    
+            # Condensed Mode: Herb -> Action directly, sized by the herb's amount
+            h, a, v = self._herb_action_amounts(flow)
+            s = np.searchsorted(layer_nodes['herb'], h)
+            t = np.searchsorted(layer_nodes['action'], a)
+            # Distribute amount across the herb's actions to keep flow consistent and visually balanced
+            herb_action_counts = np.bincount(s, minlength=len(layer_nodes['herb']))
+            # Use a more vibrant color for condensed links
+            add_links(offsets['herb'] + s, offsets['action'] + t, v / herb_action_counts[s], 'rgba(155, 89, 182, 0.4)')
+
+        links = {
+            'source': np.concatenate(sources),
+            'target': np.concatenate(targets),
+            'value': np.concatenate(values),
+            'color': np.concatenate(colors),
+        }
         return nodes, links
 
-    def generate_single_sankey(self, target_pres, mode='deep'):
-        nodes, links = self.get_single_structure(target_pres, mode)
+    @perf.timed()
+    @cached_result()
+    def get_single_structure(self, target_pres, mode='deep', node_budget=NODE_BUDGET, link_budget=LINK_BUDGET,
+                             drill=()):
+        # mode: 'deep' (5 levels) or 'condensed' (3 levels: Pres -> Herb -> Core Action)
+        nodes, links = self.get_single_sankey_data(target_pres, mode, node_budget, link_budget, drill)
+        node_list = [
+            {'label': label, 'color': color, 'type': n_type}
+            for label, color, n_type in zip(nodes['label'], nodes['color'], nodes['type'])
+        ]
+        link_list = [
+            {'source': src, 'target': tgt, 'value': val, 'color': color}
+            for src, tgt, val, color in zip(links['source'].tolist(), links['target'].tolist(),
+                                            links['value'].tolist(), links['color'])
+        ]
+        return node_list, link_list
+
+    @perf.timed()
+    @cached_result()
+    def generate_single_sankey(self, target_pres, mode='deep', node_budget=NODE_BUDGET, link_budget=LINK_BUDGET,
+                               drill=()):
+        # Arrays go straight into go.Sankey
+        nodes, links = self.get_single_sankey_data(target_pres, mode, node_budget, link_budget, drill)
         
         fig = go.Figure(data=[go.Sankey(
             node=dict(
-                label=[n['label'] for n in nodes],
-                color=[n['color'] for n in nodes],
+                label=nodes['label'],
+                color=nodes['color'],
                 pad=20 if mode=='condensed' else 15,
                 thickness=20 if mode=='condensed' else 15,
                 line=dict(color="rgba(0,0,0,0.2)", width=0.5)
             ),
             link=dict(
-                source=[l['source'] for l in links],
-                target=[l['target'] for l in links],
-                value=[l['value'] for l in links],
-                color=[l['color'] for l in links],
+                source=links['source'],
+                target=links['target'],
+                value=links['value'],
+                color=links['color'],
                 hovertemplate="Flow Volume: %{value:.1f}<extra></extra>"
             )
         )])
         
         title = f"Mechanism Narrative: {target_pres} (Overview)" if mode=='condensed' else f"Detailed Bio-Pathway: {target_pres}"
+        if mode == 'deep' and drill:
+            title += "".join(f" › Other {SINGLE_NODE_TYPES[layer]}s" for layer in drill)
         
         fig.update_layout(
             title_text=title,
             font_size=14 if mode=='condensed' else 12,
-            height=700 if mode=='condensed' else (800 if len(nodes) < 50 else 1200),
+            height=700 if mode=='condensed' else (800 if len(nodes['label']) < 50 else 1200),
             margin=dict(l=40, r=40, t=80, b=40),
             paper_bgcolor='rgba(0,0,0,0)',
             plot_bgcolor='rgba(0,0,0,0)'
         )
         return fig
 
+    @perf.timed()
+    @cached_result()
     def generate_sunburst(self, target_pres):
         import plotly.express as px
-        df = self.get_inference_data(target_pres)
-        
         # Prepare data for Sunburst: Prescription -> Herb -> Core Action
-        # We need to aggregate amounts correctly
-        sun_df = df.groupby([self.col_pres_name, self.col_pres_herb, self.col_herb_loop])[self.col_pres_amount].max().reset_index()
+        # Largest herb amount per (Herb, Core Action), projected from the flow tensor
+        herbs, actions, amounts = self._herb_action_amounts(self.get_flow(target_pres))
+        sun_df = pd.DataFrame({
+            self.col_pres_herb: self.index.herb_names[herbs].astype(object),
+            self.col_herb_loop: self.index.action_names[actions].astype(object),
+            self.col_pres_amount: amounts,
+        })
         
         # To make it look good, we can add a 'Total' root
         fig = px.sunburst(
@@ -1,24 +1,155 @@
 import streamlit as st
-from data_loader import load_data
-from analysis import PrescriptionAnalyzer
+from data_loader import dataset_store, dataset_version, load_enrichment_engine, load_mechanism_index, load_path_engine, load_reverse_index, load_script_index, load_search_index, load_similarity_engine, OFFLINE
+from analysis import PrescriptionAnalyzer, SINGLE_NODE_TYPES
+from enrichment import ENRICHMENT_FDR, key_themes
+from sankey_lod import NODE_BUDGET
+from path_query import generate_path_sankey
+from result_cache import shared_cache
+import perf
 import pandas as pd
+from datetime import datetime
 
 st.set_page_config(layout="wide", page_title="Herbal Dashboard")
 
-def render_mechanism_page(df_pres, df_herb, sankey_mode='condensed'):
+def plotly_chart(fig):
+    # Payload size is only measured while the debug panel is open: serializing twice is not free, and
+    # runs that are only logged (HERB_PERF_LOG) should time what users get
+    size = len(fig.to_json()) if perf.panel_open() else None
+    with perf.span("st.plotly_chart", bytes=size):
+        st.plotly_chart(fig, use_container_width=True)
+
+PAGES = ["Mechanism Analysis", "Intuitive Comparison", "Multi-Formula Comparison", "Pathology Inference", "Mechanism Paths", "Similar Formulas", "Reverse Lookup"]
+REVERSE_KINDS = {"Target Protein": "target", "Core Action": "action", "Compound": "compound", "Herb": "herb"}
+PATH_TARGETS = {"Core Action": "action", "Target Protein": "target"}
+# Grey context paths drawn behind the highlighted top-k
+PATH_CONTEXT = 20
+# Evidence rows per page of the Pathology Inference detail table
+EVIDENCE_PAGE_SIZE = 100
+# Clinical script rows searched per symptom query
+SYMPTOM_RESULTS = 20
+SEARCH_ICONS = {'prescription': "💊", 'herb': "🌿", 'compound': "🧪", 'target': "🎯"}
+
+def prescription_options(df_pres, df_herb):
+    # Sorted once per dataset version (with the search index) instead of on every rerun
+    return load_search_index(df_pres, df_herb).options['prescription']
+
+def jump_to(kind, name):
+    """Search result callback: opens the page showing `name` (runs before the widgets are created)."""
+    if kind == 'prescription':
+        st.session_state["nav"] = "Mechanism Analysis"
+        st.session_state["mech_pres"] = name
+    else:
+        st.session_state["nav"] = "Reverse Lookup"
+        st.session_state["rev_kind"] = next(label for label, k in REVERSE_KINDS.items() if k == kind)
+        st.session_state["rev_query"] = name
+        st.session_state[f"rev_feature_{kind}"] = name
+
+@perf.timed()
+def render_search(df_pres, df_herb):
+    query = st.sidebar.text_input("🔎 Search", key="search_query",
+                                  placeholder="처방 · 약재 · 성분 · 타겟 (e.g. 쌍화, ssanghwa, TNF)")
+    if not query:
+        return
+    results = load_search_index(df_pres, df_herb).search(query, limit=8)
+    if results.empty:
+        st.sidebar.caption(f"No match for '{query}'.")
+        return
+    for i, (kind, name) in enumerate(zip(results['Kind'], results['Name'])):
+        st.sidebar.button(f"{SEARCH_ICONS[kind]} {name}", key=f"search_hit_{i}", help=kind.capitalize(),
+                          on_click=jump_to, args=(kind, name))
+
+def render_data_status(status, version):
+    if status['as_of']:
+        st.sidebar.caption(f"📅 Data as of {datetime.fromtimestamp(status['as_of']):%Y-%m-%d %H:%M}")
+    if status['refreshing']:
+        st.sidebar.caption("🔄 Refreshing in the background - the current data stays available.")
+    elif status['failures']:
+        st.sidebar.caption(f"⚠️ Last refresh failed ({status['last_error']}); "
+                           f"retrying in {status['retry_in'] / 60:.0f} min. Showing the last good data.")
+
+    # Show the change summary once per session, when it first sees a refreshed version
+    seen = st.session_state.get("seen_version")
+    st.session_state["seen_version"] = version
+    summary = status['last_summary']
+    if summary and summary.get('failed_tabs'):
+        st.sidebar.warning("Some tabs failed to refresh and were kept from the previous snapshot: "
+                           + ", ".join(f"{name} ({e})" for name, e in summary['failed_tabs'].items()))
+    if summary and summary.get('stored_version'):
+        st.sidebar.caption(f"📌 Pinned to version {summary['pinned']}; "
+                           f"the latest sheet was stored as {summary['stored_version']}.")
+    if summary and seen is not None and seen != version and summary.get('new_version') == version:
+        render_refresh_summary(summary)
+
+def render_refresh_summary(summary):
+    st.sidebar.success(
+        f"Data updated: {summary['prescriptions_affected']} formulas affected "
+        f"(+{summary['prescriptions_added']} / -{summary['prescriptions_removed']} / "
+        f"~{summary['prescriptions_changed']}), {summary['herbs_changed'] + summary['herbs_added'] + summary['herbs_removed']} herbs changed"
+    )
+    if summary.get('malformed_rows'):
+        st.sidebar.warning("Malformed sheet rows skipped: "
+                           + ", ".join(f"{name} {count}" for name, count in summary['malformed_rows'].items()))
+    with st.sidebar.expander("Refresh details"):
+        if 'cache_kept' in summary:
+            st.caption(f"Cached results kept: {summary['cache_kept']}, rebuilt on demand: {summary['cache_dropped']}")
+        if 'neighbor_tables_carried' in summary:
+            st.caption(f"Similarity tables carried over: {summary['neighbor_tables_carried']}, "
+                       f"rows rescored: {summary['neighbor_rows_rescored']}")
+        timings = pd.DataFrame({
+            'Step': list(summary['timings']),
+            'ms': [round(t * 1000, 1) for t in summary['timings'].values()],
+        })
+        st.dataframe(timings, use_container_width=True, hide_index=True)
+
+def render_perf_panel(run):
+    with st.sidebar.expander("⏱ Performance", expanded=True):
+        if run is None:
+            return
+        st.metric("Rerun", f"{run.total_s * 1000:.0f} ms")
+        st.dataframe(perf.spans_frame(run), use_container_width=True, hide_index=True)
+        stats = shared_cache().stats()
+        st.caption(f"Result cache: {stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB, "
+                   f"hit rate {stats['hit_rate']:.0%}")
+        if perf.LOG_PATH:
+            st.caption(f"Logged to {perf.LOG_PATH}")
+
+
+def render_lod_controls(analyzer, target_pres, node_budget):
+    """Drill-down buttons for the "Other" buckets of the deep Sankey. Returns the drill path."""
+    # The path only applies to the prescription and budget it was built for
+    state = st.session_state.get("lod_drill")
+    drill = state[2] if state and state[:2] == (target_pres, node_budget) else ()
+    buckets = analyzer.get_single_lod_buckets(target_pres, node_budget=node_budget, drill=drill)
+    if not buckets and not drill:
+        return ()
+
+    cols = st.columns(len(buckets) + 1)
+    for col, (layer, members) in zip(cols, buckets.items()):
+        if col.button(f"🔍 Expand Other {SINGLE_NODE_TYPES[layer]}s ({len(members)})", key=f"lod_{layer}"):
+            drill = drill + (layer,)
+    if drill and cols[-1].button("↩ Back", key="lod_back"):
+        drill = drill[:-1]
+    if (target_pres, node_budget, drill) != state:
+        st.session_state["lod_drill"] = (target_pres, node_budget, drill)
+        if state is not None and state[:2] == (target_pres, node_budget):
+            st.rerun()
+    return drill
+
+
+@perf.timed()
+def render_mechanism_page(df_pres, df_herb, sankey_mode='condensed', index=None):
     st.title("🔬 Deep Mechanism Analysis")
     st.info("이 페이지는 선택된 처방의 [약재 -> 성분 -> 타켓 단백질 -> 핵심작용]으로 이어지는 생물학적 기전을 시각화합니다.")
 
 
     # Selector
     if not df_pres.empty:
-        pres_col = df_pres.columns[0]
-        presoptions = sorted(df_pres[pres_col].unique().tolist())
+        presoptions = prescription_options(df_pres, df_herb)
         
         target_pres = st.sidebar.selectbox("Select Prescription", presoptions, key="mech_pres")
 
         if target_pres:
-            analyzer = PrescriptionAnalyzer(df_pres, df_herb, target_pres, target_pres)
+            analyzer = PrescriptionAnalyzer(df_pres, df_herb, target_pres, target_pres, index=index, cache=shared_cache())
             st.header(f"Prescription Mechanism: {target_pres}")
             
             # Visualization Options
@@ -33,19 +164,29 @@ def render_mechanism_page(df_pres, df_herb, sankey_mode='condensed'):
                     help="연결성을 강조하려면 Sankey, 계층 구조와 비중을 강조하려면 Sunburst를 선택하세요."
                 )
 
+            node_budget = NODE_BUDGET
+            if sankey_mode == 'deep':
+                st.sidebar.divider()
+                node_budget = st.sidebar.slider(
+                    "Max Nodes", 30, 500, NODE_BUDGET, step=10,
+                    help="작은 성분/타겟/작용은 'Other (k items)' 노드로 묶입니다. 묶음은 버튼으로 펼칠 수 있습니다."
+                )
+
             # Visualization
             st.subheader(f"Mechanism Visualization ({viz_type})")
+            drill = ()
             if sankey_mode == 'deep':
                 st.caption("Flow: Prescription -> Herb -> Ingredient -> Target -> Core Action")
+                drill = render_lod_controls(analyzer, target_pres, node_budget)
             else:
                 st.caption("Flow: Prescription -> Herb -> Core Action (Summarized)")
                 
             if "Sunburst" in viz_type:
                 fig = analyzer.generate_sunburst(target_pres)
             else:
-                fig = analyzer.generate_single_sankey(target_pres, mode=sankey_mode)
+                fig = analyzer.generate_single_sankey(target_pres, mode=sankey_mode, node_budget=node_budget, drill=drill)
             
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart(fig)
 
             
             # Insights
@@ -56,7 +197,8 @@ def render_mechanism_page(df_pres, df_herb, sankey_mode='condensed'):
                 st.success(f"**Identified Core Actions ({len(active_loops)})**")
                 st.write(", ".join(sorted(active_loops)))
 
-def render_intuitive_comparison_page(df_pres, df_herb):
+@perf.timed()
+def render_intuitive_comparison_page(df_pres, df_herb, index=None):
     # Custom CSS for glassmorphism and card styling
     st.markdown("""
     <style>
@@ -95,8 +237,7 @@ def render_intuitive_comparison_page(df_pres, df_herb):
     st.info("이 페이지는 두 처방의 공통 성분과 독자적 성분, 그리고 핵심 효능의 분포를 직관적으로 비교합니다.")
 
     if not df_pres.empty:
-        pres_col = df_pres.columns[0]
-        presoptions = sorted(df_pres[pres_col].unique().tolist())
+        presoptions = prescription_options(df_pres, df_herb)
         
         c1, c2 = st.sidebar.columns(2)
         with c1:
@@ -105,7 +246,7 @@ def render_intuitive_comparison_page(df_pres, df_herb):
             pres_b = st.selectbox("Prescription B", presoptions, index=1 if len(presoptions)>1 else 0, key="int_b")
 
         if pres_a and pres_b:
-            analyzer = PrescriptionAnalyzer(df_pres, df_herb, pres_a, pres_b)
+            analyzer = PrescriptionAnalyzer(df_pres, df_herb, pres_a, pres_b, index=index, cache=shared_cache())
             profiles = analyzer.get_comparison_profiles()
             
             st.header(f"⚖️ {pres_a} vs {pres_b}")
@@ -175,7 +316,7 @@ def render_intuitive_comparison_page(df_pres, df_herb):
                     legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
                     margin=dict(l=20, r=20, t=50, b=100)
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                plotly_chart(fig)
                 
                 # Action Distribution (Donut Chart)
                 st.subheader("📊 Action Theme Distribution")
@@ -197,40 +338,60 @@ def render_intuitive_comparison_page(df_pres, df_herb):
                 with col_c1:
                     fig_a = px.pie(values=counts_a.values, names=counts_a.index, title=f"Action Themes: {pres_a}", hole=0.4)
                     fig_a.update_layout(height=400, showlegend=False)
-                    st.plotly_chart(fig_a, use_container_width=True)
+                    plotly_chart(fig_a)
                 with col_c2:
                     fig_b = px.pie(values=counts_b.values, names=counts_b.index, title=f"Action Themes: {pres_b}", hole=0.4)
                     fig_b.update_layout(height=400, showlegend=False)
-                    st.plotly_chart(fig_b, use_container_width=True)
+                    plotly_chart(fig_b)
             else:
                 st.warning("No functional mapping available for these prescriptions.")
 
 
-def render_inference_page(df_pres, df_herb, df_script):
+def select_inference_prescription(name):
+    """Symptom search callback: shows `name` on the Pathology Inference page."""
+    st.session_state["inf_pres"] = name
+
+
+def render_symptom_search(scripts, prescriptions):
+    query = st.sidebar.text_input("🩺 Symptom Search", key="symptom_query",
+                                  placeholder="증상 · 설명 (e.g. 두통, 오한)")
+    if not query:
+        return
+    results = scripts.search(query, limit=SYMPTOM_RESULTS).drop_duplicates('Prescription_Name')
+    if results.empty:
+        st.sidebar.caption(f"No clinical script mentions '{query}'.")
+        return
+    for i, (name, symptom) in enumerate(zip(results['Prescription_Name'], results['Symptom_Status'])):
+        # Scripts of prescriptions missing from Prescription_Input are listed but cannot be opened
+        st.sidebar.button(f"💊 {name}", key=f"symptom_hit_{i}", help=symptom,
+                          on_click=select_inference_prescription, args=(name,), disabled=name not in prescriptions)
+
+
+@perf.timed()
+def render_inference_page(df_pres, df_herb, df_script, index=None):
     st.title("🔍 Pathology Situation Inference")
     st.info("이 페이지는 선정된 처방의 약재와 그 타겟 단백질, 경로(Pathway) 및 작용(Action)을 분석하여 어떠한 병리적 상황을 해결하려 하는지 유추합니다.")
     
     if not df_pres.empty:
-        pres_col = df_pres.columns[0]
-        presoptions = sorted(df_pres[pres_col].unique().tolist())
+        presoptions = prescription_options(df_pres, df_herb)
+        scripts = load_script_index(df_pres, df_herb, df_script)
+        render_symptom_search(scripts, set(presoptions))
         
-        target_pres = st.sidebar.selectbox("Select Prescription", presoptions)
+        target_pres = st.sidebar.selectbox("Select Prescription", presoptions, key="inf_pres")
         
         if target_pres:
-            # Display Clinical Script if available
-            if df_script is not None and not df_script.empty:
-                relevant_script = df_script[df_script['Prescription_Name'] == target_pres]
-                if not relevant_script.empty:
-                    st.subheader("📋 Clinical Context (Traditional Indications)")
-                    st.info("이 처방이 전통적으로 어떤 증상을 해결하기 위해 사용되는지 설명합니다.")
-                    for _, row in relevant_script.iterrows():
-                        with st.expander(f"📌 {row['Symptom_Status']}"):
-                            st.write(row['Explanation'])
-                    st.divider()
+            # Display Clinical Script if available (indexed once per dataset version, matched by normalized name)
+            relevant_script = scripts.lookup(target_pres)
+            if not relevant_script.empty:
+                st.subheader("📋 Clinical Context (Traditional Indications)")
+                st.info("이 처방이 전통적으로 어떤 증상을 해결하기 위해 사용되는지 설명합니다.")
+                for symptom, explanation in zip(relevant_script['Symptom_Status'], relevant_script['Explanation']):
+                    with st.expander(f"📌 {symptom}"):
+                        st.write(explanation)
+                st.divider()
 
             # We can use PrescriptionAnalyzer with dummy values for B
-            analyzer = PrescriptionAnalyzer(df_pres, df_herb, target_pres, target_pres)
-            df_inf = analyzer.get_inference_data(target_pres)
+            analyzer = PrescriptionAnalyzer(df_pres, df_herb, target_pres, target_pres, index=index, cache=shared_cache())
             
             st.header(f"Prescription: {target_pres}")
             
@@ -238,49 +399,280 @@ def render_inference_page(df_pres, df_herb, df_script):
             st.subheader("💡 Key Pathological Themes")
             st.info("이 처방이 집중하고 있는 주요 병리적 통제 포인트입니다.")
             
-            # Group by Core Action to show common themes
-            pathway_summary = df_inf.groupby([analyzer.col_herb_loop]).size().reset_index(name='Target_Interaction_Count')
-            pathway_summary = pathway_summary.sort_values(by='Target_Interaction_Count', ascending=False)
-            
-            # Show top themes as tags
-            top_themes = pathway_summary.head(10)
-            theme_html = "".join([f'<span style="background-color: #f0f2f6; color: #1f77b4; padding: 5px 10px; border-radius: 15px; margin: 5px; display: inline-block; font-weight: bold; border: 1px solid #1f77b4;">#{row[analyzer.col_herb_loop]} ({row["Target_Interaction_Count"]})</span>' for _, row in top_themes.iterrows()])
+            # Core Actions ranked by enrichment against the whole library, not by raw row counts
+            engine = load_enrichment_engine(df_pres, df_herb)
+            actions = engine.enrich(target_pres, 'action')
+            top_themes, enriched = key_themes(actions)
+            if not enriched:
+                st.caption(f"No Core Action is enriched at FDR < {ENRICHMENT_FDR:.0%}; the most specific ones are shown.")
+            theme_html = "".join([f'<span style="background-color: #f0f2f6; color: #1f77b4; padding: 5px 10px; border-radius: 15px; margin: 5px; display: inline-block; font-weight: bold; border: 1px solid #1f77b4;">#{action} (×{fold:.1f}, q={q:.2g})</span>' for action, fold, q in zip(top_themes[analyzer.col_herb_loop], top_themes['Weighted_Fold'], top_themes['Q_Value'])])
             st.markdown(theme_html, unsafe_allow_html=True)
+            with st.expander("📊 Enrichment statistics"):
+                st.caption("Overlap는 처방이 도달한 타겟(성분) 중 해당 작용(타겟)에 연결된 수, Q_Value는 Benjamini-Hochberg 보정 p-value, "
+                           "Weighted_Fold는 용량 가중 비중을 라이브러리 평균 약재의 비중과 비교한 배수입니다.")
+                tab_action, tab_target = st.tabs(["Core Action", "Target Protein"])
+                number_format = {c: st.column_config.NumberColumn(format="%.3g") for c in
+                                 ['Expected', 'Fold', 'Weighted_Share', 'Weighted_Fold', 'P_Value', 'Q_Value']}
+                tab_action.dataframe(actions, use_container_width=True, hide_index=True, column_config=number_format)
+                tab_target.dataframe(engine.enrich(target_pres, 'target'), use_container_width=True, hide_index=True,
+                                     column_config=number_format)
             st.divider()
             
             # 2. Detailed View
             st.subheader("🧪 Detailed Mechanism Evidence")
             st.caption("각 약재가 어떤 성분을 통해 어떤 단백질을 조절하여 핵심작용을 수행하는지 상세 데이터를 제공합니다.")
             
-            # Group by Herb for better readability
-            herbs = sorted(df_inf['Herb_Name'].unique())
-            for herb in herbs:
-                with st.expander(f"🌿 Herb: {herb}"):
-                    herb_data = df_inf[df_inf['Herb_Name'] == herb]
-                    # Show unique combinations of Compound, Target, Action
-                    display_cols = ['Compound_Name', 'Target_Protein', analyzer.col_herb_loop, analyzer.col_herb_desc]
-                    # Keep only existing columns
-                    existing_cols = [c for c in display_cols if c in herb_data.columns]
-                    st.dataframe(herb_data[existing_cols].drop_duplicates(), use_container_width=True, hide_index=True)
+            # Evidence grouped once per prescription; only the selected herb's current page is sent to the browser
+            evidence, ranges = analyzer.get_inference_evidence(target_pres)
+            if not ranges:
+                st.caption("No mechanism evidence for this prescription.")
+                return
+            herb = st.selectbox("🌿 Herb", list(ranges), key="evidence_herb",
+                                format_func=lambda h: f"{h} ({ranges[h][1] - ranges[h][0]} rows)")
+            start, stop = ranges[herb]
+            n_pages = -(-(stop - start) // EVIDENCE_PAGE_SIZE)
+            if n_pages > 1:
+                page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1,
+                                       key=f"evidence_page_{herb}")
+                start += (page - 1) * EVIDENCE_PAGE_SIZE
+            st.dataframe(evidence.iloc[start:min(start + EVIDENCE_PAGE_SIZE, stop), 1:],
+                         use_container_width=True, hide_index=True)
+
+
+@perf.timed()
+def render_paths_page(df_pres, df_herb):
+    st.title("🧭 Mechanism Paths")
+    st.info("이 페이지는 처방 또는 약재가 어떤 성분과 타겟 단백질을 거쳐 특정 핵심작용(또는 타겟)에 도달하는지, 용량 가중 흐름이 큰 경로 순으로 보여줍니다.")
+
+    if not df_pres.empty:
+        engine = load_path_engine(df_pres, df_herb)
+
+        source_label = st.sidebar.radio("From", ["Prescription", "Herb"], index=0, key="path_from")
+        kind = source_label.lower()
+        if kind == 'prescription':
+            options = prescription_options(df_pres, df_herb)
+        else:
+            options = load_search_index(df_pres, df_herb).options['herb']
+        source = st.sidebar.selectbox(source_label, options, key=f"path_source_{kind}")
+
+        dest_label = st.sidebar.radio("To", list(PATH_TARGETS), index=0, key="path_to")
+        dest_kind = PATH_TARGETS[dest_label]
+        if not source:
+            return
+        reached = engine.reached(kind, source, dest_kind)
+        if reached.empty:
+            st.warning(f"{source} does not reach any {dest_label}.")
+            return
+        # Ranked by the flow reaching them, largest first
+        dest = st.sidebar.selectbox(f"{dest_label} (by flow)", reached['Name'].tolist(), key=f"path_dest_{dest_kind}")
+        k = st.sidebar.slider("Number of Paths", 3, 50, 10, key="path_k")
+
+        paths = engine.top_paths(kind, source, dest_kind, dest, k=k + PATH_CONTEXT)
+        top = paths.head(k)
+
+        st.header(f"{source} → {dest}")
+        c1, c2 = st.columns(2)
+        c1.metric("Flow reaching the target", f"{reached.set_index('Name')['Flow'][dest]:.3g}")
+        c2.metric(f"Share of the top {len(top)} paths", f"{top['Share'].sum():.0%}")
+        st.caption("흐름(Flow)은 약재 용량을 각 단계의 근거 행(evidence rows) 비율로 나누어 전달한 값입니다. "
+                   "붉은 링크가 상위 경로, 회색은 그 다음 경로들입니다.")
+        plotly_chart(generate_path_sankey(paths, k, title=f"Top {len(top)} paths: {source} → {dest}"))
+        st.dataframe(top, use_container_width=True, hide_index=True,
+                     column_config={"Share": st.column_config.NumberColumn(format="%.3f")})
+
+
+@perf.timed()
+def render_similarity_page(df_pres, df_herb):
+    st.title("🧬 Similar Formulas")
+    st.info("이 페이지는 약재 구성 또는 성분·타겟·핵심작용 수준의 유사도를 기준으로 선택한 처방과 가장 비슷한 처방들을 찾아줍니다.")
+
+    if not df_pres.empty:
+        presoptions = prescription_options(df_pres, df_herb)
+
+        target_pres = st.sidebar.selectbox("Select Prescription", presoptions, key="sim_pres")
+
+        layer_labels = {"Herb": "herb", "Compound": "compound", "Target": "target", "Core Action": "action"}
+        metric_labels = {"Jaccard (overlap)": "jaccard", "Cosine (overlap)": "cosine", "Amount-weighted": "amount"}
+        layer = st.sidebar.radio("Compare by", list(layer_labels), index=0, key="sim_layer")
+        metric = st.sidebar.radio(
+            "Similarity Metric",
+            list(metric_labels),
+            index=0,
+            key="sim_metric",
+            help="Jaccard/Cosine은 공통 항목의 비율, Amount-weighted는 약재 용량으로 가중한 구성의 유사도입니다."
+        )
+        k = st.sidebar.slider("Number of Similar Formulas", 5, 50, 10, key="sim_k")
+
+        if target_pres:
+            engine = load_similarity_engine(df_pres, df_herb)
+            neighbors = engine.neighbors(target_pres, layer=layer_labels[layer], metric=metric_labels[metric], k=k)
+
+            st.header(f"Formulas similar to {target_pres}")
+            st.caption(f"Similarity by {layer} ({metric}) — Shared = number of common {layer.lower()} items")
+
+            if neighbors.empty:
+                st.warning("No similar formulas found.")
+                return
+
+            import plotly.express as px
+            fig = px.bar(
+                neighbors.iloc[::-1],
+                x="Similarity",
+                y="Prescription_Name",
+                orientation="h",
+                hover_data={"Shared": True, "Similarity": ":.3f"},
+                color="Similarity",
+                color_continuous_scale="Purples"
+            )
+            fig.update_layout(
+                height=max(300, 30 * len(neighbors)),
+                yaxis_title=None,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                margin=dict(l=20, r=20, t=20, b=20)
+            )
+            plotly_chart(fig)
+            st.dataframe(neighbors, use_container_width=True, hide_index=True)
+
+
+@perf.timed()
+def render_reverse_lookup_page(df_pres, df_herb):
+    st.title("🎯 Reverse Lookup")
+    st.info("이 페이지는 특정 타겟 단백질, 핵심작용 또는 성분에 도달하는 처방과 약재를 약재 용량 기여도 순으로 찾아줍니다.")
+
+    if not df_pres.empty:
+        reverse = load_reverse_index(df_pres, df_herb)
+
+        kind_label = st.sidebar.radio("Look up by", list(REVERSE_KINDS), index=0, key="rev_kind")
+        kind = REVERSE_KINDS[kind_label]
+        query = st.sidebar.text_input(f"Search {kind_label}", key="rev_query", placeholder="e.g. TNF")
+
+        matches = reverse.match(kind, query)
+        if not matches:
+            st.warning(f"No {kind_label} matches '{query}'.")
+            return
+        all_option = f"All matches ({len(matches)})"
+        options = ([all_option] if query and len(matches) > 1 else []) + matches[:500]
+        selected = st.sidebar.selectbox(kind_label, options, key=f"rev_feature_{kind}")
+        features = matches if selected == all_option else [selected]
+
+        prescriptions, herbs = reverse.lookup(kind, features)
+
+        st.header(f"{kind_label}: {selected}")
+        c1, c2 = st.columns(2)
+        c1.metric("Formulas", len(prescriptions))
+        c2.metric("Herbs", len(herbs))
+
+        if prescriptions.empty:
+            st.warning("No prescription reaches this item.")
+            return
+
+        st.subheader("📋 Formulas ranked by contributing herb mass")
+        st.caption("Contribution은 해당 항목에 도달하는 약재들의 용량 합, Share는 처방 전체 용량 중 그 비율입니다.")
+
+        import plotly.express as px
+        top = prescriptions.head(20).iloc[::-1]
+        fig = px.bar(
+            top,
+            x="Contribution",
+            y="Prescription_Name",
+            orientation="h",
+            hover_data={"Share": ":.0%", "Herbs": True},
+            color="Share",
+            color_continuous_scale="Blues"
+        )
+        fig.update_layout(
+            height=max(300, 28 * len(top)),
+            yaxis_title=None,
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            margin=dict(l=20, r=20, t=20, b=20)
+        )
+        plotly_chart(fig)
+        st.dataframe(prescriptions, use_container_width=True, hide_index=True,
+                     column_config={"Share": st.column_config.NumberColumn(format="%.2f")})
+
+        st.subheader("🌿 Herbs reaching this item")
+        st.dataframe(herbs, use_container_width=True, hide_index=True)
+
+
+@perf.timed()
+def render_multi_comparison_page(df_pres, df_herb, index=None):
+    st.title("🧩 Multi-Formula Comparison")
+    st.info("이 페이지는 여러 처방(2~20개)이 공유하는 약재·성분·타겟·핵심작용과 각 처방에만 있는 항목을 한눈에 비교합니다.")
+
+    if not df_pres.empty:
+        presoptions = prescription_options(df_pres, df_herb)
+
+        selected = st.sidebar.multiselect("Prescriptions", presoptions, default=presoptions[:3],
+                                          max_selections=20, key="multi_pres")
+        layer_labels = {"Herb": "herb", "Compound": "compound", "Target": "target", "Core Action": "action"}
+        layer_label = st.sidebar.radio("Overlap by", list(layer_labels), index=0, key="multi_layer")
+        layer = layer_labels[layer_label]
+
+        if len(selected) < 2:
+            st.warning("Select at least two prescriptions.")
+            return
+
+        pres_names = tuple(selected)
+        analyzer = PrescriptionAnalyzer(df_pres, df_herb, pres_names[0], pres_names[1], index=index,
+                                        cache=shared_cache())
+        regions = analyzer.get_overlap_regions(pres_names, layer)
+        shared = regions[regions['Degree'] == len(pres_names)]
+        exclusive = regions[regions['Degree'] == 1]
+
+        st.header(f"⚖️ {len(pres_names)} Formulas")
+        c1, c2, c3 = st.columns(3)
+        c1.metric(f"Shared by all ({layer_label})", int(shared['Count'].sum()))
+        c2.metric("Exclusive to one", int(exclusive['Count'].sum()))
+        c3.metric("Overlap regions", len(regions))
+
+        st.subheader("📊 Overlap Regions (UpSet)")
+        st.caption("위쪽 막대는 각 영역(정확히 표시된 처방들만 공유하는 항목)의 크기, 왼쪽 막대는 처방별 전체 항목 수입니다.")
+        plotly_chart(analyzer.generate_upset(pres_names, layer))
+
+        st.subheader("🌊 Mechanism Flow")
+        st.caption("보라색은 모든 처방이 공유, 처방 색은 해당 처방에만 있는 항목, 회색은 일부 처방이 공유하는 항목입니다.")
+        plotly_chart(analyzer.generate_multi_sankey(pres_names))
+
+        with st.expander("📋 Overlap region table"):
+            table = regions.drop(columns=['Mask']).assign(
+                Members=[" ∩ ".join(m) for m in regions['Members']],
+                Items=[", ".join(items) for items in regions['Items']],
+            )
+            st.dataframe(table, use_container_width=True, hide_index=True)
 
 
 def main():
     # --- App Loading ---
     st.sidebar.header("Navigation")
-    page = st.sidebar.radio("Go to", ["Mechanism Analysis", "Intuitive Comparison", "Pathology Inference"])
+    page = st.sidebar.radio("Go to", PAGES, key="nav")
+    show_perf = st.sidebar.toggle("⏱ Show Performance", key="perf_panel",
+                                  help="이번 화면 갱신(rerun)에서 데이터 로딩·분석·차트 생성에 걸린 시간을 보여줍니다.")
+    perf.start_run(enabled=show_perf, page=page)
     
-    # Reload Button
-    if st.sidebar.button("🔄 Real-time Data Refresh"):
-        st.cache_data.clear()
-        st.rerun()
+    # Shared dataset: served immediately, refreshed by one background worker for all sessions.
+    # Only what the new data touches is rebuilt, other users keep their warm caches.
+    store = dataset_store()
+    if st.sidebar.button("🔄 Real-time Data Refresh", disabled=OFFLINE):
+        if not store.request_refresh(force=True):
+            st.sidebar.info("A refresh is already running.")
     
     # Load Data
-    with st.spinner("Loading data..."):
-        df_pres, df_herb, df_script = load_data()
+    with st.spinner("Loading data..."), perf.span("load_data") as s:
+        frames, as_of = store.get()
+        if frames is not None:
+            s.note(rows=len(frames[0]), library_rows=len(frames[1]))
     
-    if df_pres.empty:
+    if frames is None or frames[0].empty:
         st.error("Failed to load data. Please check the Google Sheet connection.")
         st.stop()
+    df_pres, df_herb, df_script = frames
+    render_data_status(store.status(), dataset_version(df_pres))
+    render_search(df_pres, df_herb)
+
+    # Integer-ID mechanism index, built once per dataset version and shared by all sessions
+    index = load_mechanism_index(df_pres, df_herb)
     
     view_mode = "Condensed (Herb-Action)"
     if page == "Mechanism Analysis":
@@ -296,11 +688,23 @@ def main():
     sankey_mode = 'deep' if "Detailed" in view_mode else 'condensed'
     
     if page == "Mechanism Analysis":
-        render_mechanism_page(df_pres, df_herb, sankey_mode)
+        render_mechanism_page(df_pres, df_herb, sankey_mode, index=index)
     elif page == "Intuitive Comparison":
-        render_intuitive_comparison_page(df_pres, df_herb)
+        render_intuitive_comparison_page(df_pres, df_herb, index=index)
+    elif page == "Multi-Formula Comparison":
+        render_multi_comparison_page(df_pres, df_herb, index=index)
+    elif page == "Mechanism Paths":
+        render_paths_page(df_pres, df_herb)
+    elif page == "Similar Formulas":
+        render_similarity_page(df_pres, df_herb)
+    elif page == "Reverse Lookup":
+        render_reverse_lookup_page(df_pres, df_herb)
     else:
-        render_inference_page(df_pres, df_herb, df_script)
+        render_inference_page(df_pres, df_herb, df_script, index=index)
+
+    run = perf.finish_run()
+    if show_perf:
+        render_perf_panel(run)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""
+Benchmark suite: times preprocessing, index construction, every PrescriptionAnalyzer method and
+every figure generator on a seeded synthetic dataset, and writes the results as JSON.
+
+    python bench.py [--prescriptions 10000] [--herbs 2000] [--library-rows 1000000] [--repeat 3]
+                    [--output bench.json] [--compare previous.json]
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from analysis import PrescriptionAnalyzer
+from data_loader import preprocess_data
+from mechanism_index import MechanismIndex
+from multi_compare import MultiComparison
+from path_query import PathEngine, generate_path_sankey
+from reverse_index import ReverseIndex
+from similarity import SimilarityEngine
+from synthetic import generate_dataset
+
+
+def time_call(fn, repeat):
+    """Runs `fn` `repeat` times; returns (seconds per run, last result)."""
+    runs, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+
+# Prescriptions in the N-way comparison cases (the Multi-Formula Comparison page takes 2-20)
+MULTI_N = 8
+
+
+def _by_size(df_pres):
+    sizes = df_pres.groupby('Prescription_Name', observed=True).size().sort_values(ascending=False, kind='stable')
+    return sizes.index.astype(object).tolist()
+
+
+def pick_prescriptions(df_pres):
+    """The two prescriptions with the most herbs (the heaviest comparison) and the median-sized one."""
+    names = _by_size(df_pres)
+    return names[0], names[1], names[len(names) // 2]
+
+
+def run_suite(frames, repeat=3, pres_a=None, pres_b=None):
+    """
+    Times every stage on raw sheet frames. Returns a list of result dicts
+    (name, group, runs, best_s, median_s, plus a size note where useful).
+    """
+    results = []
+
+    def record(name, group, fn, note=None, repeat=repeat):
+        runs, value = time_call(fn, repeat)
+        entry = {'name': name, 'group': group, 'runs': runs,
+                 'best_s': min(runs), 'median_s': statistics.median(runs)}
+        if note is not None:
+            entry.update(note(value))
+        results.append(entry)
+        print(f"  {group:>10} {name:<40} best {entry['best_s'] * 1000:10.1f} ms", file=sys.stderr)
+        return value
+
+    df_pres, df_herb, df_script = frames
+    df_pres, df_herb, df_script = record(
+        'preprocess_data', 'preprocess',
+        lambda: preprocess_data(df_pres.copy(), df_herb.copy(), df_script.copy()),
+        note=lambda out: {'rows': {'Prescription_Input': len(out[0]), 'Herb_Library': len(out[1])}},
+    )
+
+    index = record('MechanismIndex', 'index', lambda: MechanismIndex(df_pres, df_herb))
+    record('ReverseIndex', 'index', lambda: ReverseIndex(index))
+    record('SimilarityEngine', 'index', lambda: SimilarityEngine(index), repeat=1)
+    paths = record('PathEngine', 'index', lambda: PathEngine(index))
+
+    heavy_a, heavy_b, median = pick_prescriptions(df_pres)
+    pres_a = pres_a or heavy_a
+    pres_b = pres_b or heavy_b
+    # No result cache: every call recomputes
+    analyzer = PrescriptionAnalyzer(df_pres, df_herb, pres_a, pres_b, index=index)
+
+    def rows_note(df):
+        return {'result_rows': len(df)}
+
+    def links_note(out):
+        return {'nodes': len(out[0]['label'] if isinstance(out[0], dict) else out[0]),
+                'links': len(out[1]['value'] if isinstance(out[1], dict) else out[1])}
+
+    record('get_filtered_data', 'analyzer', analyzer.get_filtered_data, rows_note)
+    record('get_sankey_data', 'analyzer', analyzer.get_sankey_data, links_note)
+    record('get_structure', 'analyzer', analyzer.get_structure, links_note)
+    record('get_common_insights', 'analyzer', analyzer.get_common_insights)
+    record('get_comparison_profiles', 'analyzer', analyzer.get_comparison_profiles)
+    record('generate_sankey', 'figure', analyzer.generate_sankey)
+
+    for label, target in [('heavy', pres_a), ('median', median)]:
+        record(f'get_inference_data[{label}]', 'analyzer', lambda: analyzer.get_inference_data(target), rows_note)
+        for mode in ['deep', 'condensed']:
+            record(f'get_single_sankey_data[{label},{mode}]', 'analyzer',
+                   lambda: analyzer.get_single_sankey_data(target, mode), links_note)
+            record(f'get_single_structure[{label},{mode}]', 'analyzer',
+                   lambda: analyzer.get_single_structure(target, mode), links_note)
+            record(f'generate_single_sankey[{label},{mode}]', 'figure',
+                   lambda: analyzer.generate_single_sankey(target, mode))
+        record(f'generate_sunburst[{label}]', 'figure', lambda: analyzer.generate_sunburst(target))
+
+        # Level of detail: the folded buckets, and the deep Sankey drilled into the largest layer's bucket
+        record(f'get_flow[{label}]', 'analyzer', lambda: analyzer.get_flow(target),
+               lambda out: {'paths': len(out['amount'])})
+        buckets = record(f'get_single_lod_buckets[{label}]', 'analyzer',
+                         lambda: analyzer.get_single_lod_buckets(target),
+                         lambda out: {'folded': sum(len(v) for v in out.values())})
+        if any(buckets.values()):
+            drill = (max(buckets, key=lambda layer: len(buckets[layer])),)
+            record(f'get_single_sankey_data[{label},deep,drill]', 'analyzer',
+                   lambda: analyzer.get_single_sankey_data(target, 'deep', drill=drill), links_note)
+
+        # Mechanism paths to the action the prescription sends the most flow to
+        reached = record(f'PathEngine.reached[{label}]', 'paths', lambda: paths.reached('prescription', target),
+                         rows_note)
+        if not reached.empty:
+            dest = reached['Name'].iloc[0]
+            top = record(f'PathEngine.top_paths[{label}]', 'paths',
+                         lambda: paths.top_paths('prescription', target, 'action', dest, k=30), rows_note)
+            record(f'generate_path_sankey[{label}]', 'figure', lambda: generate_path_sankey(top, 10))
+
+    # N-way comparison of the heaviest prescriptions
+    group = _by_size(df_pres)[:MULTI_N]
+    record(f'MultiComparison[{len(group)}]', 'multi', lambda: MultiComparison(index, group))
+    for layer in ['herb', 'action']:
+        record(f'get_overlap_regions[{len(group)},{layer}]', 'multi',
+               lambda: analyzer.get_overlap_regions(group, layer), rows_note)
+        record(f'generate_upset[{len(group)},{layer}]', 'figure', lambda: analyzer.generate_upset(group, layer))
+    record(f'get_multi_sankey_data[{len(group)}]', 'multi', lambda: analyzer.get_multi_sankey_data(group),
+           links_note)
+    record(f'generate_multi_sankey[{len(group)}]', 'figure', lambda: analyzer.generate_multi_sankey(group))
+    return results
+
+
+def compare(results, previous):
+    """Prints best-time ratios against an earlier JSON report (ratio > 1 means faster now)."""
+    before = {r['name']: r['best_s'] for r in previous['results']}
+    print(f"{'benchmark':<48} {'before ms':>11} {'now ms':>11} {'speedup':>8}", file=sys.stderr)
+    for r in results:
+        if r['name'] in before:
+            old, new = before[r['name']], r['best_s']
+            print(f"{r['name']:<48} {old * 1000:11.1f} {new * 1000:11.1f} {old / new if new else float('inf'):8.2f}",
+                  file=sys.stderr)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prescriptions', type=int, default=10_000)
+    parser.add_argument('--herbs', type=int, default=2_000)
+    parser.add_argument('--library-rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--pres-a')
+    parser.add_argument('--pres-b')
+    parser.add_argument('--output', help="JSON report path (default: stdout)")
+    parser.add_argument('--compare', help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    params = {'prescriptions': args.prescriptions, 'herbs': args.herbs,
+              'library_rows': args.library_rows, 'seed': args.seed, 'repeat': args.repeat}
+    print(f"generating dataset {params}", file=sys.stderr)
+    frames = generate_dataset(args.prescriptions, args.herbs, args.library_rows, seed=args.seed)
+    results = run_suite(frames, args.repeat, args.pres_a, args.pres_b)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'params': params,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: vectorized Sankey construction vs the previous groupby + iterrows implementation.
+
+    python bench_sankey.py [--herbs 40] [--rows-per-herb 400] [--repeat 5]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from analysis import PrescriptionAnalyzer
+
+
+def make_data(n_herbs, rows_per_herb, seed=0):
+    rng = np.random.default_rng(seed)
+    herbs = [f"Herb_{i}" for i in range(n_herbs)]
+    df_pres = pd.DataFrame({
+        'Prescription_Name': 'Big Formula',
+        'Herb_Name': herbs,
+        'Amount': rng.integers(2, 20, n_herbs).astype(float),
+    })
+    n = n_herbs * rows_per_herb
+    df_herb = pd.DataFrame({
+        'Herb_Name': np.repeat(herbs, rows_per_herb),
+        'Compound_Name': [f"Compound_{i}" for i in rng.integers(0, n // 4, n)],
+        'Target_Protein': [f"Target_{i}" for i in rng.integers(0, n // 8, n)],
+        'Core_Action': [f"Action_{i}" for i in rng.integers(0, 60, n)],
+        'KM_Efficacy': 'efficacy',
+    })
+    return df_pres, df_herb
+
+
+def legacy_single_structure(df, target_pres, mode='deep'):
+    """The previous implementation: per-layer groupby, then one Python dict per link via iterrows()."""
+    nodes = [{'label': target_pres, 'color': '#2E2E2E', 'type': 'Prescription'}]
+    node_map = {('Prescription', target_pres): 0}
+
+    def add_layer_nodes(items, n_type, color):
+        start_idx = len(nodes)
+        for i, item in enumerate(sorted(set(items.dropna()))):
+            nodes.append({'label': item, 'color': color, 'type': n_type})
+            node_map[(n_type, item)] = start_idx + i
+
+    add_layer_nodes(df['Herb_Name'], 'Herb', '#2ECC71')
+    if mode == 'deep':
+        add_layer_nodes(df['Compound_Name'], 'Ingredient', '#F39C12')
+        add_layer_nodes(df['Target_Protein'], 'Target', '#E74C3C')
+    add_layer_nodes(df['Core_Action'], 'Action', '#9B59B6')
+
+    links = []
+    grp1 = df.groupby('Herb_Name', observed=True)['Amount'].sum().reset_index()
+    for _, row in grp1.iterrows():
+        src, tgt, val = target_pres, row['Herb_Name'], row['Amount']
+        if (('Prescription', src) in node_map) and (('Herb', tgt) in node_map) and val > 0:
+            links.append({'source': node_map[('Prescription', src)], 'target': node_map[('Herb', tgt)], 'value': val, 'color': 'rgba(46, 204, 113, 0.2)'})
+
+    if mode == 'deep':
+        for src_col, tgt_col, src_type, tgt_type, color in [
+            ('Herb_Name', 'Compound_Name', 'Herb', 'Ingredient', 'rgba(243, 156, 18, 0.1)'),
+            ('Compound_Name', 'Target_Protein', 'Ingredient', 'Target', 'rgba(231, 76, 60, 0.05)'),
+            ('Target_Protein', 'Core_Action', 'Target', 'Action', 'rgba(155, 89, 182, 0.1)'),
+        ]:
+            grp = df.groupby([src_col, tgt_col], observed=True)['Amount'].sum().reset_index()
+            for _, row in grp.iterrows():
+                src, tgt, val = row[src_col], row[tgt_col], row['Amount']
+                if ((src_type, src) in node_map) and ((tgt_type, tgt) in node_map) and val > 0:
+                    links.append({'source': node_map[(src_type, src)], 'target': node_map[(tgt_type, tgt)], 'value': val, 'color': color})
+    else:
+        grp = df.groupby(['Herb_Name', 'Core_Action'], observed=True)['Amount'].max().reset_index()
+        counts = df.groupby('Herb_Name', observed=True)['Core_Action'].nunique().to_dict()
+        for _, row in grp.iterrows():
+            h_name, a_name, h_amt = row['Herb_Name'], row['Core_Action'], row['Amount']
+            val = h_amt / counts.get(h_name, 1)
+            if (('Herb', h_name) in node_map) and (('Action', a_name) in node_map) and val > 0:
+                links.append({'source': node_map[('Herb', h_name)], 'target': node_map[('Action', a_name)], 'value': val, 'color': 'rgba(155, 89, 182, 0.4)'})
+    return nodes, links
+
+
+def legacy_figure(nodes, links):
+    return go.Figure(data=[go.Sankey(
+        node=dict(label=[n['label'] for n in nodes], color=[n['color'] for n in nodes]),
+        link=dict(source=[l['source'] for l in links], target=[l['target'] for l in links],
+                  value=[l['value'] for l in links], color=[l['color'] for l in links]),
+    )])
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--herbs', type=int, default=40)
+    parser.add_argument('--rows-per-herb', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df_pres, df_herb = make_data(args.herbs, args.rows_per_herb)
+    analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'Big Formula', 'Big Formula')
+    merged = analyzer.get_inference_data('Big Formula')
+    print(f"prescription: {args.herbs} herbs, {len(merged)} merged rows")
+
+    for mode in ['deep', 'condensed']:
+        nodes, links = analyzer.get_single_structure('Big Formula', mode)
+        legacy_nodes, legacy_links = legacy_single_structure(merged, 'Big Formula', mode)
+        assert len(nodes) == len(legacy_nodes) and len(links) == len(legacy_links)
+
+        t_legacy = best_of(lambda: legacy_single_structure(merged, 'Big Formula', mode), args.repeat)
+        t_new = best_of(lambda: analyzer.get_single_sankey_data('Big Formula', mode), args.repeat)
+        t_legacy_fig = best_of(lambda: legacy_figure(*legacy_single_structure(merged, 'Big Formula', mode)), args.repeat)
+        t_new_fig = best_of(lambda: analyzer.generate_single_sankey('Big Formula', mode), args.repeat)
+
+        print(f"[{mode}] {len(nodes)} nodes, {len(links)} links")
+        print(f"  structure: legacy {t_legacy * 1000:8.1f} ms | vectorized {t_new * 1000:8.1f} ms | x{t_legacy / t_new:.1f}")
+        print(f"  figure:    legacy {t_legacy_fig * 1000:8.1f} ms | vectorized {t_new_fig * 1000:8.1f} ms | x{t_legacy_fig / t_new_fig:.1f}")
+
+
+if __name__ == "__main__":
+    main()
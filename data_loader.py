@@ -1,95 +1,815 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
 import streamlit as st
 import pandas as pd
-import re
+import numpy as np
 import urllib.parse
+import urllib.request
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-@st.cache_data(ttl=3600)
-def load_data():
+import perf
+import snapshot
+from dataset_diff import DatasetDiff
+from dataset_store import DatasetStore
+from enrichment import EnrichmentEngine
+from mechanism_index import MechanismIndex
+from path_query import PathEngine
+from similarity import SimilarityEngine
+from reverse_index import ReverseIndex
+from search_index import SearchIndex
+from script_index import ScriptIndex
+from result_cache import INDEX_ID_RESULTS, key_values, shared_cache
+
+# Offline mode never touches the network: data comes only from the snapshot directory
+# (CI and air-gapped sites).
+OFFLINE = os.environ.get("HERB_OFFLINE", "") not in ("", "0", "false", "False")
+
+# Configuration
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1YS2w6eQfULCpSCccQ2jjxoCTs0gJYt78vdt22Q4vZBU"
+
+# Hardcoded GIDs to ensure robust connection without fragile scraping
+# Extracted from live sheet metadata
+GIDS = {
+    "Prescription_Input": "221744534",      # Correct GID from user
+    "Herb_Library": "1414851403",           # Confirmed (Integrated)
+    "Prescription_script": "1443852241"     # Clinical scripts
+}
+
+# Age (seconds) after which the shared dataset is refreshed in the background; 0 = only on request
+REFRESH_INTERVAL = float(os.environ.get("HERB_REFRESH_INTERVAL", "3600"))
+
+# Seconds between checks for a dataset version published by another server process
+POLL_INTERVAL = float(os.environ.get("HERB_POLL_INTERVAL", "5"))
+
+# Per-tab download deadline (seconds) and fetch pool size
+FETCH_TIMEOUT = 30
+FETCH_WORKERS = 3
+
+# Herb_Library is parsed and exploded while it downloads, in CSV blocks of this size
+INGEST_BLOCK_BYTES = 4 << 20
+
+# Column layout used when a tab is unavailable and no earlier snapshot exists
+EMPTY_COLUMNS = {
+    "Prescription_Input": ['Prescription_Name', 'Herb_Name', 'Amount'],
+    "Herb_Library": ['Herb_Name', 'Compound_Name', 'Target_Protein', 'Core_Action', 'KM_Efficacy'],
+    "Prescription_script": ['Prescription_Name', 'Symptom_Status', 'Explanation'],
+}
+
+
+def tag_version(frames, version):
+    """Attaches the dataset version to each frame so downstream caches can key on it."""
+    for df in frames:
+        if df is not None:
+            df.attrs["dataset_version"] = version
+    return frames
+
+
+def dataset_version(df):
+    return df.attrs.get("dataset_version") if df is not None else None
+
+
+@st.cache_resource(max_entries=2)
+def _build_mechanism_index(version, _df_pres, _df_herb):
+    # Memory-mapped from the snapshot when the frames are, so server processes share one copy
+    return snapshot.load_index(_df_pres, _df_herb)
+
+
+@perf.timed()
+def load_mechanism_index(df_pres, df_herb):
+    """Mechanism index shared by all sessions, built once per dataset version."""
+    version = dataset_version(df_pres)
+    if version is None:
+        return MechanismIndex(df_pres, df_herb)
+    return _build_mechanism_index(version, df_pres, df_herb)
+
+
+# Similarity engines currently held by the resource cache, by dataset version (reused on refresh)
+_similarity_engines = weakref.WeakValueDictionary()
+
+
+@st.cache_resource(max_entries=2)
+def _build_similarity_engine(version, _index, _previous=None, _affected=()):
+    engine = SimilarityEngine(_index)
+    if _previous is not None:
+        engine.carry_over(_previous, _affected)
+    _similarity_engines[version] = engine
+    # Neighbor tables for every option of the Similar Formulas page; queries score single rows until then
+    threading.Thread(target=engine.precompute, name="similarity-neighbors", daemon=True).start()
+    return engine
+
+
+@perf.timed()
+def load_similarity_engine(df_pres, df_herb):
+    """Prescription similarity matrices shared by all sessions, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return SimilarityEngine(index)
+    return _build_similarity_engine(version, index)
+
+
+@st.cache_resource(max_entries=2)
+def _build_reverse_index(version, _index):
+    return ReverseIndex(_index)
+
+
+@perf.timed()
+def load_reverse_index(df_pres, df_herb):
+    """Target / action / compound -> prescription inverted indexes, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return ReverseIndex(index)
+    return _build_reverse_index(version, index)
+
+
+@st.cache_resource(max_entries=2)
+def _build_search_index(version, _index):
+    return SearchIndex(_index)
+
+
+@perf.timed()
+def load_search_index(df_pres, df_herb):
+    """Fuzzy name search over prescriptions, herbs, compounds and targets, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return SearchIndex(index)
+    return _build_search_index(version, index)
+
+
+@st.cache_resource(max_entries=2)
+def _build_path_engine(version, _index):
+    return PathEngine(_index)
+
+
+@perf.timed()
+def load_path_engine(df_pres, df_herb):
+    """Herb -> compound -> target -> action path queries, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return PathEngine(index)
+    return _build_path_engine(version, index)
+
+
+@st.cache_resource(max_entries=2)
+def _build_enrichment_engine(version, _index):
+    return EnrichmentEngine(_index)
+
+
+@perf.timed()
+def load_enrichment_engine(df_pres, df_herb):
+    """Core_Action / Target_Protein background frequencies for enrichment scoring, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return EnrichmentEngine(index)
+    return _build_enrichment_engine(version, index)
+
+
+
+@st.cache_resource(max_entries=2)
+def _build_script_index(version, _df_script, _index):
+    return ScriptIndex(_df_script, _index.pres_names)
+
+
+@perf.timed()
+def load_script_index(df_pres, df_herb, df_script):
+    """Prescription_script lookup by normalized name and full-text symptom search, built once per dataset version."""
+    index = load_mechanism_index(df_pres, df_herb)
+    version = dataset_version(df_pres)
+    if version is None:
+        return ScriptIndex(df_script, index.pres_names)
+    return _build_script_index(version, df_script, index)
+
+class _DeadlineReader(io.RawIOBase):
+    """
+    Response stream that raises TimeoutError once the per-tab deadline has passed, and feeds every byte read
+    to `digest`, so a tab is hashed by whoever consumes it.
+    """
+
+    def __init__(self, resp, timeout, digest):
+        self.resp = resp
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if time.monotonic() > self.deadline:
+            raise TimeoutError(f"download exceeded {self.timeout}s")
+        n = self.resp.readinto(buffer)
+        self.digest.update(memoryview(buffer)[:n])
+        return n
+
+
+def _read_csv(raw, **kwargs):
+    """pd.read_csv that skips malformed rows (too many fields) and counts them in attrs['malformed_rows']."""
+    malformed = []
+
+    def skip(fields):
+        malformed.append(fields)
+        return None
+
+    df = pd.read_csv(io.BytesIO(raw), engine='python', on_bad_lines=skip, **kwargs)
+    df.attrs['malformed_rows'] = len(malformed)
+    return df
+
+
+def _parse_tab(name, raw):
+    # For Prescription_script, it might not have headers, but we'll try to read it
+    if name == "Prescription_script":
+        df = _read_csv(raw, header=None)
+        # Assign manual headers based on structure: Prescription, Symptom, Explanation
+        df.columns = ['Prescription_Name', 'Symptom_Status', 'Explanation'] + [f'extra_{i}' for i in range(len(df.columns)-3)]
+        return df
+    return _read_csv(raw)
+
+
+def _download_tab(name, url, timeout):
+    """
+    Downloads a tab, hashing its raw bytes as they arrive; `timeout` is a total per-tab deadline.
+    Herb_Library can be large and is ingested block by block while it downloads, so its bytes are never held
+    whole. The other tabs are kept in memory and parsed by _parse_download.
+    Returns (SHA-256 hex digest, Herb_Library DataFrame or body file positioned at its start).
+    """
+    digest = hashlib.sha256()
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        stream = io.BufferedReader(_DeadlineReader(resp, timeout, digest), buffer_size=1 << 16)
+        if name == "Herb_Library":
+            df = ingest_herb_library(stream)
+            # Hash whatever the parser left unread
+            while stream.read(1 << 16):
+                pass
+            df.attrs['raw_hash'] = digest.hexdigest()
+            return digest.hexdigest(), df
+        body = io.BytesIO(stream.read())
+    return digest.hexdigest(), body
+
+
+def _parse_download(name, digest, body):
+    if isinstance(body, pd.DataFrame):
+        # Herb_Library, already ingested while it downloaded
+        return body
+    with body:
+        df = _parse_tab(name, body.getvalue())
+    df.attrs['raw_hash'] = digest
+    return df
+
+
+@perf.timed()
+def fetch_tabs(sheet_url=SHEET_URL, gids=GIDS, timeout=FETCH_TIMEOUT, max_workers=FETCH_WORKERS,
+               known_hashes=None):
+    """
+    Downloads the sheet tabs concurrently on a bounded thread pool.
+    Returns ({name: raw DataFrame}, {name: Exception}) - a failing tab does not discard the others.
+    Each DataFrame carries the SHA-256 of the tab's raw bytes in attrs['raw_hash'].
+    Tabs are parsed as soon as their bytes have arrived, unless `known_hashes` ({name: hash}, e.g. of the
+    current snapshot) is given: then parsing waits for all downloads, and if every downloaded tab matches
+    its known hash nothing more is parsed and (None, errors) is returned. Herb_Library is always parsed as
+    it streams in (its hash is only known at the end), and is dropped if it turns out unchanged.
+    """
+    downloads, parses, dfs, errors = {}, {}, {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(gids)))) as pool:
+        # Use GViz API endpoint which is more robust for public access than /export
+        futures = {
+            pool.submit(_download_tab, name, f"{sheet_url}/gviz/tq?tqx=out:csv&gid={gid}", timeout): name
+            for name, gid in gids.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                downloads[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+                continue
+            if known_hashes is None:
+                parses[pool.submit(_parse_download, name, *downloads[name])] = name
+
+        if known_hashes is not None:
+            if downloads and all(known_hashes.get(name) == digest for name, (digest, _) in downloads.items()):
+                return None, errors
+            parses = {pool.submit(_parse_download, name, *download): name for name, download in downloads.items()}
+
+        for future in as_completed(parses):
+            name = parses[future]
+            try:
+                dfs[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+    return dfs, errors
+
+
+def fetch_data(sheet_url=SHEET_URL, gids=GIDS, timeout=FETCH_TIMEOUT, max_workers=FETCH_WORKERS, known_hashes=None):
     """
     Loads data from Google Sheets using direct CSV export (GViz API).
     This bypasses st-gsheets-connection to avoid SSL/Env issues.
-    Cached for 1 hour to support concurrent users.
-    """
-    try:
-        # Configuration
-        sheet_url = "https://docs.google.com/spreadsheets/d/1YS2w6eQfULCpSCccQ2jjxoCTs0gJYt78vdt22Q4vZBU"
-        
-        # Hardcoded GIDs to ensure robust connection without fragile scraping
-        # Extracted from live sheet metadata
-        gids = {
-            "Prescription_Input": "221744534",      # Correct GID from user
-            "Herb_Library": "1414851403",           # Confirmed (Integrated)
-            "Prescription_script": "1443852241"     # Clinical scripts
-        }
+    Returns ((df_pres, df_herb, df_script), errors); tabs that failed are None.
+    With `known_hashes`, returns (None, errors) if the sheet is unchanged (see fetch_tabs).
+    """
+    dfs, errors = fetch_tabs(sheet_url, gids, timeout, max_workers, known_hashes)
+    if dfs is None:
+        return None, errors
+    frames = preprocess_data(dfs.get("Prescription_Input"),
+                             dfs.get("Herb_Library"),
+                             dfs.get("Prescription_script"))
+    return frames, errors
+
+
+@perf.timed()
+def refresh_data(snapshot_dir=None, sheet_url=SHEET_URL, gids=GIDS, unchanged_from=None, failed_tabs=None):
+    """
+    Downloads the live sheet, preprocesses it and publishes it as the current snapshot.
+    Tabs that fail to download are taken from the previous snapshot; if `failed_tabs` is a dict, their
+    errors are added to it (this runs on the refresh worker, where nothing can be shown to a session).
+    Returns the version-tagged frames, or None if `unchanged_from` names a stored version whose raw tab
+    hashes the downloaded tabs all match (nothing is parsed or stored then).
+    """
+    snapshot_dir = snapshot_dir or snapshot.DEFAULT_SNAPSHOT_DIR
+    known = snapshot.raw_hashes(snapshot_dir, unchanged_from) if unchanged_from else None
+    frames, errors = fetch_data(sheet_url, gids, known_hashes=known or None)
+    if frames is None:
+        return None
 
-        # 2. Load Data using Export URL
-        dfs = {}
-        for name, gid in gids.items():
-            # Use GViz API endpoint which is more robust for public access than /export
-            csv_url = f"{sheet_url}/gviz/tq?tqx=out:csv&gid={gid}"
-            # For Prescription_script, it might not have headers, but we'll try to read it
-            if name == "Prescription_script":
-                dfs[name] = pd.read_csv(csv_url, on_bad_lines='skip', header=None)
-                # Assign manual headers based on structure: Prescription, Symptom, Explanation
-                dfs[name].columns = ['Prescription_Name', 'Symptom_Status', 'Explanation'] + [f'extra_{i}' for i in range(len(dfs[name].columns)-3)]
+    if errors:
+        previous = snapshot.load_snapshot(snapshot_dir)
+        previous_hashes = snapshot.raw_hashes(snapshot_dir)
+        frames = list(frames)
+        for i, name in enumerate(snapshot.TABLES):
+            if frames[i] is not None:
+                continue
+            if previous is not None and not previous[i].empty:
+                frames[i] = previous[i]
+                if name in previous_hashes:
+                    frames[i].attrs['raw_hash'] = previous_hashes[name]
+            elif name == "Prescription_Input":
+                raise RuntimeError(f"{name} could not be loaded: {errors.get(name)}")
             else:
-                dfs[name] = pd.read_csv(csv_url, on_bad_lines='skip')
+                frames[i] = pd.DataFrame(columns=EMPTY_COLUMNS[name])
+        if failed_tabs is not None:
+            failed_tabs.update({name: str(e) for name, e in errors.items()})
+        frames = tuple(frames)
 
-        return preprocess_data(dfs.get("Prescription_Input"), 
-                             dfs.get("Herb_Library"), 
-                             dfs.get("Prescription_script"))
+    if frames[0].empty:
+        # Column mismatch etc. - never overwrite a good snapshot with empty frames
+        return frames
+    version = snapshot.save_snapshot(frames, snapshot_dir)
+    return tag_version(frames, version)
 
-    except Exception as e:
-        st.error(f"Live data loading failed: {e}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-def preprocess_data(df_pres, df_herb, df_script):
+@perf.timed()
+def refresh_incremental(current, snapshot_dir=None, sheet_url=SHEET_URL, gids=GIDS):
+    """
+    Refreshes the dataset and carries the work done for the `current` frames over to the new version:
+    - the new mechanism index is built once, up front
+    - similarity neighbor tables are patched only for the prescriptions the refresh affected
+    - result cache entries (figures, tables) of unaffected prescriptions are kept
+    If every downloaded tab is byte-identical to the version it would replace, nothing is parsed and `current`
+    is returned as is (summary['unchanged']). While a version is pinned, a changed sheet is stored in the
+    snapshot history (summary['stored_version']) but `current` keeps being served.
+    No cache is cleared: objects cached for the old version are evicted as new versions are built.
+    Returns (new frames, summary): diff counts, cache entries kept / dropped, neighbor tables carried over and
+    their rows rescored, malformed rows skipped per tab,
+    tabs kept from the previous snapshot because their download failed (failed_tabs) and step timings (seconds).
+    Raises RuntimeError if the download produced no usable data.
+    """
+    timings = {}
+
+    def step(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[name] = time.perf_counter() - start
+        return result
+
+    snapshot_dir = snapshot_dir or snapshot.DEFAULT_SNAPSHOT_DIR
+    old_version = dataset_version(current[0])
+    pinned = snapshot.pinned_version(snapshot_dir)
+    # The sheet is compared with the version it would replace: while one is pinned, the newest stored one
+    reference = snapshot.list_versions(snapshot_dir)[0]['version'] if pinned else old_version
+    failed_tabs = {}
+    new = step('download_preprocess', lambda: refresh_data(snapshot_dir, sheet_url, gids, unchanged_from=reference,
+                                                           failed_tabs=failed_tabs))
+    if new is None:
+        # Raw tabs identical to the reference version: no parsing, same version, every cache stays warm
+        return current, {'old_version': old_version, 'new_version': old_version, 'unchanged': True,
+                         'pinned': pinned, 'timings': timings, 'malformed_rows': {}, 'failed_tabs': failed_tabs}
+    new_version = dataset_version(new[0])
+    if new_version is None:
+        # Nothing was published (e.g. column mismatch); the current data stays in place
+        raise RuntimeError("the downloaded sheet has no usable Prescription_Input data")
+    if pinned and new_version != pinned:
+        # Stored in the history, but the pinned version keeps being served
+        return current, {'old_version': old_version, 'new_version': old_version, 'stored_version': new_version,
+                         'pinned': pinned, 'timings': timings, 'malformed_rows': {}, 'failed_tabs': failed_tabs}
+    # Serve the published copy (memory-mapped, shared with the other server processes) instead of the heap one
+    new = step('map', lambda: _map_published(new, snapshot_dir))
+    summary = {'old_version': old_version, 'new_version': new_version, 'timings': timings,
+               'failed_tabs': failed_tabs}
+    malformed = {name: df.attrs.get('malformed_rows', 0) for name, df in zip(snapshot.TABLES, new)}
+    summary['malformed_rows'] = {name: count for name, count in malformed.items() if count}
+
+    diff = step('diff', lambda: DatasetDiff(current, new))
+    summary.update(diff.summary())
+    if old_version is not None and new_version != old_version:
+        index = step('mechanism_index', lambda: _build_mechanism_index(new_version, new[0], new[1]))
+        previous = _similarity_engines.get(old_version)
+        if previous is not None:
+            engine = step('similarity', lambda: _build_similarity_engine(
+                new_version, index, _previous=previous, _affected=diff.affected_prescriptions))
+            summary.update(neighbor_tables_carried=len(engine.rescored),
+                           neighbor_rows_rescored=sum(engine.rescored.values()))
+
+        kept, dropped = step('result_cache', lambda: migrate_results(
+            old_version, new_version, index.pres_names, diff.affected_prescriptions))
+        summary.update(cache_kept=kept, cache_dropped=dropped)
+
+    return new, summary
+
+
+def migrate_results(old_version, new_version, pres_names, affected, cache=None):
+    """
+    Moves the shared results of `old_version` to `new_version`, except those naming a prescription that is
+    affected or gone, and those holding index IDs (renumbered by the new index). Returns (kept, dropped).
+    """
+    known = set(pres_names)
+
+    def keep(key):
+        if key[1] in INDEX_ID_RESULTS:
+            return False
+        refs = {v for v in key_values(key) if isinstance(v, str)}
+        return bool(refs & known) and not (refs & affected)
+
+    return (shared_cache() if cache is None else cache).migrate(old_version, new_version, keep)
+
+
+def _map_published(frames, snapshot_dir):
+    mapped = snapshot.load_mapped(snapshot_dir, dataset_version(frames[0]))
+    for new, old in zip(mapped, frames):
+        new.attrs.update({k: old.attrs[k] for k in ('malformed_rows', 'raw_hash') if k in old.attrs})
+    return tag_version(tuple(mapped[:3]), mapped[3])
+
+
+def _load_current_snapshot(snapshot_dir):
+    # Memory-mapped: every server process on this machine shares the same pages
+    cached = snapshot.load_mapped(snapshot_dir)
+    if cached is None:
+        return None
+    *frames, version = cached
+    return tag_version(tuple(frames), version), snapshot.created_at(snapshot_dir, version) or time.time()
+
+
+def _load_published(snapshot_dir, current):
+    """The current snapshot if another process has published a different version than `current`, else None."""
+    version = snapshot.current_version(snapshot_dir)
+    if version is None or version == dataset_version(current[0]):
+        return None
+    return _load_current_snapshot(snapshot_dir)
+
+
+@st.cache_resource
+def dataset_store(snapshot_dir=None):
+    """
+    The dataset shared by all sessions (see DatasetStore): served from the local snapshot at once,
+    refreshed from the live sheet by one background worker when older than REFRESH_INTERVAL or on request.
+    """
+    snapshot_dir = snapshot_dir or snapshot.DEFAULT_SNAPSHOT_DIR
+
+    def refresh(current):
+        if OFFLINE:
+            raise RuntimeError(f"Offline mode: no data snapshot found in {snapshot_dir}")
+        if current is None:
+            failed_tabs = {}
+            frames = refresh_data(snapshot_dir, failed_tabs=failed_tabs)
+            if dataset_version(frames[0]) is None:
+                raise RuntimeError("the downloaded sheet has no usable Prescription_Input data")
+            return frames, {'failed_tabs': failed_tabs} if failed_tabs else None
+        return refresh_incremental(current, snapshot_dir)
+
+    # Other server processes sharing the snapshot directory may publish a new version: picked up on the next poll
+    return DatasetStore(load=lambda: _load_current_snapshot(snapshot_dir), refresh=refresh,
+                        max_age=0 if OFFLINE else REFRESH_INTERVAL,
+                        poll=lambda current: _load_published(snapshot_dir, current), poll_interval=POLL_INTERVAL)
+
+
+# Columns holding heavily repeated names. They are stored as pandas categoricals; columns that
+# share a key (e.g. Herb_Name in Prescription_Input and Herb_Library) share one dictionary so
+# merges and lookups work on integer codes.
+CATEGORICAL_COLUMNS = {
+    "Prescription_Input": ['Prescription_Name', 'Herb_Name'],
+    "Herb_Library": ['Herb_Name', 'Compound_Name', 'Target_Protein', 'Core_Action', 'KM_Efficacy'],
+    "Prescription_script": ['Prescription_Name'],
+}
+SHARED_DICTIONARIES = {
+    'Prescription_Name': ["Prescription_Input", "Prescription_script"],
+    'Herb_Name': ["Prescription_Input", "Herb_Library"],
+}
+
+
+def _frame_stats(stage, table, df, when):
+    return {
+        'stage': stage,
+        'table': table,
+        'when': when,
+        'rows': len(df),
+        'memory_bytes': int(df.memory_usage(index=True, deep=True).sum()),
+    }
+
+
+def _factorize_stripped(s):
+    """
+    Strips and factorizes a string column working on its unique values only.
+    Returns (codes, uniques) with -1 for missing/blank values.
+    """
+    codes, uniques = pd.factorize(s)
+    cleaned = pd.Series(pd.Index(uniques).astype(str), dtype=object).str.strip()
+    cleaned = cleaned.mask(cleaned == '')
+    # Stripping may merge values ("A" / "A "), so factorize the cleaned uniques again
+    remap, merged = pd.factorize(cleaned)
+    remap = np.append(remap, -1)  # codes == -1 (missing) index the trailing -1
+    return remap[codes], pd.Index(merged, dtype=object)
+
+
+def _categorize(tables, categorical_columns=CATEGORICAL_COLUMNS, shared=SHARED_DICTIONARIES):
+    """Converts the repeated-name columns of every table into categoricals, sharing dictionaries per key."""
+    factorized = {}
+    for table, columns in categorical_columns.items():
+        df = tables.get(table)
+        if df is None:
+            continue
+        for col in columns:
+            if col in df.columns:
+                factorized[(table, col)] = _factorize_stripped(df[col])
+
+    # One sorted dictionary per column name, unioned across the tables that share it
+    dictionaries = {}
+    for (table, col), (_, uniques) in factorized.items():
+        group = tuple(shared.get(col, [table]))
+        dictionaries.setdefault((col, group), []).append(uniques)
+    dtypes = {
+        key: pd.CategoricalDtype(sorted(set().union(*parts)))
+        for key, parts in dictionaries.items()
+    }
+
+    for (table, col), (codes, uniques) in factorized.items():
+        dtype = dtypes[(col, tuple(shared.get(col, [table])))]
+        remap = np.append(dtype.categories.get_indexer(uniques), -1)
+        tables[table][col] = pd.Categorical.from_codes(remap[codes], dtype=dtype)
+    return tables
+
+
+def _clean_amount(s):
+    """Regex-cleans amounts like '12g' / '1.5 돈' on unique values only and converts to float."""
+    codes, uniques = pd.factorize(s)
+    cleaned = pd.Series(pd.Index(uniques).astype(str), dtype=object).str.replace(r'[^0-9.]', '', regex=True)
+    values = np.append(pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype=float), np.nan)
+    return pd.Series(values[codes], index=s.index).fillna(0.0)
+
+
+def _explode_compounds(df, col):
+    """
+    Splits the comma-separated compound lists and explodes them to one row per compound.
+    Splitting happens once per distinct list, in Arrow compute kernels; rows are expanded with index arithmetic.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    codes, uniques = pd.factorize(df[col])
+    n_uniques = len(uniques)
+    # Missing lists keep a single missing compound (sentinel unique at the end)
+    codes = np.where(codes < 0, n_uniques, codes)
+
+    # Split by comma, whitespace around each compound trimmed
+    lists = pc.split_pattern(pa.array(pd.Index(uniques).astype(str).to_numpy(dtype=object), type=pa.string()), ',')
+    owner = pc.list_parent_indices(lists).to_numpy()
+    tokens = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    blank = pc.equal(tokens, '').to_numpy(zero_copy_only=False)
+    # Drop blank tokens, except a list made only of blanks keeps one missing compound
+    has_value = np.bincount(owner[~blank], minlength=n_uniques) > 0
+    first = np.r_[True, owner[1:] != owner[:-1]]
+    keep = ~blank | (~has_value[owner] & first)
+    encoded = pc.dictionary_encode(tokens.filter(pa.array(keep)))
+    tok_codes = np.where(blank[keep], -1, encoded.indices.to_numpy(zero_copy_only=False))
+    tok_uniques = pd.Index(encoded.dictionary.to_numpy(zero_copy_only=False), dtype=object)
+    owner = np.append(owner[keep], n_uniques)
+    tok_codes = np.append(tok_codes, -1)
+
+    lens = np.bincount(owner, minlength=n_uniques + 1)
+    ptr = np.concatenate(([0], np.cumsum(lens)))
+
+    row_lens = lens[codes]
+    rows = np.repeat(np.arange(len(df)), row_lens)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(row_lens) - row_lens, row_lens)
+    exploded = df.take(rows).reset_index(drop=True)
+    exploded[col] = pd.Categorical.from_codes(tok_codes[np.repeat(ptr[codes], row_lens) + offsets], tok_uniques)
+    return exploded
+
+
+class _CodeBuffer:
+    """
+    A categorical column assembled block by block: a growing value -> code dictionary plus int32 code
+    arrays, sorted into the final categories once at the end.
+    """
+
+    def __init__(self):
+        self.lookup = {}
+        self.parts = []
+
+    def append(self, codes, uniques):
+        mapping = np.fromiter((self.lookup.setdefault(v, len(self.lookup)) for v in uniques),
+                              dtype=np.int32, count=len(uniques))
+        self.parts.append(np.append(mapping, -1)[codes])  # -1 (missing) indexes the trailing -1
+
+    def categorical(self):
+        values = np.array(list(self.lookup), dtype=object)
+        order = np.argsort(values, kind='stable')
+        rank = np.full(len(values) + 1, -1, dtype=np.int32)
+        rank[order] = np.arange(len(values))
+        codes = np.concatenate(self.parts) if self.parts else np.zeros(0, dtype=np.int32)
+        return pd.Categorical.from_codes(rank[codes], categories=pd.Index(values[order], dtype=object))
+
+
+def _csv_header(stream):
+    """Column names of a buffered CSV stream, without consuming it (blank names become 'Unnamed: i')."""
+    head = stream.peek(1 << 16).decode('utf-8-sig', errors='replace').splitlines()
+    names = next(csv.reader(head[:1]), [])
+    return [name if name.strip() else f"Unnamed: {i}" for i, name in enumerate(names)]
+
+
+@perf.timed()
+def ingest_herb_library(stream, block_size=INGEST_BLOCK_BYTES, ingredient_col='Compound_Name'):
+    """
+    Streaming Herb_Library ingestion: the CSV is parsed in blocks of `block_size` bytes, and each block is
+    stripped, exploded and appended to categorical code buffers. Peak memory stays close to the size of the
+    result instead of several times it (raw text, Python lists and the exploded copy at once).
+    The result matches the clean / categorize / explode stages of preprocess_data and is marked with
+    attrs['exploded'] so they are not repeated. Every column is read as text. Rows with too many fields
+    are skipped and counted in attrs['malformed_rows']. Rows with too few are kept and padded with nulls,
+    as pd.read_csv does, but come after the rows parsed with them (pyarrow reads ahead).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    names = _csv_header(stream)
+    malformed, short_rows = [], []
+
+    def skip(row):
+        # pyarrow only skips or fails invalid rows: short ones are re-read padded below
+        if row.actual_columns > row.expected_columns:
+            malformed.append(row.number)
+        else:
+            short_rows.append(row.text + ',' * (row.expected_columns - row.actual_columns))
+        return 'skip'
+
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                            strings_can_be_null=True)
+    reader = pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1, block_size=block_size),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=skip),
+        convert_options=convert_options,
+    )
+    keep = [i for i, name in enumerate(names) if not name.startswith('Unnamed')]
+    columns = [names[i].strip() for i in keep]
+    categorical = set(CATEGORICAL_COLUMNS["Herb_Library"])
+    buffers = {col: _CodeBuffer() if col in categorical else [] for col in columns}
+
+    def padded_rows():
+        text = "\n".join(short_rows) + "\n"
+        short_rows.clear()
+        return pa_csv.read_csv(io.BytesIO(text.encode('utf-8')),
+                               read_options=pa_csv.ReadOptions(column_names=names),
+                               parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                               convert_options=convert_options)
+
+    def batches():
+        for batch in reader:
+            yield batch
+            if short_rows:
+                yield padded_rows()
+        if short_rows:
+            yield padded_rows()
+
+    for batch in batches():
+        chunk = batch.select(keep).to_pandas()
+        chunk.columns = columns
+        if ingredient_col in chunk.columns:
+            chunk = _explode_compounds(chunk, ingredient_col)
+        for col in columns:
+            if col in categorical:
+                buffers[col].append(*_factorize_stripped(chunk[col]))
+            else:
+                buffers[col].append(chunk[col].str.strip().to_numpy(dtype=object))
+
+    df = pd.DataFrame({
+        col: buffers[col].categorical() if col in categorical
+        else (np.concatenate(buffers[col]) if buffers[col] else np.zeros(0, dtype=object))
+        for col in columns
+    })
+    df.attrs['exploded'] = True
+    df.attrs['malformed_rows'] = len(malformed)
+    return df
+
+
+@perf.timed()
+def preprocess_data(df_pres, df_herb, df_script, report=None):
     """
     Preprocesses the dataframes:
-    2. Convert Amount to float using regex.
-    3. Explode Herb_Library ingredients.
-    4. Clean Prescription_script.
+    1. Drop "Unnamed" columns and strip column names / string cells.
+    2. Convert repeated-name columns to categoricals with shared dictionaries.
+    3. Convert Amount to float using regex.
+    4. Explode Herb_Library ingredients (already done by ingest_herb_library for a streamed Herb_Library).
+    If `report` is a list, row counts and memory before/after each stage are appended to it; 'after' entries
+    also carry the stage's wall time (stage_seconds, shared by the tables a stage processes).
+    Malformed row counts and raw hashes of the parsed tabs (attrs['malformed_rows'], attrs['raw_hash'])
+    are carried over to the results.
     """
-    
+    tables = {
+        "Prescription_Input": df_pres,
+        "Herb_Library": df_herb,
+        "Prescription_script": df_script,
+    }
+
+    def run_stage(stage, names, fn):
+        for name in names:
+            if report is not None and tables[name] is not None:
+                report.append(_frame_stats(stage, name, tables[name], 'before'))
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        for name in names:
+            if report is not None and tables[name] is not None:
+                report.append(dict(_frame_stats(stage, name, tables[name], 'after'), stage_seconds=seconds))
+
     # Helper to strip strings
     def strip_strings(df):
         # Filter out "Unnamed" columns (empty columns in Sheet)
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-        
+        df = df.loc[:, ~df.columns.astype(str).str.contains('^Unnamed')].copy()
+
         # Strip column names checks
-        df.columns = df.columns.str.strip()
-        
-        df_obj = df.select_dtypes(['object'])
-        df[df_obj.columns] = df_obj.apply(lambda x: x.str.strip())
+        df.columns = df.columns.astype(str).str.strip()
+
+        categorical = {c for cols in CATEGORICAL_COLUMNS.values() for c in cols}
+        for col in df.columns:
+            if col not in categorical and not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].str.strip()
         return df
 
-    df_pres = strip_strings(df_pres.copy())
-    df_herb = strip_strings(df_herb.copy())
-    if df_script is not None:
-        df_script = strip_strings(df_script.copy())
-    
+    def clean():
+        # Tabs that failed to download arrive as None and are passed through as None
+        for name, df in tables.items():
+            if df is not None:
+                tables[name] = strip_strings(df)
+
+    # Per-tab facts from ingestion, carried over to the results
+    carried = {}
+    for name, df in tables.items():
+        if df is not None:
+            carried[name] = {'malformed_rows': df.attrs.get('malformed_rows', 0)}
+            if 'raw_hash' in df.attrs:
+                carried[name]['raw_hash'] = df.attrs['raw_hash']
+    run_stage('clean', list(tables), clean)
+    df_pres = tables["Prescription_Input"]
+
     # Validation: Check keys match expectations
     required_cols = ['Prescription_Name']
-    if not all(col in df_pres.columns for col in required_cols):
+    if df_pres is not None and not all(col in df_pres.columns for col in required_cols):
         st.error(f"Data Connection Successful, but column structure does not match.")
         st.write("Found Columns:", df_pres.columns.tolist())
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
+    # Compound lists still to be exploded are categorized by the explode stage, once split
+    ingredient_col = 'Compound_Name'
+    to_explode = tables["Herb_Library"] is not None and not tables["Herb_Library"].attrs.get('exploded')
+    categorical_columns = dict(CATEGORICAL_COLUMNS, Herb_Library=[
+        col for col in CATEGORICAL_COLUMNS["Herb_Library"] if not (to_explode and col == ingredient_col)
+    ])
+    run_stage('categorize', list(tables), lambda: _categorize(tables, categorical_columns))
+
     # Convert Amount to float
     amount_col = 'Amount'
-    if amount_col in df_pres.columns:
-        df_pres[amount_col] = df_pres[amount_col].astype(str).apply(lambda x: re.sub(r'[^0-9.]', '', x))
-        df_pres[amount_col] = pd.to_numeric(df_pres[amount_col], errors='coerce').fillna(0.0)
-    
+    if df_pres is not None and amount_col in df_pres.columns:
+        def amount():
+            df_pres[amount_col] = _clean_amount(df_pres[amount_col])
+        run_stage('amount', ["Prescription_Input"], amount)
+
     # Explode Herb_Library ingredients
-    # Debug output: 'Compound_Name'
-    ingredient_col = 'Compound_Name'
-            
-    if ingredient_col in df_herb.columns:
-        # Split by comma (handling optional whitespace around it)
-        df_herb[ingredient_col] = df_herb[ingredient_col].astype(str).str.split(r'\s*,\s*')
-        # Handle cases where nulls might become 'nan' strings
-        df_herb = df_herb.explode(ingredient_col)
-        df_herb[ingredient_col] = df_herb[ingredient_col].str.strip()
-    
-    return df_pres, df_herb, df_script
+    df_herb = tables["Herb_Library"]
+    if to_explode and ingredient_col in df_herb.columns:
+        def explode():
+            exploded = _explode_compounds(df_herb, ingredient_col)
+            tables["Herb_Library"] = _categorize(
+                {"Herb_Library": exploded}, {"Herb_Library": [ingredient_col]}, {}
+            )["Herb_Library"]
+        run_stage('explode', ["Herb_Library"], explode)
+
+    for name, attrs in carried.items():
+        tables[name].attrs.update(attrs)
+    return tables["Prescription_Input"], tables["Herb_Library"], tables["Prescription_script"]
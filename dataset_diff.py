@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+def _group_hashes(df, key):
+    """
+    Order-insensitive content hash per key value: (sum of row hashes mod 2**64, row count).
+    Categorical columns hash by value, so frames with different dictionaries compare correctly.
+    """
+    if df is None or df.empty or key not in df.columns:
+        return {}
+    keys = df[key].astype(object)
+    valid = keys.notna().to_numpy()
+    row_hash = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()[valid]
+    codes, uniques = pd.factorize(keys[valid])
+    order = np.argsort(codes, kind='stable')
+    codes, row_hash = codes[order], row_hash[order]
+    if len(codes) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sums = np.add.reduceat(row_hash, starts)  # uint64, wraps around
+    counts = np.diff(np.r_[starts, len(codes)])
+    return dict(zip(uniques[codes[starts]], zip(sums.tolist(), counts.tolist())))
+
+
+def _compare(old, new):
+    added = sorted(set(new) - set(old))
+    removed = sorted(set(old) - set(new))
+    changed = sorted(k for k in set(old) & set(new) if old[k] != new[k])
+    return added, removed, changed
+
+
+class DatasetDiff:
+    """
+    Differences between two preprocessed datasets, by prescription and by herb.
+
+    - prescriptions: added / removed / changed (Prescription_Input rows or clinical scripts differ)
+    - herbs: added / removed / changed (Herb_Library rows differ)
+    - affected_prescriptions: every prescription whose results may differ - its own rows changed,
+      or it uses (before or after) a herb whose library rows changed
+    """
+
+    def __init__(self, old_frames, new_frames,
+                 col_pres_name='Prescription_Name', col_herb_name='Herb_Name'):
+        old_pres, old_herb, old_script = old_frames
+        new_pres, new_herb, new_script = new_frames
+
+        def pres_hashes(df_pres, df_script):
+            rows = _group_hashes(df_pres, col_pres_name)
+            scripts = _group_hashes(df_script, col_pres_name)
+            return {name: (rows.get(name), scripts.get(name)) for name in set(rows) | set(scripts)}
+
+        old_p, new_p = pres_hashes(old_pres, old_script), pres_hashes(new_pres, new_script)
+        self.added_prescriptions, self.removed_prescriptions, self.changed_prescriptions = _compare(old_p, new_p)
+        self.added_herbs, self.removed_herbs, self.changed_herbs = _compare(
+            _group_hashes(old_herb, col_herb_name), _group_hashes(new_herb, col_herb_name)
+        )
+
+        touched_herbs = set(self.added_herbs) | set(self.removed_herbs) | set(self.changed_herbs)
+        affected = set(self.added_prescriptions) | set(self.removed_prescriptions) | set(self.changed_prescriptions)
+        if touched_herbs:
+            for df in (old_pres, new_pres):
+                if df is not None and not df.empty:
+                    uses = df[col_herb_name].astype(object).isin(touched_herbs).to_numpy()
+                    affected.update(df[col_pres_name].astype(object)[uses].dropna())
+        self.affected_prescriptions = frozenset(affected)
+
+    @property
+    def empty(self):
+        return not (self.affected_prescriptions or self.added_herbs or self.removed_herbs or self.changed_herbs)
+
+    def summary(self):
+        return {
+            'prescriptions_added': len(self.added_prescriptions),
+            'prescriptions_removed': len(self.removed_prescriptions),
+            'prescriptions_changed': len(self.changed_prescriptions),
+            'herbs_added': len(self.added_herbs),
+            'herbs_removed': len(self.removed_herbs),
+            'herbs_changed': len(self.changed_herbs),
+            'prescriptions_affected': len(self.affected_prescriptions),
+        }
@@ -0,0 +1,144 @@
+import threading
+import time
+
+
+class DatasetStore:
+    """
+    Last good dataset shared by every session, refreshed by a single background worker
+    (single-flight, stale-while-revalidate).
+
+    - `get()` returns the current frames immediately; only the very first load blocks, and concurrent
+      first callers wait for that one load instead of starting their own. If it fails, later attempts
+      are left to the background worker and its back-off.
+    - Data older than `max_age` seconds triggers one background refresh; sessions keep being served the
+      current frames until the new ones are swapped in with a single reference assignment.
+    - A failed refresh keeps the current data and backs off exponentially (`backoff` .. `max_backoff`).
+
+    `load()` returns (frames, as_of) for the initial load (e.g. from the local snapshot) or None;
+    `refresh(current_frames)` returns (frames, summary) from the live source.
+    `poll(current_frames)`, checked at most every `poll_interval` seconds, returns (frames, as_of) when another
+    process has published a newer dataset, else None; the new frames are swapped in the same way.
+    """
+
+    def __init__(self, load, refresh, max_age=3600, backoff=30, max_backoff=1800, clock=time.time,
+                 poll=None, poll_interval=5.0):
+        self._load = load
+        self._refresh = refresh
+        self._poll = poll
+        self.poll_interval = poll_interval
+        self.next_poll = 0.0
+        self.max_age = max_age
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._current = None  # (frames, as_of) - replaced as a whole, never mutated
+        self._worker = None
+        self.failures = 0
+        self.last_error = None
+        self.next_attempt = 0.0
+        self.last_summary = None
+
+    def get(self):
+        """Returns (frames, as_of); as_of is None when no data could be loaded."""
+        current = self._current
+        if current is None:
+            current = self._initial_load()
+        elif self._poll is not None and self.clock() >= self.next_poll:
+            current = self._check_published(current)
+        if current[1] is None or (self.max_age and self.clock() - current[1] > self.max_age):
+            self.request_refresh()
+        return current
+
+    def _initial_load(self):
+        with self._lock:
+            if self._current is not None:
+                return self._current
+            loaded = None
+            try:
+                loaded = self._load()
+            except Exception as e:
+                self.last_error = e
+            if loaded is None:
+                # No local data at all: the first session has to wait for the live source. After a failure
+                # only the background worker retries, once the back-off has passed (see get())
+                if self.failures:
+                    return None, None
+                try:
+                    frames, self.last_summary = self._refresh(None)
+                    loaded = (frames, self.clock())
+                except Exception as e:
+                    self._record_failure(e)
+                    return None, None
+            self._current = loaded
+            self.next_poll = self.clock() + self.poll_interval
+            return loaded
+
+    def _check_published(self, current):
+        with self._lock:
+            if self.clock() < self.next_poll or self._current is not current:
+                return self._current
+            self.next_poll = self.clock() + self.poll_interval
+            try:
+                published = self._poll(current[0])
+            except Exception as e:
+                self.last_error = e
+                return current
+            if published is not None:
+                self._current = published  # atomic swap
+            return self._current
+
+    def request_refresh(self, force=False):
+        """
+        Starts the background refresh unless one is already running or the store is backing off
+        (`force` skips the back-off, e.g. for an explicit user request). Returns True if started.
+        """
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return False
+            if not force and self.clock() < self.next_attempt:
+                return False
+            self._worker = threading.Thread(target=self._run_refresh, name="dataset-refresh", daemon=True)
+            self._worker.start()
+            return True
+
+    def _run_refresh(self):
+        current = self._current
+        try:
+            frames, summary = self._refresh(current[0] if current else None)
+        except Exception as e:
+            with self._lock:
+                self._record_failure(e)
+            return
+        with self._lock:
+            self._current = (frames, self.clock())  # atomic swap
+            self.last_summary = summary
+            self.failures = 0
+            self.last_error = None
+            self.next_attempt = 0.0
+
+    def _record_failure(self, error):
+        # Caller holds the lock
+        self.failures += 1
+        self.last_error = error
+        self.next_attempt = self.clock() + min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+
+    def wait(self, timeout=None):
+        """Blocks until the running refresh (if any) has finished. Returns False on timeout."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+            return not worker.is_alive()
+        return True
+
+    def status(self):
+        current = self._current
+        worker = self._worker
+        return {
+            'as_of': current[1] if current else None,
+            'refreshing': worker is not None and worker.is_alive(),
+            'failures': self.failures,
+            'last_error': None if self.last_error is None else str(self.last_error),
+            'retry_in': max(0.0, self.next_attempt - self.clock()) if self.failures else 0.0,
+            'last_summary': self.last_summary,
+        }
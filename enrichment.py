@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+from mechanism_index import _ranges
+
+# Feature layer -> the layer its sets are drawn from: an action is the set of targets linked to it,
+# a target the set of compounds linked to it
+UNIT = {'action': 'target', 'target': 'compound'}
+
+# Key Pathological Themes: Core Actions enriched at this false discovery rate, at most KEY_THEMES of them
+ENRICHMENT_FDR = 0.05
+KEY_THEMES = 10
+
+
+def key_themes(actions, fdr=ENRICHMENT_FDR, limit=KEY_THEMES):
+    """
+    Rows of an enrich(..., 'action') table shown as key themes: the enriched ones (q < fdr), or the most
+    specific ones if none is. Returns (rows, enriched).
+    """
+    enriched = actions[actions['Q_Value'] < fdr].head(limit)
+    if enriched.empty:
+        return actions.head(limit), False
+    return enriched, True
+
+
+def benjamini_hochberg(p, m=None):
+    """Benjamini-Hochberg adjusted p-values (q-values) of `p`, as part of `m` tests (default len(p))."""
+    p = np.asarray(p, dtype=float)
+    m = len(p) if m is None else m
+    if len(p) == 0:
+        return p
+    order = np.argsort(p)
+    scaled = p[order] * m / np.arange(1, len(p) + 1)
+    q = np.empty(len(p))
+    q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
+
+
+def log_factorials(n):
+    """log(i!) for i = 0..n."""
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def hypergeom_sf(k, population, size, drawn, log_fact):
+    """
+    P(X >= k) for X ~ Hypergeometric(population, size, drawn), vectorized over k / size.
+    The shorter tail is summed exactly: the upper one from k for enriched features, else 1 - the lower one.
+    All pmf terms come from one ragged range over a log-factorial table, without a Python loop.
+    """
+    k = np.asarray(k, dtype=np.int64)
+    size = np.asarray(size, dtype=np.int64)
+    low = np.maximum(0, drawn - (population - size))
+    high = np.minimum(size, drawn)
+    upper = k * population >= size * drawn  # k at or above the mean
+    start = np.where(upper, np.maximum(k, low), low)
+    stop = np.where(upper, high + 1, np.minimum(k, high + 1))
+    lens = np.maximum(stop - start, 0)
+    x = _ranges(start, lens)
+    owner = np.repeat(np.arange(len(k)), lens)
+    kk, nn = size[owner], drawn
+    log_pmf = (log_fact[kk] - log_fact[x] - log_fact[kk - x]
+               + log_fact[population - kk] - log_fact[nn - x] - log_fact[population - kk - nn + x]
+               - (log_fact[population] - log_fact[nn] - log_fact[population - nn]))
+    tail = np.bincount(owner, weights=np.exp(log_pmf), minlength=len(k))
+    return np.clip(np.where(upper, tail, 1.0 - tail), 0.0, 1.0)
+
+
+class EnrichmentEngine:
+    """
+    Core_Action / Target_Protein enrichment of one prescription against the whole library.
+
+    Built once per dataset version from a MechanismIndex:
+    - set sizes: targets linked to each action, compounds linked to each target (the hypergeometric
+      population is every target / compound with at least one link)
+    - background frequency of each action / target: its share of the library evidence rows of an
+      average herb (every herb's rows weighted 1 / its row count)
+
+    Per prescription, only the rows of its own herbs are touched:
+    - Overlap: reached targets (compounds) in the action's (target's) set; P_Value = P(X >= Overlap) under
+      the hypergeometric draw of the reached units in the population; Q_Value = Benjamini-Hochberg over every tested feature
+    - Weighted_Share: share of the prescription's herb amount reaching the feature (each herb's amount
+      split evenly over its evidence rows); Weighted_Fold = Weighted_Share / background frequency
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.names = {'action': index.action_names, 'target': index.target_names}
+        self.edges = {'action': index.target_action, 'target': index.compound_target}
+        self.row_ids = {'action': index.row_action, 'target': index.row_target}
+
+        n_herb = len(index.herb_names)
+        herb_rows = np.diff(index.herb_rows.ptr)
+        self.row_weight = np.zeros(n_herb)
+        np.divide(1.0, herb_rows, out=self.row_weight, where=herb_rows > 0)
+
+        self.set_size, self.population, self.background, self.log_fact = {}, {}, {}, {}
+        herb_of_row = index.row_herb
+        weight = np.where(herb_of_row >= 0, self.row_weight[np.maximum(herb_of_row, 0)], 0.0)
+        n_herbs_with_rows = max(int((herb_rows > 0).sum()), 1)
+        for kind, csr in self.edges.items():
+            n = len(self.names[kind])
+            self.set_size[kind] = np.bincount(csr.idx, minlength=n)
+            self.population[kind] = int((np.diff(csr.ptr) > 0).sum())
+            self.log_fact[kind] = log_factorials(self.population[kind])
+            ids = self.row_ids[kind]
+            keep = ids >= 0
+            self.background[kind] = np.bincount(ids[keep], weights=weight[keep], minlength=n) / n_herbs_with_rows
+        self.tested = {kind: int((size > 0).sum()) for kind, size in self.set_size.items()}
+
+    def _herbs(self, pres_name):
+        entries, _ = self.index.pres_herb.gather(self.index.pres_ids([pres_name]))
+        herbs = self.index.pres_herb.idx[entries]
+        amounts = np.nan_to_num(np.asarray(self.index.pres_herb.data[entries], dtype=float))
+        keep = herbs >= 0
+        herbs, inverse = np.unique(herbs[keep], return_inverse=True)
+        return herbs, np.bincount(inverse, weights=amounts[keep], minlength=len(herbs))
+
+    def _reached_units(self, herbs, kind):
+        """Distinct compounds (kind 'target') or targets (kind 'action') reached by the herbs."""
+        entries, _ = self.index.herb_compound.gather(herbs)
+        compounds = np.unique(self.index.herb_compound.idx[entries])
+        if UNIT[kind] == 'compound':
+            return compounds
+        entries, _ = self.index.compound_target.gather(compounds)
+        return np.unique(self.index.compound_target.idx[entries])
+
+    def enrich(self, pres_name, kind='action'):
+        """
+        Enrichment of every feature of `kind` ('action' or 'target') reached by the prescription,
+        most significant first. Features it does not reach are not listed (P_Value 1).
+        """
+        label = {'action': self.index.col_herb_loop, 'target': self.index.col_herb_target}[kind]
+        columns = [label, 'Overlap', 'Set_Size', 'Expected', 'Fold', 'Weighted_Share', 'Weighted_Fold',
+                   'P_Value', 'Q_Value']
+        herbs, amounts = self._herbs(pres_name)
+        units = self._reached_units(herbs, kind)
+        # Only units with a link of `kind` (e.g. targets with a Core_Action) belong to the population
+        units = units[np.diff(self.edges[kind].ptr)[units] > 0]
+        if len(units) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # Overlap of the reached units with every feature set they touch
+        csr = self.edges[kind]
+        entries, _ = csr.gather(units)
+        features, overlap = np.unique(csr.idx[entries], return_counts=True)
+        size = self.set_size[kind][features]
+        population, drawn = self.population[kind], len(units)
+        p = hypergeom_sf(overlap, population, size, drawn, self.log_fact[kind])
+        expected = drawn * size / population
+
+        # Amount-weighted share over the prescription's own library rows
+        rows, owner = self.index.herb_rows.gather(herbs)
+        rows = self.index.herb_rows.idx[rows]
+        ids = self.row_ids[kind][rows]
+        weight = (amounts * self.row_weight[herbs])[owner]
+        found = np.minimum(np.searchsorted(features, ids), len(features) - 1)
+        # Rows whose feature is not linked through the unit layer (e.g. no target) carry no overlap either
+        keep = (ids >= 0) & (features[found] == ids)
+        share = np.bincount(found[keep], weights=weight[keep], minlength=len(features))
+        total = amounts[self.row_weight[herbs] > 0].sum()
+        share = share / total if total > 0 else share
+        background = self.background[kind][features]
+
+        result = pd.DataFrame({
+            label: self.names[kind][features],
+            'Overlap': overlap,
+            'Set_Size': size,
+            'Expected': expected,
+            'Fold': overlap / expected,
+            'Weighted_Share': share,
+            'Weighted_Fold': np.divide(share, background, out=np.zeros(len(share)), where=background > 0),
+            'P_Value': p,
+            'Q_Value': benjamini_hochberg(p, self.tested[kind]),
+        }, columns=columns)
+        return result.sort_values(['Q_Value', 'P_Value', 'Weighted_Fold', label],
+                                  ascending=[True, True, False, True]).reset_index(drop=True)
@@ -0,0 +1,199 @@
+"""
+Batch export: renders every prescription's figures and tables from a local snapshot, without the app.
+
+    python export.py --output export/ [--snapshot-dir .snapshot] [--workers 4] [--format html json]
+                     [--node-budget 150] [--prescriptions NAME ...]
+
+Per prescription, <output>/<name>/ gets the deep and condensed Sankeys and the sunburst
+(HTML and/or JSON figure specs) plus the inference tables as CSV. A prescription is finished once its
+done.json is written, so an interrupted export resumes where it stopped; a new snapshot version
+re-exports everything.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from analysis import PrescriptionAnalyzer
+from data_loader import tag_version
+from enrichment import EnrichmentEngine, key_themes
+from result_cache import ResultCache
+from sankey_lod import NODE_BUDGET
+import snapshot
+
+DONE_FILE = "done.json"
+FORMATS = ('html', 'json')
+
+# Snapshot, index and options of this worker process (set once by _init_worker)
+_state = {}
+
+
+def safe_dirname(name):
+    """File-system safe, collision-free directory name for a prescription."""
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+    readable = re.sub(r'[^\w.-]+', '_', name).strip('._')[:80]
+    return f"{readable}-{digest}"
+
+
+def _init_worker(snapshot_dir, version, output_dir, formats, node_budget):
+    # Memory-mapped: the worker processes share one copy of the frames and the index
+    df_pres, df_herb, df_script, version = snapshot.load_mapped(snapshot_dir, version)
+    tag_version((df_pres, df_herb, df_script), version)
+    index = snapshot.load_index(df_pres, df_herb)
+    _state.update(
+        df_pres=df_pres, df_herb=df_herb, version=version, index=index, enrichment=EnrichmentEngine(index),
+        # The figures of one prescription share its flow tensor
+        cache=ResultCache(),
+        output_dir=output_dir, formats=formats, node_budget=node_budget,
+    )
+
+
+def _write_figure(fig, base, formats):
+    files = []
+    if 'html' in formats:
+        fig.write_html(f"{base}.html", include_plotlyjs='cdn')
+        files.append(f"{base}.html")
+    if 'json' in formats:
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            f.write(fig.to_json())
+        files.append(f"{base}.json")
+    return files
+
+
+def is_done(directory, version, formats):
+    """True if the prescription was fully exported from this snapshot version in these formats."""
+    try:
+        with open(os.path.join(directory, DONE_FILE), encoding='utf-8') as f:
+            done = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return done.get('version') == version and set(formats) <= set(done.get('formats', ()))
+
+
+def export_prescription(name):
+    """Writes one prescription's figures and tables. Returns (name, seconds, error or None)."""
+    start = time.perf_counter()
+    s = _state
+    directory = os.path.join(s['output_dir'], safe_dirname(name))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        analyzer = PrescriptionAnalyzer(s['df_pres'], s['df_herb'], name, name, index=s['index'], cache=s['cache'])
+        files = []
+        files += _write_figure(analyzer.generate_single_sankey(name, mode='deep', node_budget=s['node_budget']),
+                               os.path.join(directory, 'sankey_deep'), s['formats'])
+        files += _write_figure(analyzer.generate_single_sankey(name, mode='condensed'),
+                               os.path.join(directory, 'sankey_condensed'), s['formats'])
+        files += _write_figure(analyzer.generate_sunburst(name), os.path.join(directory, 'sunburst'), s['formats'])
+
+        df_inf = analyzer.get_inference_data(name)
+        df_inf.to_csv(os.path.join(directory, 'inference.csv'), index=False)
+        # Core Actions ranked by enrichment as on the Pathology Inference page; Key_Theme marks the ones it tags
+        themes = s['enrichment'].enrich(name, 'action')
+        shown, _ = key_themes(themes)
+        themes.insert(1, 'Key_Theme', themes.index.isin(shown.index))
+        themes.to_csv(os.path.join(directory, 'themes.csv'), index=False)
+        files += [os.path.join(directory, 'inference.csv'), os.path.join(directory, 'themes.csv')]
+
+        # Written last (atomically): marks the prescription as finished
+        tmp = os.path.join(directory, DONE_FILE + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'prescription': name, 'version': s['version'], 'formats': list(s['formats']),
+                       'files': [os.path.basename(f) for f in files]}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(directory, DONE_FILE))
+    except Exception as e:
+        return name, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return name, time.perf_counter() - start, None
+
+
+def export_all(output_dir, snapshot_dir=snapshot.DEFAULT_SNAPSHOT_DIR, workers=None, formats=FORMATS,
+               node_budget=NODE_BUDGET, prescriptions=None, progress=sys.stderr):
+    """
+    Exports every prescription (or the given ones) of the current snapshot, skipping those already
+    done for this version. Work is spread over `workers` processes (default: CPU count; 1 = in process).
+    Returns a summary dict (counts, seconds, prescriptions per second, failures).
+    """
+    version = snapshot.current_version(snapshot_dir)
+    if version is None:
+        raise FileNotFoundError(f"No snapshot in {snapshot_dir}")
+    formats = tuple(formats)
+    init_args = (snapshot_dir, version, output_dir, formats, node_budget)
+    _init_worker(*init_args)
+    names = prescriptions or _state['df_pres']['Prescription_Name'].dropna().astype(object).unique().tolist()
+    os.makedirs(output_dir, exist_ok=True)
+
+    todo = [n for n in names if not is_done(os.path.join(output_dir, safe_dirname(n)), version, formats)]
+    skipped = len(names) - len(todo)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    failures = {}
+    start = last_report = time.perf_counter()
+
+    def report(done, final=False):
+        nonlocal last_report
+        now = time.perf_counter()
+        if progress is not None and (final or now - last_report >= 1.0):
+            last_report = now
+            rate = done / (now - start) if now > start else 0.0
+            print(f"[{done:>{len(str(len(todo)))}}/{len(todo)}] {rate:6.1f} prescriptions/s, "
+                  f"{len(failures)} failed", file=progress)
+
+    if workers == 1:
+        results = map(export_prescription, todo)
+        pool = None
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args)
+        # Small chunks keep the pool balanced between light and heavy prescriptions
+        results = pool.map(export_prescription, todo, chunksize=max(1, min(16, len(todo) // (workers * 8))))
+    try:
+        for done, (name, _, error) in enumerate(results, 1):
+            if error is not None:
+                failures[name] = error
+            report(done)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    seconds = time.perf_counter() - start
+    report(len(todo), final=True)
+
+    exported = len(todo) - len(failures)
+    summary = {
+        'version': version,
+        'exported': exported,
+        'skipped': skipped,
+        'failed': len(failures),
+        'workers': workers,
+        'seconds': seconds,
+        'prescriptions_per_s': exported / seconds if seconds > 0 else 0.0,
+        'failures': failures,
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True, help="output directory")
+    parser.add_argument('--snapshot-dir', default=snapshot.DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=list(FORMATS), dest='formats')
+    parser.add_argument('--node-budget', type=int, default=NODE_BUDGET,
+                        help="deep Sankey node budget (0 = full graph)")
+    parser.add_argument('--prescriptions', nargs='+', help="only these prescriptions")
+    args = parser.parse_args(argv)
+
+    summary = export_all(args.output, args.snapshot_dir, args.workers, args.formats,
+                         args.node_budget or None, args.prescriptions)
+    print(f"exported {summary['exported']}, skipped {summary['skipped']}, failed {summary['failed']} "
+          f"in {summary['seconds']:.1f} s ({summary['prescriptions_per_s']:.1f} prescriptions/s, "
+          f"{summary['workers']} workers)", file=sys.stderr)
+    for name, error in summary['failures'].items():
+        print(f"  {name}: {error}", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
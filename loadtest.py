@@ -0,0 +1,335 @@
+"""
+Load test: runs app.py headlessly (Streamlit AppTest) as many concurrent sessions and reports per-page
+latency percentiles, throughput and peak memory as the session count grows.
+
+    python loadtest.py [--sessions 1 2 4 8 16] [--duration 20] [--snapshot-dir DIR]
+                       [--prescriptions 500] [--herbs 300] [--library-rows 50000] [--output loadtest.json]
+
+Every session is its own AppTest (own session state) in this process, so, like the sessions of one
+`streamlit run` server, they share the process-wide caches. Each session repeatedly picks one of the pages
+below and random prescriptions. Without --snapshot-dir a synthetic dataset is generated into a temporary
+snapshot; the app runs offline either way. The first pass over every page (index and cache building) is not
+measured.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+PAGES = ("Mechanism Analysis", "Intuitive Comparison", "Pathology Inference")
+NAV_LABEL = "Go to"
+# Streamlit releases (major, minor) whose private AppTest internals prepare_app_test() patches
+STREAMLIT_TESTED = ((1, 65),)
+
+
+def prepare_snapshot(snapshot_dir, n_prescriptions, n_herbs, library_rows, seed):
+    """
+    Points the app at `snapshot_dir` in offline mode, writing a synthetic snapshot there if it is None.
+    Must run before the app modules are imported. Returns (snapshot_dir, temporary directory or None).
+    """
+    tmp = None
+    if snapshot_dir is None:
+        tmp = snapshot_dir = tempfile.mkdtemp(prefix="herb-loadtest-")
+    os.environ["HERB_OFFLINE"] = "1"
+    os.environ["HERB_SNAPSHOT_DIR"] = snapshot_dir
+    if tmp is not None:
+        from data_loader import preprocess_data
+        from synthetic import generate_dataset
+        import snapshot
+        frames = generate_dataset(n_prescriptions=n_prescriptions, n_herbs=n_herbs,
+                                  library_rows=library_rows, seed=seed)
+        snapshot.save_snapshot(preprocess_data(*frames), snapshot_dir)
+    return snapshot_dir, tmp
+
+
+def prepare_app_test():
+    """
+    Makes AppTest usable from many threads at once, as a server's sessions are:
+    - one ScriptCache for every run: a server compiles app.py once per runtime, while AppTest compiles it on
+      every run - which would add to every measured latency, and concurrent compiles are not thread-safe
+      (CPython < 3.12)
+    - the `global.appTest` option is set for the whole process instead of being patched in and out around
+      each run (mock.patch of the global config, which concurrent runs undo for each other)
+    - one mock Runtime for the whole process: AppTest installs a fresh one before each run and removes it
+      after, which pulls it from under the runs still going in other threads
+    These patch private Streamlit internals, so other Streamlit releases than STREAMLIT_TESTED are refused.
+    """
+    import streamlit
+    release = tuple(int(part) for part in streamlit.__version__.split(".")[:2])
+    if release not in STREAMLIT_TESTED:
+        tested = ", ".join(f"{major}.{minor}.x" for major, minor in STREAMLIT_TESTED)
+        raise RuntimeError(f"loadtest.py patches private AppTest internals of Streamlit {tested}, found "
+                           f"{streamlit.__version__}: install a tested release for load testing "
+                           f"(pip install 'streamlit=={tested.replace('x', '*')}') or update prepare_app_test()")
+
+    import contextlib
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    shared = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime._instance = runtime
+
+    class RuntimeSlot:
+        """Takes AppTest's per-run install / removal of its own mock Runtime, leaving the shared one in place."""
+        _instance = None
+
+    app_test.Runtime = RuntimeSlot
+
+
+class MemorySampler:
+    """Peak resident memory (bytes) of this process while running, sampled every `interval` seconds."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/status", encoding="ascii") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        import resource
+        # Peak since start (kilobytes on Linux, bytes on macOS) where /proc is not available
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self._thread = threading.Thread(target=self._run, name="loadtest-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+class Session:
+    """One simulated user: an AppTest navigating the pages with random prescription selections."""
+
+    def __init__(self, rng, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.rng = rng
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.prescriptions = None
+
+    def _run(self):
+        start = time.perf_counter()
+        self.at.run()
+        seconds = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+        return seconds
+
+    def _selectbox(self, label=None, key=None):
+        for box in self.at.sidebar.selectbox:
+            if (key is not None and box.key == key) or (key is None and box.label == label):
+                return box
+        raise LookupError(key or label)
+
+    def start(self):
+        self._run()
+        self.prescriptions = list(self._selectbox("Select Prescription", key="mech_pres").options)
+
+    def visit(self, page):
+        """Opens `page`, then picks random prescription(s). Returns the latency (seconds) of both page views."""
+        nav = next(radio for radio in self.at.sidebar.radio if radio.label == NAV_LABEL)
+        latencies = []
+        if nav.value != page:
+            nav.set_value(page)
+            latencies.append(self._run())
+        if page == "Intuitive Comparison":
+            a, b = self.rng.sample(self.prescriptions, 2)
+            self._selectbox(key="int_a").set_value(a)
+            self._selectbox(key="int_b").set_value(b)
+        elif page == "Mechanism Analysis":
+            self._selectbox(key="mech_pres").set_value(self.rng.choice(self.prescriptions))
+        else:
+            self._selectbox("Select Prescription").set_value(self.rng.choice(self.prescriptions))
+        latencies.append(self._run())
+        return latencies
+
+
+def summarize(latencies):
+    """Count and p50 / p95 / p99 / max (milliseconds) of a list of latencies in seconds."""
+    if not latencies:
+        return {'views': 0}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'views': len(ms), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': ms.max()}
+
+
+def run_level(n_sessions, duration, seed, timeout=120, max_visits=None):
+    """
+    Runs `n_sessions` concurrent sessions for `duration` seconds (or `max_visits` page visits each).
+    Returns a result dict: per-page latency summaries, throughput (page views / s), peak RSS and errors.
+    """
+    latencies = {page: [] for page in PAGES}
+    errors = []
+    lock = threading.Lock()
+    clock = {}
+
+    def start_clock():
+        clock['start'] = time.perf_counter()
+        clock['deadline'] = clock['start'] + duration
+
+    ready = threading.Barrier(n_sessions, action=start_clock)
+
+    def user(i):
+        rng = random.Random(seed * 10_007 + i)
+        session = None
+        try:
+            session = Session(rng, timeout)
+            session.start()
+        except Exception as e:
+            with lock:
+                errors.append(f"start: {type(e).__name__}: {e}")
+        ready.wait()
+        visits = 0
+        while session is not None and time.perf_counter() < clock['deadline'] and visits != max_visits:
+            page = rng.choice(PAGES)
+            visits += 1
+            try:
+                views = session.visit(page)
+            except Exception as e:
+                # A failed session is dropped rather than retried in a tight loop
+                with lock:
+                    errors.append(f"{page}: {type(e).__name__}: {e}")
+                break
+            with lock:
+                latencies[page].extend(views)
+
+    threads = [threading.Thread(target=user, args=(i,), name=f"loadtest-session-{i}") for i in range(n_sessions)]
+    with MemorySampler() as memory:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        seconds = time.perf_counter() - clock['start']
+
+    views = sum(len(v) for v in latencies.values())
+    return {
+        'sessions': n_sessions,
+        'seconds': seconds,
+        'views': views,
+        'views_per_s': views / seconds if seconds > 0 else 0.0,
+        'peak_rss_mb': memory.peak / 2 ** 20,
+        'pages': {page: summarize(values) for page, values in latencies.items()},
+        'all': summarize([x for values in latencies.values() for x in values]),
+        'errors': errors,
+    }
+
+
+def warm_up(seed, timeout=120):
+    """One pass over every page so that the measured levels start from warm shared caches."""
+    session = Session(random.Random(seed), timeout)
+    session.start()
+    for page in PAGES:
+        session.visit(page)
+
+
+def print_level(level, file=sys.stderr):
+    print(f"{level['sessions']:>3} sessions: {level['views_per_s']:7.2f} views/s, "
+          f"peak RSS {level['peak_rss_mb']:7.1f} MB, {len(level['errors'])} errors", file=file)
+    for page, s in [*level['pages'].items(), ('all pages', level['all'])]:
+        if s['views']:
+            print(f"      {page:<22} {s['views']:>6} views  p50 {s['p50_ms']:8.1f}  p95 {s['p95_ms']:8.1f}  "
+                  f"p99 {s['p99_ms']:8.1f} ms", file=file)
+    for error in level['errors'][:5]:
+        print(f"      error: {error}", file=file)
+
+
+def run_load_test(sessions=(1, 2, 4, 8, 16), duration=20.0, seed=0, max_visits=None, progress=sys.stderr):
+    """Warms up, then runs one level per session count. Returns the list of level results."""
+    prepare_app_test()
+    warm_up(seed)
+    levels = []
+    for n in sessions:
+        level = run_level(n, duration, seed, max_visits=max_visits)
+        levels.append(level)
+        if progress is not None:
+            print_level(level, progress)
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="concurrent session counts, one level each")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds per level")
+    parser.add_argument('--visits', type=int, help="stop each session after this many page visits")
+    parser.add_argument('--snapshot-dir', help="serve this snapshot instead of a synthetic dataset")
+    parser.add_argument('--prescriptions', type=int, default=500)
+    parser.add_argument('--herbs', type=int, default=300)
+    parser.add_argument('--library-rows', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    snapshot_dir, tmp = prepare_snapshot(args.snapshot_dir, args.prescriptions, args.herbs, args.library_rows,
+                                         args.seed)
+    try:
+        levels = run_load_test(args.sessions, args.duration, args.seed, args.visits)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'snapshot_dir': args.snapshot_dir,
+            'dataset': None if args.snapshot_dir else {'prescriptions': args.prescriptions, 'herbs': args.herbs,
+                                                       'library_rows': args.library_rows, 'seed': args.seed},
+            'levels': levels,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=float)
+    return 1 if any(level['errors'] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
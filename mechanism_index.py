@@ -0,0 +1,294 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def _ranges(starts, lens):
+    """Concatenation of range(s, s + l) for every (s, l) pair, fully vectorized."""
+    lens = np.asarray(lens, dtype=np.int64)
+    total = int(lens.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shift = np.asarray(starts, dtype=np.int64) - (np.cumsum(lens) - lens)
+    return np.repeat(shift, lens) + np.arange(total, dtype=np.int64)
+
+
+def _codes(series, names):
+    """Integer IDs of `series` values in `names` (-1 for missing/unknown), using categorical codes when possible."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        remap = np.append(names.get_indexer(series.cat.categories), -1)
+        return remap[series.cat.codes.to_numpy()].astype(np.int64)
+    return names.get_indexer(series).astype(np.int64)
+
+
+def _names(*columns):
+    """Sorted ID -> name dictionary over the non-missing values of the given columns."""
+    values = set()
+    for col in columns:
+        if col is None:
+            continue
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            values.update(col.cat.categories)
+        else:
+            values.update(col.dropna().unique())
+    return pd.Index(sorted(values), dtype=object)
+
+
+class CSR:
+    """
+    Compressed sparse rows: entries of row i are idx[ptr[i]:ptr[i + 1]] (with optional per-entry data).
+    """
+    __slots__ = ('ptr', 'idx', 'data')
+
+    def __init__(self, ptr, idx, data=None):
+        self.ptr = ptr
+        self.idx = idx
+        self.data = data
+
+    @classmethod
+    def from_pairs(cls, src, dst, n_rows, data=None):
+        """Groups (src, dst) pairs by src, keeping their original order within a row. Pairs with src < 0 are dropped."""
+        src = np.asarray(src, dtype=np.int64)
+        keep = src >= 0
+        order = np.flatnonzero(keep)[np.argsort(src[keep], kind='stable')]
+        ptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src[keep], minlength=n_rows), out=ptr[1:])
+        return cls(ptr, np.asarray(dst)[order], None if data is None else np.asarray(data)[order])
+
+    @classmethod
+    def unique_edges(cls, src, dst, n_rows, n_cols):
+        """Deduplicated src -> dst edges; data holds the multiplicity of each edge."""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keep = (src >= 0) & (dst >= 0)
+        pairs, counts = np.unique(src[keep] * n_cols + dst[keep], return_counts=True)
+        ptr = np.zeros(n_rows + 1, dtype=np.int64)
+        if len(pairs):
+            np.cumsum(np.bincount(pairs // n_cols, minlength=n_rows), out=ptr[1:])
+            return cls(ptr, pairs % n_cols, counts)
+        return cls(ptr, pairs, counts)
+
+    @property
+    def n_rows(self):
+        return len(self.ptr) - 1
+
+    def lengths(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.ptr[rows + 1] - self.ptr[rows]
+
+    def row(self, i):
+        return self.idx[self.ptr[i]:self.ptr[i + 1]]
+
+    def gather(self, rows):
+        """Entry positions for `rows` (in the given order) and the position in `rows` each entry came from."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lens = self.lengths(rows)
+        return _ranges(self.ptr[rows], lens), np.repeat(np.arange(len(rows)), lens)
+
+
+class MechanismIndex:
+    """
+    One-time integer-ID index over Prescription_Input and the exploded Herb_Library.
+
+    IDs: prescriptions, herbs, compounds, targets and actions are numbered by their
+    position in the sorted `*_names` dictionaries.
+
+    Edges (CSR):
+    - pres_rows:       prescription -> Prescription_Input row positions (original row order)
+    - herb_rows:       herb -> Herb_Library row positions (original row order)
+    - pres_herb:       prescription -> herb, data = Amount
+    - herb_compound:   herb -> compound, data = number of library rows
+    - compound_target: compound -> target, data = number of library rows
+    - target_action:   target -> action, data = number of library rows
+
+    The row-level CSRs reproduce `pd.merge(df_pres, df_herb, how='left')` exactly; the
+    layer CSRs are the deduplicated projections used for graph-style queries.
+
+    `save()` writes the arrays as .npy files; `load()` memory-maps them back (read-only), so processes
+    serving the same dataset version share them.
+    """
+
+    # Arrays written by save(), besides the CSRs' ptr / idx / data
+    ROW_ARRAYS = ('pres_row_pres', 'pres_row_herb', 'pres_row_amount',
+                  'row_herb', 'row_compound', 'row_target', 'row_action')
+    CSRS = ('pres_rows', 'herb_rows', 'pres_herb', 'herb_compound', 'compound_target', 'target_action')
+
+    def __init__(self, df_pres, df_herb, **columns):
+        self._bind(df_pres, df_herb, **columns)
+
+        def ids(df, name, names):
+            if name not in df.columns:
+                return np.full(len(df), -1, dtype=np.int64)
+            return _codes(df[name], names)
+
+        # Per-row IDs
+        self.pres_row_pres = ids(df_pres, self.col_pres_name, self.pres_names)
+        self.pres_row_herb = ids(df_pres, self.col_pres_herb, self.herb_names)
+        if self.col_pres_amount in df_pres.columns:
+            self.pres_row_amount = pd.to_numeric(df_pres[self.col_pres_amount], errors='coerce').to_numpy(dtype=float)
+        else:
+            self.pres_row_amount = np.zeros(len(df_pres))
+        self.row_herb = ids(df_herb, self.col_herb_name, self.herb_names)
+        self.row_compound = ids(df_herb, self.col_herb_ing, self.compound_names)
+        self.row_target = ids(df_herb, self.col_herb_target, self.target_names)
+        self.row_action = ids(df_herb, self.col_herb_loop, self.action_names)
+
+        n_pres, n_herb = len(self.pres_names), len(self.herb_names)
+        n_comp, n_target, n_action = len(self.compound_names), len(self.target_names), len(self.action_names)
+
+        # Row-level CSRs
+        self.pres_rows = CSR.from_pairs(self.pres_row_pres, np.arange(len(df_pres)), n_pres)
+        self.herb_rows = CSR.from_pairs(self.row_herb, np.arange(len(df_herb)), n_herb)
+
+        # Layer CSRs
+        self.pres_herb = CSR(self.pres_rows.ptr, self.pres_row_herb[self.pres_rows.idx],
+                             self.pres_row_amount[self.pres_rows.idx])
+        self.herb_compound = CSR.unique_edges(self.row_herb, self.row_compound, n_herb, n_comp)
+        self.compound_target = CSR.unique_edges(self.row_compound, self.row_target, n_comp, n_target)
+        self.target_action = CSR.unique_edges(self.row_target, self.row_action, n_target, n_action)
+
+    def _bind(self, df_pres, df_herb,
+              col_pres_name='Prescription_Name', col_pres_herb='Herb_Name', col_pres_amount='Amount',
+              col_herb_name='Herb_Name', col_herb_ing='Compound_Name',
+              col_herb_target='Target_Protein', col_herb_loop='Core_Action'):
+        # Frames, column names and the ID -> name dictionaries
+        self.df_pres = df_pres
+        self.df_herb = df_herb
+        self.col_pres_name = col_pres_name
+        self.col_pres_herb = col_pres_herb
+        self.col_pres_amount = col_pres_amount
+        self.col_herb_name = col_herb_name
+        self.col_herb_ing = col_herb_ing
+        self.col_herb_target = col_herb_target
+        self.col_herb_loop = col_herb_loop
+
+        def col(df, name):
+            return df[name] if name in df.columns else None
+
+        self.pres_names = _names(col(df_pres, col_pres_name))
+        self.herb_names = _names(col(df_pres, col_pres_herb), col(df_herb, col_herb_name))
+        self.compound_names = _names(col(df_herb, col_herb_ing))
+        self.target_names = _names(col(df_herb, col_herb_target))
+        self.action_names = _names(col(df_herb, col_herb_loop))
+
+    def save(self, directory):
+        """Writes the index arrays as .npy files into `directory` (see load)."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ROW_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        for name in self.CSRS:
+            csr = getattr(self, name)
+            for part in CSR.__slots__:
+                if getattr(csr, part) is not None:
+                    np.save(os.path.join(directory, f"{name}.{part}.npy"), getattr(csr, part))
+
+    @classmethod
+    def load(cls, directory, df_pres, df_herb, **columns):
+        """Index of the given frames with its arrays memory-mapped (read-only) from a save() directory."""
+        index = cls.__new__(cls)
+        index._bind(df_pres, df_herb, **columns)
+
+        def array(name):
+            path = os.path.join(directory, f"{name}.npy")
+            return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+
+        for name in cls.ROW_ARRAYS:
+            setattr(index, name, array(name))
+        for name in cls.CSRS:
+            setattr(index, name, CSR(*(array(f"{name}.{part}") for part in CSR.__slots__)))
+        return index
+
+    # --- Lookups ---
+
+    def pres_ids(self, names):
+        """IDs of the given prescription names (unknown names dropped, duplicates removed)."""
+        found = self.pres_names.get_indexer(pd.Index(list(names), dtype=object))
+        return np.unique(found[found >= 0])
+
+    def herb_ids(self, names):
+        found = self.herb_names.get_indexer(pd.Index(list(names), dtype=object))
+        return np.unique(found[found >= 0])
+
+    def prescription_rows(self, pres_names):
+        """Prescription_Input row positions of the given prescriptions, in original row order."""
+        entries, _ = self.pres_rows.gather(self.pres_ids(pres_names))
+        return np.sort(self.pres_rows.idx[entries])
+
+    def library_rows(self, herb_ids):
+        """Herb_Library row positions of the given herbs."""
+        entries, _ = self.herb_rows.gather(herb_ids)
+        return self.herb_rows.idx[entries]
+
+    def prescription_library_rows(self, pres_names):
+        """Herb_Library row positions reached by the given prescriptions (each herb once)."""
+        herbs = self.pres_row_herb[self.prescription_rows(pres_names)]
+        return self.library_rows(np.unique(herbs[herbs >= 0]))
+
+    def merge_positions(self, pres_rows):
+        """
+        Left-join positions of Prescription_Input rows against Herb_Library:
+        returns (pres row position, library row position or -1) per merged row.
+        """
+        herbs = self.pres_row_herb[pres_rows]
+        matched = herbs >= 0
+        lens = np.zeros(len(pres_rows), dtype=np.int64)
+        lens[matched] = self.herb_rows.lengths(herbs[matched])
+        starts = np.zeros(len(pres_rows), dtype=np.int64)
+        starts[matched] = self.herb_rows.ptr[herbs[matched]]
+        # Unmatched rows still produce one output row (left join)
+        out_lens = np.maximum(lens, 1)
+        entries = _ranges(starts, out_lens)
+        found = ~np.repeat(lens == 0, out_lens)
+        lib = np.full(len(entries), -1, dtype=np.int64)
+        lib[found] = self.herb_rows.idx[entries[found]]
+        return np.repeat(pres_rows, out_lens), lib
+
+    def flow_ids(self, pres_names):
+        """
+        The merged rows of the given prescriptions as integer-ID arrays
+        (prescription, herb, compound, target, action; -1 = missing) plus the herb Amount.
+        """
+        pres_pos, lib_pos = self.merge_positions(self.prescription_rows(pres_names))
+        found = lib_pos >= 0
+
+        def lib(row_ids):
+            out = np.full(len(lib_pos), -1, dtype=np.int64)
+            out[found] = row_ids[lib_pos[found]]
+            return out
+
+        return {
+            'prescription': self.pres_row_pres[pres_pos],
+            'herb': self.pres_row_herb[pres_pos],
+            'amount': self.pres_row_amount[pres_pos],
+            'compound': lib(self.row_compound),
+            'target': lib(self.row_target),
+            'action': lib(self.row_action),
+        }
+
+    def merged_frame(self, pres_names):
+        """
+        Equivalent of pd.merge(df_pres[isin(pres_names)], df_herb, left_on=Herb, right_on=Herb, how='left'),
+        built by slicing, so its cost is proportional to the result size.
+        """
+        pres_pos, lib_pos = self.merge_positions(self.prescription_rows(pres_names))
+        left = self.df_pres.take(pres_pos).reset_index(drop=True)
+
+        key_shared = self.col_pres_herb == self.col_herb_name
+        right_cols = [c for c in self.df_herb.columns if not (key_shared and c == self.col_herb_name)]
+        overlap = set(right_cols) & set(left.columns)
+        if overlap:
+            left = left.rename(columns={c: f"{c}_x" for c in overlap})
+        for c in right_cols:
+            left[f"{c}_y" if c in overlap else c] = pd.api.extensions.take(
+                self.df_herb[c].array, lib_pos, allow_fill=True
+            )
+        return left
+
+    def names_for(self, kind, ids):
+        names = {
+            'prescription': self.pres_names, 'herb': self.herb_names, 'compound': self.compound_names,
+            'target': self.target_names, 'action': self.action_names,
+        }[kind]
+        ids = np.asarray(ids, dtype=np.int64)
+        return names[ids[ids >= 0]].tolist()
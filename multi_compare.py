@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+LAYERS = ('herb', 'compound', 'target', 'action')
+
+# Membership bitsets are uint64: bit i = i-th selected prescription
+MAX_PRESCRIPTIONS = 64
+
+# Region kinds of a feature: reached by every selected prescription, by exactly one, or by a subset
+SHARED_ALL, EXCLUSIVE, SHARED_SUBSET = 0, 1, 2
+
+
+class MultiComparison:
+    """
+    Overlap of N prescriptions at the herb / compound / target / action level.
+
+    Every feature reached by the selection gets a membership bitset (bit i set = prescription i reaches it),
+    so each region of the overlap lattice - shared by all, exclusive to one, shared by a subset - is one
+    distinct bitset value, and all regions of a layer come out of a single np.unique over the bitsets.
+    """
+
+    def __init__(self, index, pres_names):
+        self.index = index
+        names = list(dict.fromkeys(pres_names))
+        ids = index.pres_names.get_indexer(pd.Index(names, dtype=object))
+        self.pres_names = [name for name, i in zip(names, ids) if i >= 0]
+        pres_ids = ids[ids >= 0]
+        if len(pres_ids) > MAX_PRESCRIPTIONS:
+            raise ValueError(f"At most {MAX_PRESCRIPTIONS} prescriptions can be compared, got {len(pres_ids)}")
+
+        self.flow = index.flow_ids(self.pres_names)
+        # Selection position of each merged row's prescription
+        order = np.argsort(pres_ids)
+        self.row_pos = order[np.searchsorted(pres_ids[order], self.flow['prescription'])]
+        row_bit = np.left_shift(np.uint64(1), self.row_pos.astype(np.uint64))
+
+        self.features, self.masks = {}, {}
+        for layer in LAYERS:
+            ids = self.flow[layer]
+            keep = ids >= 0
+            features, inverse = np.unique(ids[keep], return_inverse=True)
+            masks = np.zeros(len(features), dtype=np.uint64)
+            np.bitwise_or.at(masks, inverse, row_bit[keep])
+            self.features[layer], self.masks[layer] = features, masks
+
+    @property
+    def all_mask(self):
+        return np.uint64((1 << len(self.pres_names)) - 1)
+
+    def membership(self, layer):
+        """Boolean (prescription x feature) matrix of the layer; columns follow `features[layer]`."""
+        bits = np.arange(len(self.pres_names), dtype=np.uint64)[:, None]
+        return ((self.masks[layer][None, :] >> bits) & np.uint64(1)).astype(bool)
+
+    def kinds(self, layer):
+        """SHARED_ALL / EXCLUSIVE / SHARED_SUBSET per feature of the layer."""
+        masks = self.masks[layer]
+        degree = np.bitwise_count(masks)
+        return np.select([masks == self.all_mask, degree == 1], [SHARED_ALL, EXCLUSIVE], SHARED_SUBSET)
+
+    def set_sizes(self, layer):
+        """Number of features each prescription reaches, in selection order."""
+        return self.membership(layer).sum(axis=1)
+
+    def regions(self, layer):
+        """
+        Every non-empty region of the overlap lattice as a DataFrame, largest first:
+        Mask (bitset), Members (prescription names), Degree (number of members), Count, Items (feature names).
+        """
+        columns = ['Mask', 'Members', 'Degree', 'Count', 'Items']
+        if len(self.masks[layer]) == 0:
+            return pd.DataFrame(columns=columns)
+        masks, inverse, counts = np.unique(self.masks[layer], return_inverse=True, return_counts=True)
+        # Feature names grouped by region
+        names = np.asarray(self.index.names_for(layer, self.features[layer][np.argsort(inverse, kind='stable')]),
+                           dtype=object)
+        items = np.split(names, np.cumsum(counts)[:-1])
+        df = pd.DataFrame({
+            'Mask': masks,
+            'Members': self.membership_names(masks),
+            'Degree': np.bitwise_count(masks).astype(int),
+            'Count': counts,
+            'Items': [list(group) for group in items],
+        })
+        return df.sort_values(['Count', 'Degree'], ascending=False, kind='stable').reset_index(drop=True)
+
+    def membership_names(self, masks):
+        """Prescription names of each bitset."""
+        return [tuple(name for i, name in enumerate(self.pres_names) if int(mask) >> i & 1) for mask in masks]
+
+    def shared_by_all(self, layer):
+        return self.index.names_for(layer, self.features[layer][self.masks[layer] == self.all_mask])
+
+    def exclusive(self, layer, pres_name):
+        bit = np.uint64(1 << self.pres_names.index(pres_name))
+        return self.index.names_for(layer, self.features[layer][self.masks[layer] == bit])
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Layers of the mechanism graph, in flow order
+LAYERS = ('herb', 'compound', 'target', 'action')
+
+# Path highlight colors of the path Sankey
+PATH_COLOR = 'rgba(231, 76, 60, 0.6)'
+CONTEXT_COLOR = 'rgba(149, 165, 166, 0.25)'
+
+
+class PathEngine:
+    """
+    Ranked herb -> compound -> target -> action paths over the layer CSRs of a MechanismIndex.
+
+    Flow model: a herb's amount (1 for a single herb) is split across its out-edges in proportion to
+    their Herb_Library evidence rows, layer by layer, so the flow reaching a node is a sparse
+    matrix-vector product per layer and the flow of a path is its source amount times the product
+    of the split shares along it.
+
+    top_paths() is exact without enumerating every path: a backward pass gives, for every node, the
+    best share of any continuation to the destination, and the forward expansion keeps only the
+    prefixes whose best completion is among the k best - so each layer expands about k prefixes.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.names = {
+            'prescription': index.pres_names, 'herb': index.herb_names, 'compound': index.compound_names,
+            'target': index.target_names, 'action': index.action_names,
+        }
+        # Per layer transition: (CSR, source node of each entry, share of the source's flow)
+        self.edges = {}
+        for layer, csr in zip(LAYERS[:-1], (index.herb_compound, index.compound_target, index.target_action)):
+            lens = np.diff(csr.ptr)
+            src = np.repeat(np.arange(len(lens)), lens)
+            weight = np.asarray(csr.data, dtype=float)
+            total = np.bincount(src, weights=weight, minlength=len(lens))
+            self.edges[layer] = (csr, src, weight / total[src] if len(src) else weight)
+
+    def source_flow(self, kind, name):
+        """Flow entering the herb layer from a prescription (herb amounts) or a single herb (1.0)."""
+        flow = np.zeros(len(self.index.herb_names))
+        if kind == 'herb':
+            ids = self.index.herb_ids([name])
+            flow[ids] = 1.0
+            return flow
+        entries, _ = self.index.pres_herb.gather(self.index.pres_ids([name]))
+        herbs = self.index.pres_herb.idx[entries]
+        keep = herbs >= 0
+        np.add.at(flow, herbs[keep], np.nan_to_num(np.asarray(self.index.pres_herb.data[entries], dtype=float)[keep]))
+        return flow
+
+    def propagate(self, herb_flow, to='action'):
+        """Flow reaching every node of each layer up to `to`: {layer: dense array}."""
+        flows = {'herb': herb_flow}
+        for layer, nxt in zip(LAYERS[:-1], LAYERS[1:]):
+            csr, src, share = self.edges[layer]
+            flows[nxt] = np.bincount(csr.idx, weights=flows[layer][src] * share, minlength=len(self.names[nxt]))
+            if nxt == to:
+                break
+        return flows
+
+    def reached(self, kind, name, to='action'):
+        """Names of the `to` layer reached from the source, with their flow, largest first."""
+        flow = self.propagate(self.source_flow(kind, name), to)[to]
+        ids = np.flatnonzero(flow > 0)
+        ids = ids[np.lexsort((ids, -flow[ids]))]
+        return pd.DataFrame({'Name': self.names[to][ids], 'Flow': flow[ids]})
+
+    def _best_continuation(self, chain, dest):
+        """Per layer of `chain`: the largest share of a node's flow any single path carries to `dest`."""
+        best = {chain[-1]: np.zeros(len(self.names[chain[-1]]))}
+        best[chain[-1]][dest] = 1.0
+        for layer, nxt in zip(chain[-2::-1], chain[:0:-1]):
+            csr, src, share = self.edges[layer]
+            value = share * best[nxt][csr.idx]
+            out = np.zeros(csr.n_rows)
+            np.maximum.at(out, src, value)
+            best[layer] = out
+        return best
+
+    def top_paths(self, kind, name, dest_kind, dest_name, k=10):
+        """
+        The k paths carrying the most flow from a prescription / herb (`kind`, `name`) to an action
+        or target (`dest_kind`, `dest_name`).
+        Returns a DataFrame with one column per layer, Flow and Share (of all flow reaching the destination).
+        """
+        chain = list(LAYERS[:LAYERS.index(dest_kind) + 1])
+        columns = [self.index_column(layer) for layer in chain] + ['Flow', 'Share']
+        dest = self.names[dest_kind].get_indexer([dest_name])[0]
+        if dest < 0 or k <= 0:
+            return pd.DataFrame(columns=columns)
+
+        herb_flow = self.source_flow(kind, name)
+        best = self._best_continuation(chain, dest)
+        total = self.propagate(herb_flow, dest_kind)[dest_kind][dest]
+
+        def prune(paths, flow, layer):
+            bound = flow * best[layer][paths[-1]]
+            keep = bound > 0
+            paths, flow, bound = paths[:, keep], flow[keep], bound[keep]
+            if len(bound) > k:
+                # Every kept prefix completes to a distinct path worth its bound, so the k-th largest bound
+                # is a lower bound of the k-th best path: prefixes below it cannot contribute
+                keep = bound >= np.partition(bound, len(bound) - k)[len(bound) - k]
+                paths, flow = paths[:, keep], flow[keep]
+            return paths, flow
+
+        herbs = np.flatnonzero(herb_flow > 0)
+        paths, flow = prune(herbs[None, :], herb_flow[herbs], 'herb')
+        for layer, nxt in zip(chain[:-1], chain[1:]):
+            csr, _, share = self.edges[layer]
+            entries, owner = csr.gather(paths[-1])
+            paths = np.vstack([paths[:, owner], csr.idx[entries][None, :]])
+            paths, flow = prune(paths, flow[owner] * share[entries], nxt)
+
+        order = np.lexsort((*paths[::-1], -flow))[:k]
+        result = {self.index_column(layer): self.names[layer][paths[i, order]] for i, layer in enumerate(chain)}
+        result['Flow'] = flow[order]
+        result['Share'] = flow[order] / total if total > 0 else np.zeros(len(order))
+        return pd.DataFrame(result, columns=columns)
+
+    def index_column(self, layer):
+        return {
+            'herb': self.index.col_herb_name, 'compound': self.index.col_herb_ing,
+            'target': self.index.col_herb_target, 'action': self.index.col_herb_loop,
+        }[layer]
+
+
+def generate_path_sankey(paths, highlight, title=None):
+    """
+    Sankey of ranked paths (a top_paths frame): the first `highlight` paths in color, the rest as grey context.
+    A link shared by several paths carries their summed flow and is highlighted if any highlighted path uses it.
+    """
+    layer_cols = [c for c in paths.columns if c not in ('Flow', 'Share')]
+    labels, node_ids = [], {}
+    for col in layer_cols:
+        for value in pd.unique(paths[col]):
+            node_ids[(col, value)] = len(labels)
+            labels.append(value)
+
+    links = {}
+    for rank, row in enumerate(paths[layer_cols + ['Flow']].itertuples(index=False)):
+        for i in range(len(layer_cols) - 1):
+            key = (node_ids[(layer_cols[i], row[i])], node_ids[(layer_cols[i + 1], row[i + 1])])
+            flow, lit = links.get(key, (0.0, False))
+            links[key] = (flow + row[-1], lit or rank < highlight)
+
+    fig = go.Figure(data=[go.Sankey(
+        node=dict(label=labels, pad=15, thickness=15, line=dict(color="rgba(0,0,0,0.2)", width=0.5)),
+        link=dict(
+            source=[s for s, _ in links],
+            target=[t for _, t in links],
+            value=[flow for flow, _ in links.values()],
+            color=[PATH_COLOR if lit else CONTEXT_COLOR for _, lit in links.values()],
+            hovertemplate="Path Flow: %{value:.3g}<extra></extra>"
+        )
+    )])
+    fig.update_layout(
+        title_text=title,
+        font_size=12,
+        height=max(400, 22 * len(labels) // max(len(layer_cols), 1) + 200),
+        margin=dict(l=40, r=40, t=80, b=40),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig
@@ -0,0 +1,208 @@
+"""
+Lightweight timing spans for the dashboard hot paths.
+
+Spans are collected per Streamlit rerun (`start_run` / `finish_run`) and can be appended to a JSONL
+log (`HERB_PERF_LOG`) for offline p50/p95 analysis:
+
+    python perf.py perf.jsonl
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Append every collected rerun to this JSONL file (off when unset)
+LOG_PATH = os.environ.get("HERB_PERF_LOG") or None
+
+# The run being collected in this script thread (None = disabled, spans are no-ops)
+_current = contextvars.ContextVar("perf_run", default=None)
+_log_lock = threading.Lock()
+
+
+class Run:
+    """Spans of one rerun, in start order once finished."""
+
+    def __init__(self, panel=False, **meta):
+        self.meta = meta
+        self.panel = panel  # shown in the debug panel (not only logged)
+        self.spans = []
+        self.depth = 0
+        self.started = time.perf_counter()
+        self.total_s = None
+
+    def to_dict(self):
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            **self.meta,
+            'total_s': self.total_s,
+            'spans': self.spans,
+        }
+
+
+class _Span:
+    __slots__ = ('run', 'name', 'fields', 'start', 'depth')
+    enabled = True
+
+    def __init__(self, run, name, fields):
+        self.run = run
+        self.name = name
+        self.fields = fields
+
+    def note(self, **fields):
+        """Attaches row counts, payload sizes, etc. to the span."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.depth = self.run.depth
+        self.run.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.run.depth -= 1
+        span = {
+            'name': self.name,
+            'depth': self.depth,
+            'start_s': self.start - self.run.started,
+            'seconds': end - self.start,
+            **self.fields,
+        }
+        if exc_type is not None:
+            span['error'] = exc_type.__name__
+        self.run.spans.append(span)
+        return False
+
+
+class _NullSpan:
+    """Shared no-op span used while collection is off."""
+    __slots__ = ()
+    enabled = False
+
+    def note(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def start_run(enabled=False, **meta):
+    """Starts collecting spans for this rerun when `enabled` or a JSONL log is configured."""
+    run = Run(panel=enabled, **meta) if (enabled or LOG_PATH) else None
+    _current.set(run)
+    return run
+
+
+def finish_run(log_path=None):
+    """Stops collection; appends the run to the JSONL log if configured. Returns the Run (or None)."""
+    run = _current.get()
+    _current.set(None)
+    if run is None:
+        return None
+    run.total_s = time.perf_counter() - run.started
+    run.spans.sort(key=lambda s: s['start_s'])
+    log_path = log_path or LOG_PATH
+    if log_path:
+        line = json.dumps(run.to_dict(), default=str)
+        with _log_lock, open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+    return run
+
+
+def enabled():
+    """True while spans of the current rerun are being collected."""
+    return _current.get() is not None
+
+
+def panel_open():
+    """True while the current rerun's spans are shown in the debug panel, not only logged."""
+    run = _current.get()
+    return run is not None and run.panel
+
+
+def span(name, **fields):
+    """Context manager timing a block: `with span('load_data') as s: ...; s.note(rows=n)`."""
+    run = _current.get()
+    if run is None:
+        return _NULL_SPAN
+    return _Span(run, name, fields)
+
+
+def timed(name=None):
+    """
+    Decorator timing every call of a function as a span named `name` (default: its qualified name).
+    DataFrame results are annotated with their row count.
+    """
+    def decorator(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _current.get()
+            if run is None:
+                return fn(*args, **kwargs)
+            with _Span(run, label, {}) as s:
+                result = fn(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    s.note(rows=len(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def spans_frame(run):
+    """The spans of a Run as a DataFrame for display (indented names, milliseconds)."""
+    if run is None or not run.spans:
+        return pd.DataFrame(columns=['Span', 'ms'])
+    df = pd.DataFrame(run.spans)
+    out = pd.DataFrame({
+        'Span': [" " * d + n for d, n in zip(df['depth'], df['name'])],
+        'ms': (df['seconds'] * 1000).round(1),
+    })
+    for col in ['rows', 'bytes']:
+        if col in df.columns:
+            out[col] = df[col].astype('Int64')
+    if 'error' in df.columns:
+        out['error'] = df['error']
+    return out
+
+
+def summarize(path):
+    """Per-span count / p50 / p95 / max in milliseconds over every run of a JSONL log."""
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            run = json.loads(line)
+            rows.append({'name': '(rerun total)', 'seconds': run['total_s']})
+            rows.extend({'name': s['name'], 'seconds': s['seconds']} for s in run['spans'])
+    if not rows:
+        return pd.DataFrame(columns=['count', 'p50_ms', 'p95_ms', 'max_ms'])
+    ms = pd.DataFrame(rows).assign(ms=lambda d: d['seconds'] * 1000).groupby('name')['ms']
+    out = pd.DataFrame({
+        'count': ms.size(),
+        'p50_ms': ms.quantile(0.5),
+        'p95_ms': ms.quantile(0.95),
+        'max_ms': ms.max(),
+    })
+    return out.sort_values('p95_ms', ascending=False).round(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    print(summarize(sys.argv[1]).to_string())
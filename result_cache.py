@@ -0,0 +1,217 @@
+import functools
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from plotly.basedatatypes import BaseFigure
+
+# Default budget of the process-wide cache shared by all Streamlit sessions
+DEFAULT_MAX_BYTES = int(float(os.environ.get("HERB_RESULT_CACHE_MB", "256")) * 1024 * 1024)
+
+# Dataset versions whose entries are kept at once: sessions on a pinned / previous version and sessions
+# on the newest one must not keep evicting each other
+MAX_VERSIONS = 2
+
+
+def estimate_size(obj):
+    """Approximate resident size in bytes of a cached result (frames, figures, arrays, containers)."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(index=True, deep=True)))
+    if isinstance(obj, BaseFigure):
+        return estimate_size(obj.to_plotly_json())
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(estimate_size(v) for v in obj.ravel())
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def isolate(value):
+    """
+    A copy of a cached result that one session can modify without changing it for the others, as
+    st.cache_data does: figures are copied, frames shallow-copied (copy-on-write), arrays copied and
+    containers copied element-wise.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, BaseFigure):
+        # Built from a dict: Figure(fig) is not safe while other sessions copy the same figure
+        return value.__class__(value.to_dict())
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: isolate(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(isolate(v) for v in value)
+    return value
+
+
+class ResultCache:
+    """
+    Size-aware LRU cache for analyzer results, shared across sessions.
+
+    Keys start with the dataset version: entries of the `max_versions` most recently used versions are
+    kept, and the first lookup with a newer one drops the oldest, so a data refresh invalidates results
+    automatically. `migrate` instead carries the entries a refresh did not affect over to the new version.
+    Lookups return copies (see isolate), so callers may modify what they get.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, sizeof=estimate_size, max_versions=MAX_VERSIONS):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.max_versions = max_versions
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self._versions = []  # kept versions, most recently used last
+        self._retired = set()  # versions migrated away from; lookups with them bypass the cache
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _use_version(self, version):
+        # Caller holds the lock. Returns False for retired versions (sessions still rendering
+        # the previous dataset), which must neither read nor purge the migrated entries.
+        if version in self._retired:
+            return False
+        if version in self._versions:
+            self._versions.remove(version)
+        self._versions.append(version)
+        while len(self._versions) > self.max_versions:
+            oldest = self._versions.pop(0)
+            for key in [k for k in self._entries if k[0] == oldest]:
+                self.total_bytes -= self._entries.pop(key)[1]
+        return True
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key) if self._use_version(key[0]) else None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[0]
+        return isolate(value)
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if not self._use_version(key[0]) or size > self.max_bytes:
+                return value
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            # Computed outside the lock so slow figures do not block other sessions' hits
+            value = isolate(self.put(key, compute()))
+        return value
+
+    def migrate(self, old_version, new_version, keep):
+        """
+        Re-keys the entries of `old_version` for which `keep(key)` is true to `new_version`
+        and drops the rest. Returns (kept, dropped) entry counts.
+        """
+        kept = dropped = 0
+        with self._lock:
+            entries = OrderedDict()
+            for key, (value, size) in self._entries.items():
+                if key[0] == old_version and keep(key):
+                    entries[(new_version,) + key[1:]] = (value, size)
+                    kept += 1
+                else:
+                    self.total_bytes -= size
+                    dropped += 1
+            self._entries = entries
+            self._versions = [new_version]
+            self._retired.add(old_version)
+            self._retired.discard(new_version)
+        return kept, dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'version': self._versions[-1] if self._versions else None,
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """The process-wide ResultCache (every Streamlit session of this server uses the same one)."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache()
+        return _shared_cache
+
+
+# cached_result methods whose results hold integer IDs into the dataset's MechanismIndex. A new dataset
+# version renumbers them whenever a name is added or removed, so these entries must not be migrated.
+INDEX_ID_RESULTS = set()
+
+
+def key_values(key):
+    """The instance attribute and call argument values of a `cached_result` key."""
+    _, _, attr_values, call_args = key
+    return tuple(attr_values) + tuple(value for _, value in call_args)
+
+
+def cached_result(*attrs, index_ids=False):
+    """
+    Caches a PrescriptionAnalyzer method in `self.cache`, keyed by
+    (dataset version, method name, the named instance attributes, call arguments).
+    Analyzers without a cache or without a dataset version compute directly.
+    index_ids=True marks results holding MechanismIndex IDs (see INDEX_ID_RESULTS).
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        if index_ids:
+            INDEX_ID_RESULTS.add(fn.__name__)
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if self.cache is None or self.dataset_version is None:
+                return fn(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            call_args = tuple(bound.arguments.items())[1:]
+            key = (self.dataset_version, fn.__name__, tuple(getattr(self, a) for a in attrs), call_args)
+            return self.cache.get_or_compute(key, lambda: fn(self, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from mechanism_index import CSR
+
+KINDS = ('target', 'action', 'compound', 'herb')
+
+
+class ReverseIndex:
+    """
+    Inverted indexes from Target_Protein / Core_Action / Compound_Name / Herb_Name to the herbs and
+    prescriptions that reach them, built once from a MechanismIndex.
+
+    - feature -> herb CSR per kind (data = number of Herb_Library evidence rows; a herb reaches itself)
+    - herb -> prescription CSR (data = Amount of the herb in the prescription)
+    A lookup walks the two hops for the requested features only, so its cost is
+    proportional to the answer, not to the library.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        n_herb, n_pres = len(index.herb_names), len(index.pres_names)
+        self.names = {
+            'target': index.target_names,
+            'action': index.action_names,
+            'compound': index.compound_names,
+            'herb': index.herb_names,
+        }
+        row_ids = {'target': index.row_target, 'action': index.row_action, 'compound': index.row_compound}
+        self.feature_herb = {
+            kind: CSR.unique_edges(row_ids[kind], index.row_herb, len(self.names[kind]), n_herb)
+            for kind in row_ids
+        }
+        herb_rows = np.bincount(index.row_herb[index.row_herb >= 0], minlength=n_herb)
+        self.feature_herb['herb'] = CSR(np.arange(n_herb + 1), np.arange(n_herb), herb_rows)
+        self.herb_pres = CSR.from_pairs(index.pres_row_herb, index.pres_row_pres, n_herb,
+                                        data=np.nan_to_num(index.pres_row_amount))
+        # Total herb mass per prescription, for contribution shares
+        keep = index.pres_row_pres >= 0
+        self.pres_total = np.bincount(index.pres_row_pres[keep], weights=np.nan_to_num(index.pres_row_amount[keep]),
+                                      minlength=n_pres)
+        # Lower-cased names, so match() does not re-lower a whole dictionary on every rerun
+        self.lowered = {kind: np.asarray(names.str.lower(), dtype=object) for kind, names in self.names.items()}
+
+    def match(self, kind, text, limit=None):
+        """Feature names of `kind` containing `text` (case-insensitive), exact matches first."""
+        names = self.names[kind]
+        text = (text or '').strip().lower()
+        if not text:
+            found = names
+        else:
+            lowered = self.lowered[kind]
+            hits = np.fromiter((text in name for name in lowered), dtype=bool, count=len(lowered))
+            exact = lowered == text
+            found = names[np.concatenate([np.flatnonzero(exact), np.flatnonzero(hits & ~exact)])]
+        found = found.tolist()
+        return found[:limit] if limit else found
+
+    def lookup(self, kind, feature_names):
+        """
+        Prescriptions and herbs reaching any of `feature_names` (of `kind`).
+
+        Returns (prescriptions, herbs):
+        - prescriptions: Prescription_Name, Contribution (summed Amount of the herbs that reach the features),
+          Share (Contribution / total prescription amount), Herb_Count, Herbs; ranked by Contribution
+        - herbs: Herb_Name, Evidence_Rows (library rows linking herb and features), Prescriptions; ranked
+        """
+        names = self.names[kind]
+        fids = names.get_indexer(pd.Index(list(feature_names), dtype=object))
+        fids = np.unique(fids[fids >= 0])
+
+        f2h = self.feature_herb[kind]
+        entries, _ = f2h.gather(fids)
+        herb_ids, inverse = np.unique(f2h.idx[entries], return_inverse=True)
+        evidence = np.bincount(inverse, weights=f2h.data[entries], minlength=len(herb_ids)).astype(int)
+
+        entries, owner = self.herb_pres.gather(herb_ids)
+        pres_ids = self.herb_pres.idx[entries]
+        keep = pres_ids >= 0
+        pres_ids, pres_herb, amounts = pres_ids[keep], herb_ids[owner][keep], self.herb_pres.data[entries][keep]
+
+        n_pres, n_herb = len(self.index.pres_names), len(self.index.herb_names)
+        contribution = np.bincount(pres_ids, weights=amounts, minlength=n_pres)
+        # Distinct reaching herbs per prescription, in name order
+        reached = CSR.unique_edges(pres_ids, pres_herb, n_pres, n_herb)
+        hit = np.flatnonzero(reached.lengths(np.arange(n_pres)) > 0)
+        herb_names = np.asarray(self.index.herb_names, dtype=object)[reached.idx]
+        totals = self.pres_total[hit]
+        prescriptions = pd.DataFrame({
+            'Prescription_Name': self.index.pres_names[hit],
+            'Contribution': contribution[hit],
+            'Share': np.divide(contribution[hit], totals, out=np.zeros(len(hit)), where=totals > 0),
+            'Herb_Count': reached.lengths(hit),
+            'Herbs': [", ".join(herb_names[a:b]) for a, b in zip(reached.ptr[hit], reached.ptr[hit + 1])],
+        })
+        prescriptions = prescriptions.sort_values(['Contribution', 'Share', 'Prescription_Name'],
+                                                  ascending=[False, False, True]).reset_index(drop=True)
+
+        herbs = pd.DataFrame({
+            'Herb_Name': self.index.herb_names[herb_ids],
+            'Evidence_Rows': evidence,
+            'Prescriptions': np.bincount(reached.idx, minlength=n_herb)[herb_ids],
+        })
+        herbs = herbs.sort_values(['Prescriptions', 'Evidence_Rows', 'Herb_Name'],
+                                  ascending=[False, False, True]).reset_index(drop=True)
+        return prescriptions, herbs
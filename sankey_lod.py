@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+
+# Payload budget of the deep Sankey: nodes / links sent to the browser (None = no folding)
+NODE_BUDGET = int(os.environ.get("HERB_SANKEY_NODES", 150))
+LINK_BUDGET = int(os.environ.get("HERB_SANKEY_LINKS", 600))
+
+# Layers whose long tail is folded into one "Other (k items)" node
+FOLD_LAYERS = ('compound', 'target', 'action')
+
+# ID of a layer's "Other" node: sorts after every real ID, so it is the layer's last node
+OTHER = np.iinfo(np.int64).max
+OTHER_NODE_COLOR = '#95A5A6'  # Grey
+
+# Share of the kept items dropped per step while the link count is over budget
+_SHRINK = 0.7
+
+
+def ranked(ids, amount):
+    """The layer's non-missing IDs by descending flow volume (summed amount), ties by ID."""
+    keep = ids >= 0
+    uniq, inverse = np.unique(ids[keep], return_inverse=True)
+    volume = np.bincount(inverse, weights=np.nan_to_num(amount[keep]), minlength=len(uniq))
+    return uniq[np.lexsort((uniq, -volume))]
+
+
+def _fold(ids, kept):
+    out = ids.copy()
+    out[(ids >= 0) & ~np.isin(ids, kept)] = OTHER
+    return out
+
+
+def _n_links(flow, chain):
+    """Distinct (source, target) pairs between consecutive layers of `chain`."""
+    total = 0
+    for src_key, tgt_key in zip(chain[:-1], chain[1:]):
+        src, tgt = flow[src_key], flow[tgt_key]
+        keep = (src >= 0) & (tgt >= 0)
+        _, s = np.unique(src[keep], return_inverse=True)
+        t_nodes, t = np.unique(tgt[keep], return_inverse=True)
+        total += len(np.unique(s * max(len(t_nodes), 1) + t))
+    return total
+
+
+def _split(counts, room):
+    """
+    Shares `room` nodes across layers evenly; small layers pass what they do not need to the rest.
+    Every layer keeps at least one item so a drill-down always makes progress.
+    """
+    share = {}
+    for i, layer in enumerate(sorted(counts, key=counts.get)):
+        share[layer] = min(counts[layer], max(room // (len(counts) - i), 1))
+        room -= share[layer]
+    return share
+
+
+def fold_flow(flow, node_budget=NODE_BUDGET, link_budget=LINK_BUDGET, drill=(),
+              chain=('prescription', 'herb', 'compound', 'target', 'action')):
+    """
+    Level of detail for a deep flow (`MechanismIndex.flow_ids` arrays).
+
+    Keeps the top compounds / targets / actions by flow volume and maps the rest of each layer to a
+    single OTHER ID, so aggregating the folded arrays conserves every layer's flow total. The number
+    kept per layer is chosen so the graph has at most `node_budget` nodes and at most `link_budget`
+    links, down to one kept item per layer; prescription and herb nodes are never folded.
+
+    `drill` is a path of layers, e.g. ('compound', 'target'): each step restricts the rows to those
+    passing through that layer's "Other" bucket at the previous level and folds again, so a bucket
+    is expanded by re-aggregating the same rows rather than rebuilding the flow.
+
+    Returns (folded flow, buckets): buckets maps each folded layer to its OTHER members by volume.
+    """
+    for step in drill:
+        _, buckets = fold_flow(flow, node_budget, link_budget, chain=chain)
+        if step not in buckets:
+            break
+        rows = np.isin(flow[step], buckets[step])
+        flow = {key: values[rows] for key, values in flow.items()}
+
+    if node_budget is None:
+        return flow, {}
+
+    order = {layer: ranked(flow[layer], flow['amount']) for layer in FOLD_LAYERS if layer in flow}
+    fixed = sum(len(np.unique(flow[key][flow[key] >= 0])) for key in chain if key not in order)
+    keep = {layer: len(ids) for layer, ids in order.items()}
+    if fixed + sum(keep.values()) > node_budget:
+        keep = _split(keep, node_budget - fixed - len(order))
+
+    def folded(keep):
+        out = dict(flow)
+        for layer, ids in order.items():
+            if keep[layer] < len(ids):
+                out[layer] = _fold(flow[layer], np.sort(ids[:keep[layer]]))
+        return out
+
+    out = folded(keep)
+    while link_budget is not None and _n_links(out, chain) > link_budget and max(keep.values(), default=0) > 1:
+        largest = max(keep, key=keep.get)
+        keep[largest] = max(1, int(keep[largest] * _SHRINK))
+        out = folded(keep)
+
+    buckets = {layer: ids[keep[layer]:] for layer, ids in order.items() if keep[layer] < len(ids)}
+    return out, buckets
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from mechanism_index import CSR
+from search_index import _ngrams, normalize
+
+COLUMNS = ['Prescription_Name', 'Symptom_Status', 'Explanation']
+
+
+def name_key(name):
+    """Matching form of a prescription name: normalized, with whitespace dropped ('쌍화 탕' == '쌍화탕')."""
+    return normalize(name).replace(" ", "")
+
+
+def _bigrams(texts):
+    """
+    (text position, bigram code) of every distinct bigram of the texts. Texts get one trailing space, so every
+    character starts a bigram.
+    """
+    return _ngrams([f"{text} " for text in texts], 2)
+
+
+class ScriptIndex:
+    """
+    Prescription_script (clinical indications) indexed once per dataset version.
+
+    - lookup(): a prescription's (Symptom_Status, Explanation) rows by normalized name, so names that drift
+      in whitespace, case or compatibility Hanja between the sheet tabs still match. Given the
+      Prescription_Input names, script rows are listed under the matching one.
+    - search(): full-text search over Symptom_Status / Explanation. A bigram -> row CSR narrows a query to
+      the rows holding all of its bigrams (Korean symptom terms are often two syllables), and only those
+      are checked for the actual substrings
+    """
+
+    def __init__(self, df_script, pres_names=()):
+        df = pd.DataFrame(columns=COLUMNS) if df_script is None else df_script
+        df = df[[c for c in COLUMNS if c in df.columns]].reindex(columns=COLUMNS).dropna(subset=['Prescription_Name'])
+        names = df['Prescription_Name'].astype(str).to_numpy(dtype=object)
+        keys = np.fromiter((name_key(n) for n in names), dtype=object, count=len(names))
+        order = np.argsort(keys, kind='stable')
+        canonical = {name_key(n): n for n in pres_names}
+        names = np.fromiter((canonical.get(k, n) for k, n in zip(keys, names)), dtype=object, count=len(names))
+
+        self.rows = pd.DataFrame({
+            'Prescription_Name': names[order],
+            'Symptom_Status': df['Symptom_Status'].fillna("").astype(str).to_numpy(dtype=object)[order],
+            'Explanation': df['Explanation'].fillna("").astype(str).to_numpy(dtype=object)[order],
+        }, columns=COLUMNS)
+        # Row range of every distinct name key
+        self.keys, starts = np.unique(keys[order], return_index=True) if len(keys) else (keys, keys)
+        self.ptr = np.append(np.asarray(starts, dtype=np.int64), len(self.rows))
+
+        self.symptom_text = [normalize(s) for s in self.rows['Symptom_Status']]
+        self.text = [f"{s} {normalize(e)}" for s, e in zip(self.symptom_text, self.rows['Explanation'])]
+        owner, codes = _bigrams(self.text)
+        self.grams, gram_ids = np.unique(codes, return_inverse=True)
+        self.postings = CSR.from_pairs(gram_ids, owner, len(self.grams))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, pres_name):
+        """Symptom_Status / Explanation rows of a prescription (empty if it has no script)."""
+        key = name_key(pres_name)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.rows.iloc[:0, 1:]
+        return self.rows.iloc[self.ptr[i]:self.ptr[i + 1], 1:]
+
+    def _rows_with(self, word):
+        """Rows whose text holds every bigram of `word`."""
+        _, codes = _bigrams([word])
+        # The trailing-space bigram of a single character is not required: it matches inside words too
+        if len(word) == 1:
+            low = codes[0] & ~((1 << 21) - 1)
+            gram_ids = np.arange(np.searchsorted(self.grams, low), np.searchsorted(self.grams, low + (1 << 21)))
+            entries, _ = self.postings.gather(gram_ids)
+            return np.unique(self.postings.idx[entries])
+        codes = codes[(codes & ((1 << 21) - 1)) != ord(" ")]
+        gram_ids = np.minimum(np.searchsorted(self.grams, codes), max(len(self.grams) - 1, 0))
+        if len(self.grams) == 0 or not (self.grams[gram_ids] == codes).all():
+            return np.zeros(0, dtype=np.int64)
+        entries, _ = self.postings.gather(gram_ids)
+        rows, hits = np.unique(self.postings.idx[entries], return_counts=True)
+        return rows[hits == len(codes)]
+
+    def search(self, text, limit=50):
+        """
+        Script rows containing every word of `text` (normalized substring match), symptom matches first.
+        Returns a DataFrame with Prescription_Name, Symptom_Status and Explanation.
+        """
+        words = normalize(text).split()
+        if not words or len(self.rows) == 0:
+            return self.rows.iloc[:0]
+        rows = None
+        for word in words:
+            found = self._rows_with(word)
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+        hits = [(-sum(w in self.symptom_text[r] for w in words), r) for r in rows.tolist()
+                if all(w in self.text[r] for w in words)]
+        ranked = [r for _, r in sorted(hits)[:limit]]
+        return self.rows.iloc[ranked].reset_index(drop=True)
@@ -0,0 +1,189 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from mechanism_index import CSR
+
+KINDS = ('prescription', 'herb', 'compound', 'target')
+
+# Candidates (by trigram overlap) re-scored exactly per query
+CANDIDATES = 256
+# Fuzzy matches below this trigram similarity (Dice) are dropped
+MIN_SIMILARITY = 0.3
+
+# Hangul syllables are searched as the jamo typed for them, so partially typed syllables ('쌍ㅎ') and
+# compound vowels / final clusters typed in steps still match. Compatibility jamo (U+3131...) throughout.
+_INITIALS = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_VOWELS = ["ㅏ", "ㅐ", "ㅑ", "ㅒ", "ㅓ", "ㅔ", "ㅕ", "ㅖ", "ㅗ", "ㅗㅏ", "ㅗㅐ", "ㅗㅣ", "ㅛ", "ㅜ", "ㅜㅓ", "ㅜㅔ",
+           "ㅜㅣ", "ㅠ", "ㅡ", "ㅡㅣ", "ㅣ"]
+_FINALS = ["", "ㄱ", "ㄲ", "ㄱㅅ", "ㄴ", "ㄴㅈ", "ㄴㅎ", "ㄷ", "ㄹ", "ㄹㄱ", "ㄹㅁ", "ㄹㅂ", "ㄹㅅ", "ㄹㅌ", "ㄹㅍ",
+           "ㄹㅎ", "ㅁ", "ㅂ", "ㅂㅅ", "ㅅ", "ㅆ", "ㅇ", "ㅈ", "ㅊ", "ㅋ", "ㅌ", "ㅍ", "ㅎ"]
+# Revised Romanization, letter by letter (no sound-change rules)
+_ROMAN_INITIALS = ["g", "kk", "n", "d", "tt", "r", "m", "b", "pp", "s", "ss", "", "j", "jj", "ch", "k", "t", "p", "h"]
+_ROMAN_VOWELS = ["a", "ae", "ya", "yae", "eo", "e", "yeo", "ye", "o", "wa", "wae", "oe", "yo", "u", "wo", "we",
+                 "wi", "yu", "eu", "ui", "i"]
+_ROMAN_FINALS = ["", "k", "k", "k", "n", "n", "n", "t", "l", "k", "m", "l", "l", "l", "p", "l", "m", "p", "p", "t",
+                 "t", "ng", "t", "t", "k", "t", "p", "t"]
+
+
+def _syllable_table(initials, vowels, finals):
+    table = {}
+    for i, initial in enumerate(initials):
+        for v, vowel in enumerate(vowels):
+            for f, final in enumerate(finals):
+                table[0xAC00 + (i * 21 + v) * 28 + f] = initial + vowel + final
+    return table
+
+
+_JAMO = _syllable_table(_INITIALS, _VOWELS, _FINALS)
+# Standalone compound jamo typed as one key are split like the syllables' ones
+_JAMO.update({ord(jamo): split for jamo, split in zip("ㅘㅙㅚㅝㅞㅟㅢ", ["ㅗㅏ", "ㅗㅐ", "ㅗㅣ", "ㅜㅓ", "ㅜㅔ", "ㅜㅣ", "ㅡㅣ"])})
+_JAMO.update({ord(jamo): split for jamo, split in zip("ㄳㄵㄶㄺㄻㄼㄽㄾㄿㅀㅄ",
+                                                      ["ㄱㅅ", "ㄴㅈ", "ㄴㅎ", "ㄹㄱ", "ㄹㅁ", "ㄹㅂ", "ㄹㅅ", "ㄹㅌ", "ㄹㅍ", "ㄹㅎ", "ㅂㅅ"])})
+# NFKC turns compatibility jamo into conjoining ones (U+1100...): back to the compatibility forms
+_JAMO.update({ord(unicodedata.normalize("NFKC", chr(c))): _JAMO.get(c, chr(c)) for c in range(0x3131, 0x3164)})
+_ROMAN = _syllable_table(_ROMAN_INITIALS, _ROMAN_VOWELS, _ROMAN_FINALS)
+_HANGUL = re.compile(r"[가-힣]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """
+    Search form of a name: NFKC (full-width forms, compatibility Hanja), case-folded, punctuation and
+    whitespace runs collapsed to single spaces.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def jamo(text):
+    """Normalized text with every Hangul syllable spelled out as its jamo ('쌍화' -> 'ㅆㅏㅇㅎㅗㅏ')."""
+    return normalize(text).translate(_JAMO)
+
+
+def romanize(text):
+    """Normalized text with Hangul in Revised Romanization ('쌍화탕' -> 'ssanghwatang')."""
+    return normalize(text).translate(_ROMAN)
+
+
+def _ngrams(texts, n):
+    """
+    (text position, n-gram code) of every distinct n-gram (n <= 3) of the texts, fully vectorized: an n-gram is
+    packed into one int64 as n 21-bit code points. Callers pad the texts as their matching needs.
+    """
+    lens = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    chars = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    starts = np.cumsum(lens) - lens
+    counts = np.maximum(lens - (n - 1), 0)
+    owner = np.repeat(np.arange(len(texts)), counts)
+    pos = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+    codes = np.zeros(len(pos), dtype=np.int64)
+    for i in range(n):
+        codes = (codes << 21) | chars[pos + i]
+    # Each n-gram once per text
+    order = np.lexsort((codes, owner))
+    owner, codes = owner[order], codes[order]
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = (owner[1:] != owner[:-1]) | (codes[1:] != codes[:-1])
+    return owner[first], codes[first]
+
+
+def _trigrams(keys):
+    """(key position, trigram code) of every distinct trigram of the space-padded keys."""
+    return _ngrams([f" {key} " for key in keys], 3)
+
+
+class SearchIndex:
+    """
+    Fuzzy name search over prescriptions, herbs, compounds and targets, built once from a MechanismIndex.
+
+    Every name is indexed under its jamo form and, if it contains Hangul, its romanization, so '쌍화',
+    '쌍ㅎ' and 'ssanghwa' all find 쌍화탕. Keys are split into trigrams; a trigram -> key CSR over the sorted
+    trigram codes gives the candidates of a query from its own trigrams only, and just the best
+    CANDIDATES of those are scored exactly (exact > prefix > word start > substring > trigram similarity).
+    """
+
+    def __init__(self, index):
+        names = {
+            'prescription': index.pres_names[index.pres_rows.lengths(np.arange(len(index.pres_names))) > 0],
+            'herb': index.herb_names,
+            'compound': index.compound_names,
+            'target': index.target_names,
+        }
+        # Sorted selectbox options, computed once instead of on every rerun
+        self.options = {kind: values.tolist() for kind, values in names.items()}
+        self.entry_kind = np.concatenate([np.full(len(names[kind]), k, dtype=np.int8) for k, kind in enumerate(KINDS)])
+        self.entry_name = np.concatenate([np.asarray(names[kind], dtype=object) for kind in KINDS])
+
+        keys, key_entry = [], []
+        for entry, name in enumerate(self.entry_name):
+            keys.append(jamo(name))
+            key_entry.append(entry)
+            if _HANGUL.search(name):
+                keys.append(romanize(name))
+                key_entry.append(entry)
+        self.keys = np.asarray(keys, dtype=object)
+        self.key_entry = np.asarray(key_entry, dtype=np.int64)
+
+        owner, codes = _trigrams(keys)
+        self.key_grams = np.bincount(owner, minlength=len(keys))
+        self.grams, gram_ids = np.unique(codes, return_inverse=True)
+        self.postings = CSR.from_pairs(gram_ids, owner, len(self.grams))
+
+    def __len__(self):
+        return len(self.entry_name)
+
+    def _candidates(self, query):
+        """Key positions sharing trigrams with `query`, best trigram similarity (Dice) first, and that similarity."""
+        _, codes = _trigrams([query])
+        # A query without a complete trigram (one letter) matches the word starts it begins
+        if len(codes) == 1 and len(query) == 1:
+            low = codes[0] & ~((1 << 21) - 1)
+            gram_ids = np.arange(np.searchsorted(self.grams, low), np.searchsorted(self.grams, low + (1 << 21)))
+        else:
+            gram_ids = np.minimum(np.searchsorted(self.grams, codes), max(len(self.grams) - 1, 0))
+            gram_ids = gram_ids[self.grams[gram_ids] == codes] if len(self.grams) else gram_ids[:0]
+        entries, _ = self.postings.gather(gram_ids)
+        keys, hits = np.unique(self.postings.idx[entries], return_counts=True)
+        dice = 2 * hits / (len(codes) + self.key_grams[keys])
+        top = np.argsort(-dice, kind='stable')[:CANDIDATES]
+        return keys[top], dice[top]
+
+    def search(self, text, limit=10, kinds=KINDS):
+        """
+        Names matching `text`, best first. Returns a DataFrame with Kind, Name and Score (1 = exact match).
+        """
+        query = jamo(text)
+        columns = ['Kind', 'Name', 'Score']
+        if not query:
+            return pd.DataFrame(columns=columns)
+
+        keys, dice = self._candidates(query)
+        scores = np.empty(len(keys))
+        for i, (key, similarity) in enumerate(zip(self.keys[keys], dice)):
+            coverage = len(query) / len(key)
+            if key == query:
+                scores[i] = 1.0
+            elif key.startswith(query):
+                scores[i] = 0.8 + 0.2 * coverage
+            elif f" {query}" in f" {key}":
+                scores[i] = 0.6 + 0.2 * coverage
+            elif query in key:
+                scores[i] = 0.5 + 0.2 * coverage
+            else:
+                scores[i] = 0.5 * similarity if similarity >= MIN_SIMILARITY else 0.0
+
+        # An entry found under both its jamo and romanized key counts once, with its better score
+        best = {}
+        wanted = {KINDS.index(kind) for kind in kinds}
+        for entry, score in zip(self.key_entry[keys].tolist(), scores.tolist()):
+            if score > 0 and self.entry_kind[entry] in wanted and score > best.get(entry, 0):
+                best[entry] = score
+        ranked = sorted(best, key=lambda e: (-best[e], self.entry_kind[e], self.entry_name[e]))[:limit]
+        return pd.DataFrame({
+            'Kind': [KINDS[self.entry_kind[e]] for e in ranked],
+            'Name': [self.entry_name[e] for e in ranked],
+            'Score': [best[e] for e in ranked],
+        }, columns=columns)
@@ -0,0 +1,264 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+LAYERS = ('herb', 'compound', 'target', 'action')
+METRICS = ('jaccard', 'cosine', 'amount')
+
+# Upper bound on the dense score block (rows x prescriptions) materialized at once
+BLOCK_ENTRIES = 4_000_000
+
+# Layers denser than this (and small enough) are kept as dense float32 arrays for BLAS products
+DENSE_MIN_DENSITY = 0.02
+DENSE_MAX_BYTES = 128 * 1024 * 1024
+
+# Share of affected prescriptions above which carry_over recomputes neighbor tables from scratch
+CARRY_OVER_MAX_AFFECTED = 0.25
+
+# Neighbors kept per prescription in the precomputed tables (the most the Similar Formulas page shows)
+NEIGHBOR_K = 50
+
+
+def _matrix(rows, cols, shape, data=None):
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    keep = (rows >= 0) & (cols >= 0)
+    values = np.ones(int(keep.sum())) if data is None else np.nan_to_num(np.asarray(data, dtype=float)[keep])
+    m = sp.csr_matrix((values, (rows[keep], cols[keep])), shape=shape)
+    m.sum_duplicates()
+    return m
+
+
+def _binary(m):
+    m = m.copy()
+    m.data = np.ones_like(m.data)
+    return m
+
+
+def _normalize_rows(m):
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sp.diags(inv) @ m
+
+
+class SimilarityEngine:
+    """
+    All-pairs prescription similarity from sparse prescription x feature matrices.
+
+    Layers: herb (amount matrix from Prescription_Input) and compound / target / action,
+    derived as (prescription x herb) @ (herb x feature) from the Herb_Library rows.
+    Metrics:
+    - jaccard: |A & B| / |A | B| over feature membership
+    - cosine:  |A & B| / sqrt(|A| |B|) over feature membership
+    - amount:  cosine of the amount-weighted feature vectors (herb mass reaching each feature)
+    """
+
+    def __init__(self, index):
+        self.index = index
+        n_pres, n_herb = len(index.pres_names), len(index.herb_names)
+
+        pres_herb = _matrix(index.pres_row_pres, index.pres_row_herb, (n_pres, n_herb), index.pres_row_amount)
+        pres_herb_binary = _binary(_matrix(index.pres_row_pres, index.pres_row_herb, (n_pres, n_herb)))
+
+        self.weighted = {'herb': pres_herb}
+        self.binary = {'herb': pres_herb_binary}
+        for layer, row_ids, n_cols in [('compound', index.row_compound, len(index.compound_names)),
+                                       ('target', index.row_target, len(index.target_names)),
+                                       ('action', index.row_action, len(index.action_names))]:
+            herb_feature = _binary(_matrix(index.row_herb, row_ids, (n_herb, n_cols)))
+            self.weighted[layer] = (pres_herb @ herb_feature).tocsr()
+            self.binary[layer] = _binary((pres_herb_binary @ herb_feature).tocsr())
+
+        self.sizes = {layer: np.asarray(m.getnnz(axis=1), dtype=float) for layer, m in self.binary.items()}
+        self.normalized = {layer: _normalize_rows(m).tocsr() for layer, m in self.weighted.items()}
+        # Dense copies of dense-ish layers (e.g. a few hundred actions): sparse x sparse products
+        # with a dense result are far slower than BLAS there
+        self._dense = {}
+        for layer in LAYERS:
+            m = self.binary[layer]
+            n_rows, n_cols = m.shape
+            if n_rows and n_cols and m.nnz / (n_rows * n_cols) >= DENSE_MIN_DENSITY \
+                    and n_rows * n_cols * 4 <= DENSE_MAX_BYTES:
+                self._dense[layer] = (m.toarray().astype(np.float32),
+                                      self.normalized[layer].toarray().astype(np.float32))
+        self._top_k = {}
+        # Rows rescored in full per table by carry_over (empty when nothing was carried over)
+        self.rescored = {}
+
+    def _product(self, rows, layer, normalized):
+        """rows x all product of the binary (or normalized amount) layer matrix, as a dense array."""
+        if layer in self._dense:
+            m = self._dense[layer][1 if normalized else 0]
+            return (m[rows] @ m.T).astype(float)
+        m = self.normalized[layer] if normalized else self.binary[layer]
+        return (m[rows] @ m.T).toarray()
+
+    @property
+    def n_prescriptions(self):
+        return len(self.index.pres_names)
+
+    def scores(self, rows, layer='herb', metric='jaccard'):
+        """Dense similarity block: prescriptions `rows` against all prescriptions."""
+        if metric == 'amount':
+            return self._product(rows, layer, normalized=True)
+
+        inter = self._product(rows, layer, normalized=False)
+        sizes = self.sizes[layer]
+        row_sizes = sizes[rows][:, None]
+        if metric == 'jaccard':
+            denom = row_sizes + sizes[None, :] - inter
+        elif metric == 'cosine':
+            denom = np.sqrt(row_sizes * sizes[None, :])
+        else:
+            raise ValueError(f"Unknown metric: {metric}")
+        return np.divide(inter, denom, out=np.zeros_like(inter), where=denom > 0)
+
+    def top_k(self, layer='herb', metric='jaccard', k=10):
+        """
+        Top-k neighbors of every prescription, computed block-wise with sparse products.
+        Returns (neighbor IDs, scores), both of shape (n_prescriptions, k); missing slots are -1 / 0.
+        Results are kept for subsequent calls.
+        """
+        key = (layer, metric, k)
+        if key not in self._top_k:
+            self._top_k[key] = self._top_k_rows(np.arange(self.n_prescriptions), layer, metric, k)
+        return self._top_k[key]
+
+    def precompute(self, k=NEIGHBOR_K):
+        """
+        Fills the top-k table of every (layer, metric), skipping the ones already there (e.g. carried over
+        from the previous version). Slow on large libraries: run it in the background, neighbors() scores
+        single rows until a table is ready.
+        """
+        for layer in LAYERS:
+            for metric in METRICS:
+                self.top_k(layer, metric, k)
+
+    def _table(self, layer, metric, k):
+        """The smallest computed top-k table of (layer, metric) holding at least k neighbors, or None."""
+        sizes = [kk for (l, m, kk) in list(self._top_k) if l == layer and m == metric and kk >= k]
+        return self._top_k[(layer, metric, min(sizes))] if sizes else None
+
+    def _top_k_rows(self, rows, layer, metric, k):
+        """Top-k neighbors of the given rows, scored in blocks of at most BLOCK_ENTRIES."""
+        n = self.n_prescriptions
+        kk = max(0, min(k, n - 1))
+        ids = np.full((len(rows), k), -1, dtype=np.int64)
+        vals = np.zeros((len(rows), k))
+        block = max(1, min(n, BLOCK_ENTRIES // max(n, 1)))
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            out = slice(start, start + len(chunk))
+            s = self.scores(chunk, layer, metric)
+            s[np.arange(len(chunk)), chunk] = -np.inf  # exclude self
+            if kk == 0:
+                continue
+            part = np.argpartition(-s, kk - 1, axis=1)[:, :kk]
+            part_scores = np.take_along_axis(s, part, axis=1)
+            order = np.argsort(-part_scores, axis=1, kind='stable')
+            best = np.take_along_axis(part, order, axis=1)
+            best_scores = np.take_along_axis(part_scores, order, axis=1)
+            found = best_scores > 0
+            ids[out, :kk] = np.where(found, best, -1)
+            vals[out, :kk] = np.where(found, best_scores, 0.0)
+        return ids, vals
+
+    def carry_over(self, previous, affected_names):
+        """
+        Reuses the all-pairs top-k tables of `previous` (the engine of the dataset before a refresh).
+        Only prescriptions in `affected_names` (or new ones) are rescored against everything; every
+        other row merges its old neighbors with its scores against the affected prescriptions, and is
+        rescored in full only when an unaffected candidate beyond its old list could now enter.
+        Returns the number of rows rescored in full per table.
+        """
+        n = self.n_prescriptions
+        old_to_new = self.index.pres_names.get_indexer(previous.index.pres_names)
+        new_to_old = previous.index.pres_names.get_indexer(self.index.pres_names)
+        affected = np.zeros(n, dtype=bool)
+        affected[self.index.pres_ids(affected_names)] = True
+        affected |= new_to_old < 0
+        aff_rows = np.flatnonzero(affected)
+
+        rescored = {}
+        for (layer, metric, k), (old_ids, old_vals) in list(previous._top_k.items()):
+            if len(aff_rows) > CARRY_OVER_MAX_AFFECTED * n or k == 0:
+                # Most rows touched: a fresh table is cheaper than patching
+                self._top_k.pop((layer, metric, k), None)
+                self.top_k(layer, metric, k)
+                rescored[(layer, metric, k)] = n
+                continue
+
+            rows = np.flatnonzero(~affected)
+            # Old neighbors in new IDs; affected / removed neighbors have new scores
+            ids = np.where(old_ids[new_to_old[rows]] >= 0, old_to_new[old_ids[new_to_old[rows]]], -1)
+            vals = old_vals[new_to_old[rows]]
+            stale = (ids < 0) | affected[np.maximum(ids, 0)]
+            ids = np.where(stale, -1, ids)
+            vals = np.where(stale, 0.0, vals)
+            # Scores are symmetric: the affected rows' scores give every row's scores against them
+            aff_scores = self.scores(aff_rows, layer, metric)[:, rows].T if len(aff_rows) else np.zeros((len(rows), 0))
+            cand_ids = np.concatenate([ids, np.broadcast_to(aff_rows, aff_scores.shape)], axis=1)
+            cand_vals = np.concatenate([vals, aff_scores], axis=1)
+            kk = min(k, cand_ids.shape[1])
+            new_ids = np.full((len(rows), k), -1, dtype=np.int64)
+            new_vals = np.zeros((len(rows), k))
+            if kk:
+                part = np.argpartition(-cand_vals, kk - 1, axis=1)[:, :kk]
+                part_vals = np.take_along_axis(cand_vals, part, axis=1)
+                order = np.argsort(-part_vals, axis=1, kind='stable')
+                best = np.take_along_axis(np.take_along_axis(cand_ids, part, axis=1), order, axis=1)
+                best_vals = np.take_along_axis(part_vals, order, axis=1)
+                found = best_vals > 0
+                new_ids[:, :kk] = np.where(found, best, -1)
+                new_vals[:, :kk] = np.where(found, best_vals, 0.0)
+
+            # A full old list hid candidates scoring up to its last entry: exact only if the new list
+            # is still full and no weaker than that
+            inexact = np.zeros(len(rows), dtype=bool)
+            if k:
+                old_last = old_vals[new_to_old[rows], k - 1]
+                inexact = (old_last > 0) & ((new_ids[:, -1] < 0) | (new_vals[:, -1] < old_last))
+            redo = np.concatenate([aff_rows, rows[inexact]])
+
+            table_ids = np.full((n, k), -1, dtype=np.int64)
+            table_vals = np.zeros((n, k))
+            table_ids[rows], table_vals[rows] = new_ids, new_vals
+            if len(redo):
+                redo_ids, redo_vals = self._top_k_rows(redo, layer, metric, k)
+                table_ids[redo], table_vals[redo] = redo_ids, redo_vals
+            self._top_k[(layer, metric, k)] = (table_ids, table_vals)
+            rescored[(layer, metric, k)] = len(redo)
+        self.rescored = rescored
+        return rescored
+
+    def neighbors(self, pres_name, layer='herb', metric='jaccard', k=10):
+        """
+        Ranked most-similar prescriptions as a DataFrame
+        (Prescription_Name, Similarity, Shared = number of shared features in the layer).
+        Uses the first k entries of an all-pairs table when one has been computed, otherwise scores the single row.
+        """
+        pid = self.index.pres_ids([pres_name])
+        if len(pid) == 0:
+            return pd.DataFrame(columns=['Prescription_Name', 'Similarity', 'Shared'])
+        pid = int(pid[0])
+
+        cached = self._table(layer, metric, k)
+        if cached is not None:
+            ids, vals = cached[0][pid, :k], cached[1][pid, :k]
+        else:
+            s = self.scores(np.array([pid]), layer, metric)[0]
+            s[pid] = -np.inf
+            kk = max(0, min(k, len(s) - 1))
+            ids = np.argpartition(-s, kk - 1)[:kk] if kk else np.zeros(0, dtype=np.int64)
+            ids = ids[np.argsort(-s[ids], kind='stable')]
+            vals = s[ids]
+        found = (ids >= 0) & (vals > 0)
+        ids, vals = ids[found], vals[found]
+
+        m = self.binary[layer]
+        shared = np.asarray((m[ids] @ m[pid].T).toarray()).ravel() if len(ids) else np.zeros(0)
+        return pd.DataFrame({
+            'Prescription_Name': self.index.pres_names[ids].tolist(),
+            'Similarity': vals,
+            'Shared': shared.astype(int),
+        })
@@ -0,0 +1,399 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+import perf
+from mechanism_index import MechanismIndex
+
+# Local columnar snapshots of the preprocessed frames, one immutable directory per version.
+# Layout: <snapshot_dir>/CURRENT -> "<version>", <snapshot_dir>/<version>/<Tab>.parquet + manifest.json
+#         <snapshot_dir>/PINNED -> "<version>" while a version is pinned (CURRENT stays on it)
+#         <version>/mapped/<Tab>.arrow + categories.arrow: uncompressed Arrow IPC copy served by memory-mapping
+#         <version>/index/*.npy: the version's MechanismIndex arrays, also memory-mapped
+TABLES = ("Prescription_Input", "Herb_Library", "Prescription_script")
+CURRENT_FILE = "CURRENT"
+PINNED_FILE = "PINNED"
+MANIFEST_FILE = "manifest.json"
+MAPPED_DIR = "mapped"
+INDEX_DIR = "index"
+CATEGORIES_FILE = "categories.arrow"
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    "HERB_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+)
+
+# Number of versions kept in the history (the current and the pinned version are always kept)
+KEEP_VERSIONS = int(os.environ.get("HERB_SNAPSHOT_KEEP", "20"))
+
+
+def content_hash(frames):
+    """
+    Stable content hash of the preprocessed frames (column names + cell values).
+    Used as the snapshot version key.
+    """
+    h = hashlib.sha256()
+    for name, df in zip(TABLES, frames):
+        h.update(name.encode("utf-8"))
+        if df is None:
+            continue
+        h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+
+def current_version(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    path = os.path.join(snapshot_dir, CURRENT_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    if version and os.path.isdir(os.path.join(snapshot_dir, version)):
+        return version
+    return None
+
+
+def _atomic_write_text(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+@perf.timed()
+def save_snapshot(frames, snapshot_dir=DEFAULT_SNAPSHOT_DIR, keep=KEEP_VERSIONS):
+    """
+    Persists (df_pres, df_herb, df_script) as Parquet under a content-hash version
+    and atomically points CURRENT at it, unless another version is pinned. Returns the version string.
+    The raw tab hashes of the frames (attrs['raw_hash']) are recorded in the manifest; beyond `keep`
+    versions the oldest ones are removed.
+    """
+    version = content_hash(frames)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target = os.path.join(snapshot_dir, version)
+    hashes = {name: df.attrs["raw_hash"] for name, df in zip(TABLES, frames)
+              if df is not None and df.attrs.get("raw_hash")}
+
+    if not os.path.isdir(target):
+        # Write into a temp dir first so readers never see a half-written version
+        tmp = tempfile.mkdtemp(dir=snapshot_dir, prefix=".tmp-")
+        try:
+            manifest = {"version": version, "created_at": time.time(), "raw_hashes": hashes, "tables": {}}
+            for name, df in zip(TABLES, frames):
+                if df is None:
+                    continue
+                df.to_parquet(os.path.join(tmp, f"{name}.parquet"), index=False)
+                manifest["tables"][name] = {"rows": len(df), "columns": list(map(str, df.columns))}
+            _write_mapped(frames, os.path.join(tmp, MAPPED_DIR))
+            with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, target)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+    elif hashes:
+        # Same content from differently formatted sheet bytes: remember the latest raw hashes
+        manifest = _manifest(snapshot_dir, version)
+        if manifest is not None and manifest.get("raw_hashes") != hashes:
+            manifest["raw_hashes"] = hashes
+            _atomic_write_text(os.path.join(target, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    if pinned_version(snapshot_dir) is None:
+        _atomic_write_text(os.path.join(snapshot_dir, CURRENT_FILE), version)
+    prune_versions(snapshot_dir, keep)
+    return version
+
+
+def _manifest(snapshot_dir, version):
+    try:
+        with open(os.path.join(snapshot_dir, version, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def created_at(snapshot_dir=DEFAULT_SNAPSHOT_DIR, version=None):
+    """Creation time (epoch seconds) of a snapshot version from its manifest, or None."""
+    version = version or current_version(snapshot_dir)
+    manifest = _manifest(snapshot_dir, version) if version else None
+    return manifest.get("created_at") if manifest else None
+
+
+def raw_hashes(snapshot_dir=DEFAULT_SNAPSHOT_DIR, version=None):
+    """{tab: SHA-256 of the raw sheet bytes} the version (default: CURRENT) was built from; {} if unknown."""
+    version = version or current_version(snapshot_dir)
+    manifest = _manifest(snapshot_dir, version) if version else None
+    return dict(manifest.get("raw_hashes") or {}) if manifest else {}
+
+
+def list_versions(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """
+    The stored versions, newest first: dicts with version, created_at, rows per table,
+    and whether the version is the current / pinned one.
+    """
+    try:
+        names = os.listdir(snapshot_dir)
+    except OSError:
+        return []
+    current, pinned = current_version(snapshot_dir), pinned_version(snapshot_dir)
+    versions = []
+    for name in names:
+        manifest = None if name.startswith(".") else _manifest(snapshot_dir, name)
+        if manifest is None:
+            continue
+        versions.append({
+            "version": name,
+            "created_at": manifest.get("created_at"),
+            "rows": {table: info.get("rows") for table, info in manifest.get("tables", {}).items()},
+            "current": name == current,
+            "pinned": name == pinned,
+        })
+    return sorted(versions, key=lambda v: v["created_at"] or 0, reverse=True)
+
+
+def pinned_version(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, PINNED_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version if version and os.path.isdir(os.path.join(snapshot_dir, version)) else None
+
+
+def pin_version(snapshot_dir, version):
+    """
+    Serves `version` and keeps serving it: refreshes still store new versions, but CURRENT stays on the
+    pinned one until unpin_version. Running apps switch to it on their next poll, without a download.
+    """
+    if _manifest(snapshot_dir, version) is None:
+        raise ValueError(f"No snapshot version {version!r} in {snapshot_dir}")
+    _atomic_write_text(os.path.join(snapshot_dir, PINNED_FILE), version)
+    _atomic_write_text(os.path.join(snapshot_dir, CURRENT_FILE), version)
+
+
+def unpin_version(snapshot_dir=DEFAULT_SNAPSHOT_DIR, latest=True):
+    """Removes the pin; with `latest`, CURRENT moves to the newest stored version at once."""
+    try:
+        os.remove(os.path.join(snapshot_dir, PINNED_FILE))
+    except FileNotFoundError:
+        pass
+    versions = list_versions(snapshot_dir)
+    if latest and versions:
+        _atomic_write_text(os.path.join(snapshot_dir, CURRENT_FILE), versions[0]["version"])
+
+
+def rollback(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """Pins the version stored before the current one. Returns it."""
+    versions = [v["version"] for v in list_versions(snapshot_dir)]
+    current = current_version(snapshot_dir)
+    older = versions[versions.index(current) + 1:] if current in versions else []
+    if not older:
+        raise ValueError(f"No version older than {current} in {snapshot_dir}")
+    pin_version(snapshot_dir, older[0])
+    return older[0]
+
+
+def prune_versions(snapshot_dir=DEFAULT_SNAPSHOT_DIR, keep=KEEP_VERSIONS):
+    """Removes all but the `keep` newest versions, never the current or the pinned one. Returns the removed ones."""
+    removed = []
+    for info in list_versions(snapshot_dir)[keep:]:
+        if info["current"] or info["pinned"]:
+            continue
+        # Renamed away first, so the version disappears at once; processes still mapping it keep their pages
+        tmp = tempfile.mkdtemp(dir=snapshot_dir, prefix=".tmp-")
+        os.rename(os.path.join(snapshot_dir, info["version"]), os.path.join(tmp, info["version"]))
+        shutil.rmtree(tmp, ignore_errors=True)
+        removed.append(info["version"])
+    return removed
+
+
+@perf.timed()
+def load_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR, version=None):
+    """
+    Loads the frames of a snapshot version (default: CURRENT).
+    Returns (df_pres, df_herb, df_script, version) or None if no snapshot exists.
+    """
+    version = version or current_version(snapshot_dir)
+    if version is None:
+        return None
+    base = os.path.join(snapshot_dir, version)
+    frames = []
+    for name in TABLES:
+        path = os.path.join(base, f"{name}.parquet")
+        frames.append(pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame())
+    return (*frames, version)
+
+
+def publish_dir(target, write):
+    """
+    Creates the directory `target` atomically: `write(tmp)` fills a temp directory that is then renamed
+    into place, so readers never see a partial one. If another process published `target` first, its copy is kept.
+    """
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(target), prefix=".tmp-")
+    try:
+        write(tmp)
+        os.rename(tmp, target)
+    except OSError:
+        if not os.path.isdir(target):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _write_mapped(frames, directory):
+    """
+    Arrow IPC copy of the frames, laid out so that loading is zero-copy: categorical columns are stored as
+    their integer codes (field metadata points at their categories in CATEGORIES_FILE, where a dictionary
+    shared by several columns is stored once), numeric columns keep NaN as a value, each table is one batch.
+    """
+    import pyarrow as pa
+
+    os.makedirs(directory, exist_ok=True)
+    dictionaries, spans = [], {}
+    offset = 0
+    for name, df in zip(TABLES, frames):
+        if df is None:
+            continue
+        fields, arrays = [], []
+        for col in df.columns:
+            values = df[col]
+            metadata = None
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = values.cat.categories
+                if id(categories) not in spans:
+                    spans[id(categories)] = (offset, len(categories))
+                    dictionaries.append(categories)
+                    offset += len(categories)
+                metadata = {"categories": json.dumps(spans[id(categories)])}
+                array = pa.array(values.cat.codes.to_numpy())
+            elif values.dtype.kind in "biuf":
+                array = pa.array(values.to_numpy())
+            else:
+                array = pa.array(values, from_pandas=True)
+            fields.append(pa.field(str(col), array.type, metadata=metadata))
+            arrays.append(array)
+        _write_arrow(pa.Table.from_arrays(arrays, schema=pa.schema(fields)), os.path.join(directory, f"{name}.arrow"))
+
+    categories = [v for index in dictionaries for v in index]
+    _write_arrow(pa.table({"category": pa.array(categories, type=pa.string())}),
+                 os.path.join(directory, CATEGORIES_FILE))
+
+
+def _write_arrow(table, path):
+    import pyarrow as pa
+
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(1, table.num_rows))
+
+
+def _map_arrow(path):
+    import pyarrow as pa
+
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def _to_numpy(column):
+    # Zero-copy (read-only) for a single chunk without nulls
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
+
+
+@perf.timed()
+def load_mapped(snapshot_dir=DEFAULT_SNAPSHOT_DIR, version=None):
+    """
+    Like load_snapshot, but the frames are memory-mapped read-only from the version's Arrow IPC copy, so every
+    process serving the same version shares one copy of the data in the page cache.
+    The copy is published on first use for versions written before it existed.
+    Frames carry attrs['snapshot_path'] (the version directory) for load_index.
+    """
+    version = version or current_version(snapshot_dir)
+    if version is None:
+        return None
+    base = os.path.join(snapshot_dir, version)
+    directory = os.path.join(base, MAPPED_DIR)
+    if not os.path.isdir(directory):
+        frames = load_snapshot(snapshot_dir, version)[:3]
+        publish_dir(directory, lambda tmp: _write_mapped(frames, tmp))
+
+    category_column = _map_arrow(os.path.join(directory, CATEGORIES_FILE)).column("category")
+    dictionaries = {}
+    frames = []
+    for name in TABLES:
+        path = os.path.join(directory, f"{name}.arrow")
+        if not os.path.exists(path):
+            frames.append(pd.DataFrame())
+            continue
+        table = _map_arrow(path)
+        data = {}
+        for field, column in zip(table.schema, table.columns):
+            span = (field.metadata or {}).get(b"categories")
+            if span is None:
+                data[field.name] = column.to_pandas()
+                continue
+            start, length = json.loads(span)
+            if (start, length) not in dictionaries:
+                dictionaries[start, length] = pd.Index(category_column.slice(start, length).to_pandas().array)
+            data[field.name] = pd.Categorical.from_codes(_to_numpy(column), dtype=pd.CategoricalDtype(
+                dictionaries[start, length]), validate=False)
+        df = pd.DataFrame(data, copy=False)
+        df.attrs["snapshot_path"] = base
+        frames.append(df)
+    return (*frames, version)
+
+
+@perf.timed()
+def load_index(df_pres, df_herb):
+    """
+    MechanismIndex of frames from load_mapped, memory-mapped from the version directory.
+    The first process to need it builds and publishes it; frames not loaded from a snapshot get a private index.
+    """
+    base = df_pres.attrs.get("snapshot_path")
+    if base is None:
+        return MechanismIndex(df_pres, df_herb)
+    directory = os.path.join(base, INDEX_DIR)
+    if not os.path.isdir(directory):
+        publish_dir(directory, MechanismIndex(df_pres, df_herb).save)
+    return MechanismIndex.load(directory, df_pres, df_herb)
+
+
+def main(argv=None):
+    """
+    Snapshot history from the command line:
+
+        python snapshot.py list | pin VERSION | unpin | rollback [--snapshot-dir DIR]
+    """
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="List, pin and roll back dataset snapshot versions.")
+    parser.add_argument('command', choices=['list', 'pin', 'unpin', 'rollback'])
+    parser.add_argument('version', nargs='?', help="version to pin")
+    parser.add_argument('--snapshot-dir', default=DEFAULT_SNAPSHOT_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'pin':
+        if not args.version:
+            parser.error("pin needs a VERSION")
+        pin_version(args.snapshot_dir, args.version)
+    elif args.command == 'unpin':
+        unpin_version(args.snapshot_dir)
+    elif args.command == 'rollback':
+        print(f"pinned {rollback(args.snapshot_dir)}")
+    for info in list_versions(args.snapshot_dir):
+        flags = " ".join(flag for flag in ("current", "pinned") if info[flag])
+        stamp = f"{datetime.fromtimestamp(info['created_at']):%Y-%m-%d %H:%M:%S}" if info['created_at'] else "?"
+        rows = ", ".join(f"{table} {n}" for table, n in info['rows'].items())
+        print(f"{info['version']}  {stamp}  {rows}  {flags}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
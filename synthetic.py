@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+
+def _zipf_weights(n, exponent):
+    """Long-tail popularity: weight of rank r is 1 / (r + 1) ** exponent, normalized."""
+    w = 1.0 / np.arange(1, n + 1, dtype=float) ** exponent
+    return w / w.sum()
+
+
+def _pool(prefix, n, rng):
+    """`n` names, shuffled so popularity rank is independent of the numbering."""
+    names = np.array([f"{prefix}_{i:05d}" for i in range(n)], dtype=object)
+    return names[rng.permutation(n)]
+
+
+def _members(n_owners, n_pool, mean_size, max_size, exponent, rng):
+    """
+    Per-owner member sets as CSR (ptr, members): set sizes are lognormal around `mean_size`,
+    members are drawn from a Zipf-weighted pool so a few members are shared very widely.
+    """
+    sizes = np.clip(rng.lognormal(np.log(mean_size), 0.6, size=n_owners).astype(np.int64), 1, max_size)
+    ptr = np.concatenate(([0], np.cumsum(sizes)))
+    return ptr, rng.choice(n_pool, size=int(ptr[-1]), p=_zipf_weights(n_pool, exponent))
+
+
+def _pick(ptr, members, owners, rng):
+    """One random member from each owner's set."""
+    lens = ptr[owners + 1] - ptr[owners]
+    return members[ptr[owners] + (rng.random(len(owners)) * lens).astype(np.int64)]
+
+
+def generate_dataset(n_prescriptions=10_000, n_herbs=2_000, library_rows=1_000_000,
+                     n_compounds=None, n_targets=None, n_actions=300,
+                     herbs_per_prescription=(3, 25), compounds_per_row=(1, 3),
+                     exponent=1.1, unmatched_herb_rate=0.01, seed=0):
+    """
+    Seeded synthetic sheet tabs (Prescription_Input, Herb_Library, Prescription_script) shaped like
+    the raw Google Sheet export, for load tests and benchmarks.
+
+    - Herb usage in prescriptions and compound / target / action sharing follow Zipf-like long tails.
+    - Each herb has its own compound set, each compound a few targets and each target a few actions,
+      so the herb -> compound -> target -> action layers are as sparse as real mechanism data.
+    - Herb_Library rows hold comma-separated compound lists; after preprocess_data they explode to
+      about `library_rows` compound -> target -> action rows.
+    - Amounts are strings with units ('12g'), as typed in the sheet.
+    - A fraction `unmatched_herb_rate` of prescription herbs has no Herb_Library entry (left-join misses).
+    """
+    rng = np.random.default_rng(seed)
+    n_compounds = n_compounds or max(1, library_rows // 20)
+    n_targets = n_targets or max(1, library_rows // 100)
+
+    herbs = _pool("Herb", n_herbs, rng)
+    compounds = _pool("Compound", n_compounds, rng)
+    targets = _pool("Target", n_targets, rng)
+    actions = _pool("Action", n_actions, rng)
+    herb_weights = _zipf_weights(n_herbs, exponent)
+
+    herb_compounds = _members(n_herbs, n_compounds, 40, 400, exponent, rng)
+    compound_targets = _members(n_compounds, n_targets, 3, 40, exponent, rng)
+    target_actions = _members(n_targets, n_actions, 1.5, 8, exponent, rng)
+
+    # --- Herb_Library: well-studied herbs have more rows (milder tail than herb usage) ---
+    lo, hi = compounds_per_row
+    n_rows = max(1, int(round(library_rows / ((lo + hi) / 2))))
+    row_herb = rng.choice(n_herbs, size=n_rows, p=_zipf_weights(n_herbs, exponent / 2))
+    list_lens = rng.integers(lo, hi + 1, size=n_rows)
+    flat = _pick(*herb_compounds, np.repeat(row_herb, list_lens), rng)
+    bounds = np.cumsum(list_lens)[:-1]
+    compound_lists = [", ".join(parts) for parts in np.split(compounds[flat], bounds)]
+    # The row's target belongs to its first compound, the action to the target
+    row_target = _pick(*compound_targets, flat[np.concatenate(([0], bounds))], rng)
+    row_action = _pick(*target_actions, row_target, rng)
+    df_herb = pd.DataFrame({
+        'Herb_Name': herbs[row_herb],
+        'Compound_Name': compound_lists,
+        'Target_Protein': targets[row_target],
+        'Core_Action': actions[row_action],
+        'KM_Efficacy': np.array([f"Efficacy_{i:03d}" for i in range(50)], dtype=object)[
+            rng.integers(0, 50, size=n_rows)],
+    })
+    df_herb = df_herb.sort_values('Herb_Name', kind='stable').reset_index(drop=True)
+
+    # --- Prescription_Input: distinct herbs per prescription, drawn by popularity ---
+    pres_names = np.array([f"Formula_{i:05d}" for i in range(n_prescriptions)], dtype=object)
+    lo, hi = herbs_per_prescription
+    sizes = rng.integers(lo, min(hi, n_herbs) + 1, size=n_prescriptions)
+    # Gumbel top-k: weighted sampling without replacement for all prescriptions in one pass per size
+    pres_herb = np.empty(int(sizes.sum()), dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    log_w = np.log(herb_weights)
+    for k in np.unique(sizes):
+        rows = np.flatnonzero(sizes == k)
+        for chunk in np.array_split(rows, max(1, len(rows) * n_herbs // 5_000_000)):
+            keys = log_w - np.log(-np.log(rng.random((len(chunk), n_herbs))))
+            picked = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+            pres_herb[(starts[chunk][:, None] + np.arange(k)).ravel()] = picked.ravel()
+    herb_names = herbs[pres_herb].astype(object)
+    unmatched = rng.random(len(herb_names)) < unmatched_herb_rate
+    herb_names[unmatched] = [f"Unlisted_{i:05d}" for i in np.flatnonzero(unmatched)]
+    df_pres = pd.DataFrame({
+        'Prescription_Name': np.repeat(pres_names, sizes),
+        'Herb_Name': herb_names,
+        'Amount': [f"{a}g" for a in rng.integers(1, 40, size=len(herb_names))],
+    })
+
+    # --- Prescription_script: one clinical note per prescription ---
+    df_script = pd.DataFrame({
+        'Prescription_Name': pres_names,
+        'Symptom_Status': [f"Symptom_{i:03d}" for i in rng.integers(0, 500, size=n_prescriptions)],
+        'Explanation': [f"Clinical note for {name}" for name in pres_names],
+    })
+    return df_pres, df_herb, df_script
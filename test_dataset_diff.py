@@ -0,0 +1,51 @@
+import pandas as pd
+from dataset_diff import DatasetDiff
+from data_loader import preprocess_data
+
+# Mock Data (raw sheet values)
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B', 'C', 'D'],
+    'Herb_Name': ['H1', 'H2', 'H1', 'H3', 'H4'],
+    'Amount': ['10g', '20g', '5g', '8g', '3g']
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2', 'H3', 'H4'],
+    'Compound_Name': ['C1, C2', 'C3', 'C4', 'C5'],
+    'Target_Protein': ['T1', 'T2', 'T3', 'T4'],
+    'Core_Action': ['Act1', 'Act2', 'Act3', 'Act4'],
+    'KM_Efficacy': ['E1', 'E2', 'E3', 'E4']
+})
+
+df_script = pd.DataFrame({
+    'Prescription_Name': ['A', 'C'],
+    'Symptom_Status': ['S1', 'S2'],
+    'Explanation': ['E1', 'E2']
+})
+
+old = preprocess_data(df_pres.copy(), df_herb.copy(), df_script.copy())
+
+
+def test_identical_data_has_no_changes():
+    # Row order and categorical dictionaries do not matter
+    shuffled = preprocess_data(df_pres.iloc[::-1].copy(), df_herb.iloc[::-1].copy(), df_script.copy())
+    assert DatasetDiff(old, shuffled).empty
+
+
+def test_changes_by_prescription_and_herb():
+    pres = df_pres.copy()
+    pres.loc[pres['Prescription_Name'] == 'B', 'Amount'] = '7g'
+    pres = pd.concat([pres, pd.DataFrame({'Prescription_Name': ['E'], 'Herb_Name': ['H3'], 'Amount': ['1g']})])
+    herb = df_herb.copy()
+    herb.loc[herb['Herb_Name'] == 'H2', 'Core_Action'] = 'Act9'
+    script = df_script.copy()
+    script.loc[script['Prescription_Name'] == 'C', 'Explanation'] = 'new'
+
+    diff = DatasetDiff(old, preprocess_data(pres, herb, script))
+
+    assert diff.added_prescriptions == ['E']
+    assert diff.changed_prescriptions == ['B', 'C']
+    assert diff.changed_herbs == ['H2']
+    # A uses the changed herb H2; D is untouched
+    assert diff.affected_prescriptions == {'A', 'B', 'C', 'E'}
+    assert diff.summary()['prescriptions_affected'] == 4
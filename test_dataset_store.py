@@ -0,0 +1,122 @@
+import threading
+import time
+
+from dataset_store import DatasetStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_first_load_runs_once():
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        return ('v1',), 1000.0
+
+    clock = Clock()
+    store = DatasetStore(load, refresh=None, max_age=0, clock=clock)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get())) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [(('v1',), 1000.0)] * 5
+
+
+def test_stale_data_is_served_while_one_worker_refreshes():
+    release = threading.Event()
+    refreshes = []
+
+    def refresh(current):
+        refreshes.append(current)
+        release.wait(5)
+        return ('v2',), {'new_version': 'v2'}
+
+    clock = Clock()
+    store = DatasetStore(lambda: (('v1',), 0.0), refresh, max_age=60, clock=clock)
+    # Stale: every session gets v1 at once, only one refresh runs
+    assert store.get() == (('v1',), 0.0)
+    assert store.get()[0] == ('v1',)
+    assert store.status()['refreshing']
+
+    release.set()
+    assert store.wait(5)
+    assert refreshes == [('v1',)]
+    assert store.get() == (('v2',), 1000.0)
+    assert store.status()['last_summary'] == {'new_version': 'v2'}
+
+
+def test_failed_refresh_keeps_data_and_backs_off():
+    def refresh(current):
+        raise OSError("sheet unreachable")
+
+    clock = Clock()
+    store = DatasetStore(lambda: (('v1',), 0.0), refresh, max_age=60, backoff=30, clock=clock)
+    store.get()
+    store.wait(5)
+
+    status = store.status()
+    assert status['failures'] == 1 and 'unreachable' in status['last_error']
+    assert status['retry_in'] == 30
+    # Within the back-off window no new refresh starts, the stale data is still served
+    assert store.get()[0] == ('v1',)
+    assert not store.request_refresh()
+
+    clock.now += 31
+    assert store.request_refresh()
+    store.wait(5)
+    assert store.status()['retry_in'] == 60  # doubled
+    assert store.get()[0] == ('v1',)
+
+
+def test_first_load_falls_back_to_live_source():
+    clock = Clock()
+    store = DatasetStore(lambda: None, lambda current: (('live',), None), max_age=0, clock=clock)
+    assert store.get() == (('live',), 1000.0)
+
+
+def test_failed_first_load_is_retried_by_the_worker_only():
+    calls = []
+
+    def refresh(current):
+        calls.append(current)
+        if len(calls) < 2:
+            raise OSError("sheet unreachable")
+        return ('live',), None
+
+    clock = Clock()
+    store = DatasetStore(lambda: None, refresh, max_age=0, backoff=30, clock=clock)
+    assert store.get() == (None, None)
+    # Within the back-off: no foreground download, no worker
+    assert store.get() == (None, None)
+    assert len(calls) == 1 and not store.status()['refreshing']
+
+    clock.now += 31
+    assert store.get() == (None, None)
+    assert store.wait(5)
+    assert len(calls) == 2
+    assert store.get() == (('live',), 1031.0)
+
+
+def test_version_published_elsewhere_is_picked_up():
+    published = {'frames': None}
+
+    clock = Clock()
+    store = DatasetStore(lambda: (('v1',), 1000.0), refresh=None, max_age=0, clock=clock,
+                         poll=lambda current: published['frames'], poll_interval=5)
+    assert store.get() == (('v1',), 1000.0)
+
+    published['frames'] = (('v2',), 1002.0)
+    assert store.get()[0] == ('v1',)  # polled at most every poll_interval
+    clock.now += 5
+    assert store.get() == (('v2',), 1002.0)
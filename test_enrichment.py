@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import hypergeom
+
+from enrichment import EnrichmentEngine, benjamini_hochberg, hypergeom_sf, log_factorials
+from mechanism_index import MechanismIndex
+
+# Mock Data: 'Common' is linked to every target, 'Rare' only to T1 and T2, which only H1 reaches
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B'],
+    'Herb_Name': ['H1', 'H2', 'H3'],
+    'Amount': [30.0, 10.0, 5.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H1', 'H1', 'H1', 'H2', 'H3', 'H3', 'H3'],
+    'Compound_Name': ['C1', 'C1', 'C2', 'C2', 'C3', 'C4', 'C5', 'C6'],
+    'Target_Protein': ['T1', 'T1', 'T2', 'T2', 'T3', 'T4', 'T5', 'T6'],
+    'Core_Action': ['Rare', 'Common', 'Rare', 'Common', 'Common', 'Common', 'Common', 'Common']
+})
+
+engine = EnrichmentEngine(MechanismIndex(df_pres, df_herb))
+
+
+def test_hypergeom_tail_matches_scipy():
+    rng = np.random.default_rng(0)
+    size = rng.integers(1, 300, 500)
+    k = rng.integers(0, 80, 500)
+    expected = hypergeom.sf(k - 1, 400, size, 80)
+    assert hypergeom_sf(k, 400, size, 80, log_factorials(400)) == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_benjamini_hochberg():
+    p = np.array([0.01, 0.04, 0.03, 0.2])
+    assert benjamini_hochberg(p).tolist() == pytest.approx([0.04, 0.16 / 3, 0.16 / 3, 0.2])
+    # Untested features (p = 1) still count towards the number of tests
+    assert benjamini_hochberg([0.01], m=10).tolist() == pytest.approx([0.1])
+
+
+def test_specific_action_ranks_above_common_one():
+    actions = engine.enrich('A', 'action')
+    assert actions['Core_Action'].tolist() == ['Rare', 'Common']
+    rare, common = actions.iloc[0], actions.iloc[1]
+    # A reaches T1, T2, T3 of 6 targets; both Rare targets are among them
+    assert (rare['Overlap'], rare['Set_Size']) == (2, 2)
+    assert rare['P_Value'] == pytest.approx(hypergeom.sf(1, 6, 2, 3))
+    assert common['P_Value'] == pytest.approx(1.0)
+    # H1 (30 of 40) splits its amount over 4 rows, half of them Rare
+    assert rare['Weighted_Share'] == pytest.approx(15 / 40)
+    assert common['Weighted_Share'] == pytest.approx(25 / 40)
+    assert rare['Weighted_Fold'] > 1 > common['Weighted_Fold']
+
+
+def test_target_enrichment_and_unknown_prescription():
+    targets = engine.enrich('B', 'target')
+    assert sorted(targets['Target_Protein']) == ['T4', 'T5', 'T6']
+    assert targets['Weighted_Share'].sum() == pytest.approx(1.0)
+    assert engine.enrich('Unknown').empty
+
+
+def test_units_without_links_are_not_drawn():
+    # H2's target has no Core_Action: it is outside the action test's population
+    pres = pd.DataFrame({'Prescription_Name': ['P', 'P'], 'Herb_Name': ['H1', 'H2'], 'Amount': [1.0, 1.0]})
+    herb = pd.DataFrame({'Herb_Name': ['H1', 'H2', 'H3'], 'Compound_Name': ['C1', 'C2', 'C3'],
+                         'Target_Protein': ['T1', 'T2', 'T3'], 'Core_Action': ['Act1', None, 'Act2']})
+    actions = EnrichmentEngine(MechanismIndex(pres, herb)).enrich('P', 'action')
+    assert actions['Core_Action'].tolist() == ['Act1']
+    assert actions['P_Value'].tolist() == pytest.approx([hypergeom.sf(0, 2, 1, 1)])
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import export
+from enrichment import EnrichmentEngine
+from mechanism_index import MechanismIndex
+import snapshot
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B/2'],
+    'Herb_Name': ['H1', 'H2', 'H1'],
+    'Amount': [10.0, 20.0, 5.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H1', 'H2'],
+    'Compound_Name': ['C1', 'C2', 'C2'],
+    'Target_Protein': ['T1', 'T2', 'T2'],
+    'Core_Action': ['Act1', 'Act2', 'Act2'],
+    'KM_Efficacy': ['E1', 'E1', 'E2']
+})
+
+df_script = pd.DataFrame({
+    'Prescription_Name': ['A'],
+    'Symptom_Status': ['S1'],
+    'Explanation': ['E1']
+})
+
+
+def test_export_writes_every_prescription_and_resumes(tmp_path):
+    snapshot_dir, out = str(tmp_path / "snap"), str(tmp_path / "out")
+    snapshot.save_snapshot((df_pres, df_herb, df_script), snapshot_dir)
+
+    summary = export.export_all(out, snapshot_dir, workers=1, progress=None)
+    assert (summary['exported'], summary['skipped'], summary['failed']) == (2, 0, 0)
+
+    directory = os.path.join(out, export.safe_dirname('B/2'))
+    assert os.path.dirname(directory) == out
+    with open(os.path.join(directory, export.DONE_FILE), encoding='utf-8') as f:
+        done = json.load(f)
+    assert set(done['files']) == {'sankey_deep.html', 'sankey_deep.json', 'sankey_condensed.html',
+                                  'sankey_condensed.json', 'sunburst.html', 'sunburst.json',
+                                  'inference.csv', 'themes.csv'}
+    with open(os.path.join(directory, 'sankey_deep.json'), encoding='utf-8') as f:
+        assert json.load(f)['data'][0]['type'] == 'sankey'
+    assert pd.read_csv(os.path.join(directory, 'inference.csv'))['Herb_Name'].tolist() == ['H1', 'H1']
+    # Themes are ranked by enrichment, as on the Pathology Inference page
+    themes = pd.read_csv(os.path.join(directory, 'themes.csv'))
+    expected = EnrichmentEngine(MechanismIndex(df_pres, df_herb)).enrich('B/2', 'action')
+    assert themes['Core_Action'].tolist() == expected['Core_Action'].tolist()
+    assert themes['Q_Value'].tolist() == pytest.approx(expected['Q_Value'].tolist())
+    assert themes['Key_Theme'].all()  # nothing is enriched, so the most specific ones are shown
+
+    # Finished prescriptions are skipped; an unfinished one is redone
+    os.remove(os.path.join(directory, export.DONE_FILE))
+    summary = export.export_all(out, snapshot_dir, workers=1, progress=None)
+    assert (summary['exported'], summary['skipped']) == (1, 1)
+
+
+def test_export_in_worker_processes(tmp_path):
+    snapshot_dir, out = str(tmp_path / "snap"), str(tmp_path / "out")
+    snapshot.save_snapshot((df_pres, df_herb, df_script), snapshot_dir)
+
+    summary = export.export_all(out, snapshot_dir, workers=2, formats=['json'], progress=None)
+    assert (summary['exported'], summary['workers']) == (2, 2)
+    assert summary['prescriptions_per_s'] > 0
+    assert not os.path.exists(os.path.join(out, export.safe_dirname('A'), 'sunburst.html'))
@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import data_loader
+import similarity
+import snapshot
+from analysis import PrescriptionAnalyzer
+from result_cache import shared_cache
+
+# Mock Sheet (CSV bodies served per gid)
+GIDS = {
+    "Prescription_Input": "1",
+    "Herb_Library": "2",
+    "Prescription_script": "3"
+}
+
+CSV = {
+    "1": "Prescription_Name,Herb_Name,Amount\nA,H1,10g\nA,H2,20g\n",
+    "2": "Herb_Name,Compound_Name,Target_Protein,Core_Action\nH1,\"C1, C2\",T1,Act1\nH2,C3,T2,Act2\n",
+    "3": "A,S1,E1\n",
+}
+
+
+class SheetStandIn:
+    """Local HTTP stand-in for the GViz CSV export with per-gid delays and failures."""
+
+    def __init__(self, delays=None, fail=(), csv=None):
+        self.delays = delays or {}
+        self.fail = set(fail)
+        self.csv = csv or CSV
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                gid = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)["gid"][0]
+                time.sleep(stand_in.delays.get(gid, 0))
+                if gid in stand_in.fail:
+                    self.send_error(500)
+                    return
+                body = stand_in.csv[gid].encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/spreadsheets/d/x"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_tabs_are_fetched_concurrently():
+    with SheetStandIn(delays={"1": 0.4, "2": 0.4, "3": 0.4}) as sheet:
+        start = time.perf_counter()
+        dfs, errors = data_loader.fetch_tabs(sheet.url, GIDS, timeout=5)
+        elapsed = time.perf_counter() - start
+
+    assert not errors
+    assert set(dfs) == set(GIDS)
+    assert elapsed < 1.0  # sequential would be >= 1.2s
+    assert list(dfs["Prescription_script"].columns[:3]) == ['Prescription_Name', 'Symptom_Status', 'Explanation']
+
+
+def test_failed_tab_keeps_the_others():
+    with SheetStandIn(fail={"3"}) as sheet:
+        (df_pres, df_herb, df_script), errors = data_loader.fetch_data(sheet.url, GIDS, timeout=5)
+
+    assert set(errors) == {"Prescription_script"}
+    assert df_script is None
+    assert df_pres['Amount'].tolist() == [10.0, 20.0]
+    assert sorted(df_herb['Compound_Name']) == ['C1', 'C2', 'C3']
+
+
+def test_malformed_rows_are_counted():
+    csv = dict(CSV, **{"1": CSV["1"] + "A,H3,5g,extra\n", "2": CSV["2"] + "H3,C4,T3,Act3,E3,extra\n"})
+    with SheetStandIn(csv=csv) as sheet:
+        (df_pres, df_herb, _), errors = data_loader.fetch_data(sheet.url, GIDS, timeout=5)
+
+    assert not errors
+    assert df_pres.attrs['malformed_rows'] == 1
+    assert df_herb.attrs['malformed_rows'] == 1
+    assert 'H3' not in set(df_pres['Herb_Name']) | set(df_herb['Herb_Name'])
+
+
+def test_slow_tab_times_out():
+    with SheetStandIn(delays={"2": 2.0}) as sheet:
+        dfs, errors = data_loader.fetch_tabs(sheet.url, GIDS, timeout=0.5)
+
+    assert set(errors) == {"Herb_Library"}
+    assert "Prescription_Input" in dfs
+
+
+def test_refresh_falls_back_to_previous_snapshot(tmp_path):
+    with SheetStandIn() as sheet:
+        data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+    failed_tabs = {}
+    with SheetStandIn(fail={"2"}) as sheet:
+        df_pres, df_herb, df_script = data_loader.refresh_data(str(tmp_path), sheet.url, GIDS,
+                                                               failed_tabs=failed_tabs)
+
+    assert len(df_herb) == 3
+    assert len(df_script) == 1
+    assert list(failed_tabs) == ["Herb_Library"]
+
+
+def test_refresh_requires_prescription_input(tmp_path):
+    with SheetStandIn(fail={"1"}) as sheet:
+        with pytest.raises(RuntimeError):
+            data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+
+
+def test_incremental_refresh_keeps_unaffected_results(tmp_path):
+    with SheetStandIn() as sheet:
+        current = data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+    cache = shared_cache()
+    cache.clear()
+    PrescriptionAnalyzer(current[0], current[1], 'A', 'A', cache=cache).generate_sunburst('A')
+
+    # A new prescription B appears; A is untouched
+    with SheetStandIn(csv=dict(CSV, **{"1": CSV["1"] + "B,H1,5g\n"})) as sheet:
+        _, summary = data_loader.refresh_incremental(current, str(tmp_path), sheet.url, GIDS)
+
+    assert summary['prescriptions_added'] == 1
+    assert summary['prescriptions_affected'] == 1
+    assert summary['cache_kept'] == 1  # the sunburst; its flow tensor holds index IDs and is rebuilt
+    assert summary['new_version'] == snapshot.current_version(str(tmp_path))
+
+    *frames, version = snapshot.load_snapshot(str(tmp_path))
+    data_loader.tag_version(frames, version)
+    hits = cache.hits
+    PrescriptionAnalyzer(frames[0], frames[1], 'A', 'A', cache=cache).generate_sunburst('A')
+    assert cache.hits == hits + 1
+
+
+def test_incremental_refresh_patches_neighbor_tables(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity, 'CARRY_OVER_MAX_AFFECTED', 1.0)  # a third of this tiny library changes
+    csv = dict(CSV, **{"1": CSV["1"] + "B,H1,5g\nC,H2,5g\n"})
+    with SheetStandIn(csv=csv) as sheet:
+        current = data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+    engine = data_loader.load_similarity_engine(current[0], current[1])
+    engine.precompute()  # what the background thread does
+
+    # C gains H1; A and B are untouched
+    with SheetStandIn(csv=dict(csv, **{"1": csv["1"] + "C,H1,1g\n"})) as sheet:
+        new, summary = data_loader.refresh_incremental(current, str(tmp_path), sheet.url, GIDS)
+
+    assert summary['neighbor_tables_carried'] == len(engine._top_k)
+    assert summary['neighbor_rows_rescored'] == len(engine._top_k)  # only C, in every table
+    updated = data_loader.load_similarity_engine(new[0], new[1])
+    assert updated.neighbors('A', 'herb', 'jaccard', k=2)['Prescription_Name'].tolist() == ['C', 'B']
+
+
+def test_unchanged_sheet_is_a_noop(tmp_path, monkeypatch):
+    with SheetStandIn() as sheet:
+        current = data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+        hashes = snapshot.raw_hashes(str(tmp_path))
+        assert set(hashes) == set(GIDS)
+
+        # Herb_Library is hashed while it streams into the parser
+        assert hashes["Herb_Library"] == hashlib.sha256(CSV["2"].encode("utf-8")).hexdigest()
+
+        # Identical bytes: nothing else is parsed, the same frames (and every cache keyed on them) stay in place
+        def parse(*args):
+            raise AssertionError("unchanged tabs must not be parsed")
+        monkeypatch.setattr(data_loader, "_parse_download", parse)
+        assert data_loader.fetch_tabs(sheet.url, GIDS, timeout=5, known_hashes=hashes) == (None, {})
+        frames, summary = data_loader.refresh_incremental(current, str(tmp_path), sheet.url, GIDS)
+
+    assert frames is current
+    assert summary['unchanged']
+    assert summary['new_version'] == summary['old_version'] == data_loader.dataset_version(current[0])
+
+
+def test_pinned_version_keeps_being_served(tmp_path):
+    with SheetStandIn() as sheet:
+        current = data_loader.refresh_data(str(tmp_path), sheet.url, GIDS)
+    pinned = data_loader.dataset_version(current[0])
+    snapshot.pin_version(str(tmp_path), pinned)
+
+    changed = dict(CSV, **{"1": CSV["1"] + "B,H1,5g\n"})
+    with SheetStandIn(csv=changed) as sheet:
+        frames, summary = data_loader.refresh_incremental(current, str(tmp_path), sheet.url, GIDS)
+        assert frames is current
+        assert summary['pinned'] == pinned
+        assert snapshot.current_version(str(tmp_path)) == pinned
+        stored = summary['stored_version']
+        assert [v['version'] for v in snapshot.list_versions(str(tmp_path))] == [stored, pinned]
+
+        # The stored version is what the next refresh compares with: no second download-and-parse
+        _, summary = data_loader.refresh_incremental(current, str(tmp_path), sheet.url, GIDS)
+        assert summary['unchanged']
+
+    snapshot.unpin_version(str(tmp_path))
+    assert snapshot.current_version(str(tmp_path)) == stored
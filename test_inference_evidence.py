@@ -0,0 +1,32 @@
+import pandas as pd
+from analysis import PrescriptionAnalyzer
+
+# Mock Data: H1 has a duplicated evidence row, H3 has no library rows
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'A'],
+    'Herb_Name': ['H2', 'H1', 'H3'],
+    'Amount': [10, 20, 5]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2', 'H1', 'H1'],
+    'Compound_Name': ['C1', 'C2', 'C3', 'C1'],
+    'Target_Protein': ['T1', 'T2', 'T3', 'T1'],
+    'Core_Action': ['Act1', 'Act2', 'Act1', 'Act1'],
+    'KM_Efficacy': ['E1', 'E2', 'E1', 'E1']
+})
+
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'A')
+
+
+def test_evidence_is_grouped_by_herb():
+    evidence, ranges = analyzer.get_inference_evidence('A')
+
+    # Herbs without library rows keep their (empty) evidence row, as before
+    assert list(ranges) == ['H1', 'H2', 'H3']
+    assert list(evidence.columns) == ['Herb_Name', 'Compound_Name', 'Target_Protein', 'Core_Action', 'KM_Efficacy']
+    start, stop = ranges['H1']
+    assert evidence.iloc[start:stop]['Compound_Name'].tolist() == ['C1', 'C3']
+    start, stop = ranges['H2']
+    assert evidence.iloc[start:stop]['Target_Protein'].tolist() == ['T2']
+    assert ranges['H3'] == (3, 4) and len(evidence) == 4
@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import loadtest
+
+
+def test_summarize_percentiles():
+    summary = loadtest.summarize([i / 1000 for i in range(1, 101)])
+    assert summary['views'] == 100
+    assert round(summary['p50_ms'], 1) == 50.5
+    assert round(summary['p99_ms'], 2) == 99.01
+    assert loadtest.summarize([]) == {'views': 0}
+
+
+def test_untested_streamlit_release_is_refused(monkeypatch):
+    import streamlit
+    monkeypatch.setattr(streamlit, "__version__", "0.1.0")
+    with pytest.raises(RuntimeError, match="private AppTest internals"):
+        loadtest.prepare_app_test()
+
+
+def test_load_test_runs_sessions_against_the_app(tmp_path):
+    # Own process: the app reads its offline / snapshot settings at import
+    output = tmp_path / "loadtest.json"
+    run = subprocess.run([sys.executable, loadtest.__file__, '--sessions', '1', '2', '--visits', '2', '--duration', '60',
+                          '--prescriptions', '20', '--herbs', '30', '--library-rows', '500', '--output', str(output)],
+                         capture_output=True, text=True, timeout=300)
+    assert run.returncode == 0, run.stderr[-3000:]
+
+    levels = json.loads(output.read_text(encoding='utf-8'))['levels']
+    assert [level['sessions'] for level in levels] == [1, 2]
+    for level in levels:
+        assert level['errors'] == []
+        assert level['views'] >= 2 * level['sessions']
+        assert set(level['pages']) == set(loadtest.PAGES)
+        assert level['all']['p50_ms'] <= level['all']['p95_ms'] <= level['all']['p99_ms']
+        assert level['peak_rss_mb'] > 0
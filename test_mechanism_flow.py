@@ -1,7 +1,6 @@
 import pandas as pd
 from analysis import PrescriptionAnalyzer
 import plotly.graph_objects as go
-import os
 
 # Mock Data
 df_pres = pd.DataFrame({
@@ -12,43 +11,26 @@ df_pres = pd.DataFrame({
 
 df_herb = pd.DataFrame({
     'Herb_Name': ['H1'],
-    'Compound_Name (성분)': ['C1'],
+    'Compound_Name': ['C1'],
     'Target_Protein': ['T1'],
-    'Pathway': ['P1']
+    'Core_Action': ['Test Action'],
+    'KM_Efficacy': ['E1']
 })
 
-df_path = pd.DataFrame({
-    'Target_Protein': ['T1'],
-    'Loop_Node': ['Energy Loop'],
-    'Action_Type': ['Activation'],
-    'Action': ['Test Action']
-})
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'A')
 
-# Mock Mechanism Mapping (Simulating Google Sheet data)
-df_mech_map = pd.DataFrame({
-    'Action_Key': ['Test Action'],
-    'Source_System': ['Mitochondria'],
-    'Initial_State': ['Low'],
-    'Mechanism': ['Act'],
-    'Target_System': ['Cell'],
-    'Final_State': ['High']
-})
 
-# Initialize Analyzer with 4 dfs
-analyzer = PrescriptionAnalyzer(df_pres, df_herb, df_path, df_mech_map, 'A', 'A')
-
-# Test
-try:
-    fig = analyzer.generate_mechanism_flow('A')
-    print("Mechanism Flow generated successfully.")
-    
-    if isinstance(fig, go.Figure):
-         if len(fig.data) > 0 and len(fig.data[0].link.source) > 0:
-             print("Links found in Sankey.")
-         else:
-             print("Warning: Figure generated but no links found (Mapping match failed?).")
-    else:
-        print("Result is NOT a Plotly figure.")
-
-except Exception as e:
-    print(f"Error: {e}")
+def test_mechanism_flow_deep():
+    # The mechanism flow is the single-prescription Sankey: Pres -> Herb -> Compound -> Target -> Action
+    fig = analyzer.generate_single_sankey('A', mode='deep')
+
+    assert isinstance(fig, go.Figure)
+    assert list(fig.data[0].node.label) == ['A', 'H1', 'C1', 'T1', 'Test Action']
+    assert len(fig.data[0].link.source) == 4
+
+
+def test_mechanism_flow_condensed():
+    fig = analyzer.generate_single_sankey('A', mode='condensed')
+
+    assert list(fig.data[0].node.label) == ['A', 'H1', 'Test Action']
+    assert list(fig.data[0].link.value) == [10, 10]
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from mechanism_index import MechanismIndex
+
+# Mock Data (already preprocessed; H9 is missing from the library)
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'B', 'A', 'B', 'C'],
+    'Herb_Name': ['H1', 'H1', 'H2', 'H3', 'H9'],
+    'Amount': [10.0, 5.0, 20.0, 7.0, 1.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H1', 'H2', 'H3', 'H1'],
+    'Compound_Name': ['C1', 'C2', 'C3', 'C1', 'C1'],
+    'Target_Protein': ['T1', 'T1', 'T2', 'T3', 'T2'],
+    'Core_Action': ['Act1', 'Act1', 'Act2', 'Act1', None],
+    'KM_Efficacy': ['E1', 'E1', 'E2', 'E3', 'E1']
+})
+
+index = MechanismIndex(df_pres, df_herb)
+
+
+def expected_merge(names):
+    df = df_pres[df_pres['Prescription_Name'].isin(names)]
+    return pd.merge(df, df_herb, on='Herb_Name', how='left')
+
+
+def test_merged_frame_matches_pandas_merge():
+    for names in (['A'], ['A', 'B'], ['C'], ['missing']):
+        pd.testing.assert_frame_equal(index.merged_frame(names), expected_merge(names), check_dtype=False)
+
+
+def test_merged_frame_with_categoricals():
+    pres = df_pres.astype({'Herb_Name': 'category'})
+    herb = df_herb.astype('category')
+    cat_index = MechanismIndex(pres, herb)
+    result = cat_index.merged_frame(['A', 'B'])
+    assert result['Compound_Name'].tolist() == expected_merge(['A', 'B'])['Compound_Name'].tolist()
+
+
+def test_layer_edges():
+    h1 = index.herb_names.get_loc('H1')
+    assert index.names_for('compound', index.herb_compound.row(h1)) == ['C1', 'C2']
+    c1 = index.compound_names.get_loc('C1')
+    assert index.names_for('target', index.compound_target.row(c1)) == ['T1', 'T2', 'T3']
+    t1 = index.target_names.get_loc('T1')
+    assert index.target_action.data[index.target_action.ptr[t1]] == 2
+
+    a = index.pres_names.get_loc('A')
+    assert index.names_for('herb', index.pres_herb.row(a)) == ['H1', 'H2']
+    np.testing.assert_array_equal(index.pres_herb.data[index.pres_herb.ptr[a]:index.pres_herb.ptr[a + 1]], [10.0, 20.0])
+
+
+def test_prescription_library_rows():
+    rows = index.prescription_library_rows(['B'])
+    assert sorted(rows.tolist()) == [0, 1, 3, 4]
+    assert len(index.prescription_library_rows(['C'])) == 0
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from analysis import PrescriptionAnalyzer
+from data_loader import preprocess_data
+from mechanism_index import MechanismIndex
+from multi_compare import EXCLUSIVE, SHARED_ALL, SHARED_SUBSET, MultiComparison
+
+# Mock Data
+df_pres, df_herb, _ = preprocess_data(
+    pd.DataFrame({
+        'Prescription_Name': ['A', 'A', 'B', 'B', 'C', 'C'],
+        'Herb_Name': ['H1', 'H2', 'H1', 'H3', 'H1', 'H3'],
+        'Amount': [10.0, 20.0, 5.0, 5.0, 8.0, 2.0]
+    }),
+    pd.DataFrame({
+        'Herb_Name': ['H1', 'H2', 'H3'],
+        'Compound_Name': ['C1', 'C2', 'C3'],
+        'Target_Protein': ['T1', 'T2', 'T3'],
+        'Core_Action': ['Act1', 'Act2', 'Act2'],
+        'KM_Efficacy': ['E1', 'E1', 'E2']
+    }),
+    pd.DataFrame(columns=['Prescription_Name', 'Symptom_Status', 'Explanation'])
+)
+index = MechanismIndex(df_pres, df_herb)
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'B', index=index)
+
+
+def test_regions_partition_the_layer():
+    comparison = MultiComparison(index, ['A', 'B', 'C', 'Unknown', 'A'])
+    assert comparison.pres_names == ['A', 'B', 'C']
+
+    regions = comparison.regions('herb')
+    by_members = {members: sorted(items) for members, items in zip(regions['Members'], regions['Items'])}
+    assert by_members == {('A', 'B', 'C'): ['H1'], ('A',): ['H2'], ('B', 'C'): ['H3']}
+    assert regions['Count'].sum() == len(comparison.features['herb'])
+
+    assert comparison.shared_by_all('herb') == ['H1']
+    assert comparison.exclusive('herb', 'A') == ['H2']
+    assert comparison.set_sizes('herb').tolist() == [2, 2, 2]
+    kinds = dict(zip(index.names_for('herb', comparison.features['herb']), comparison.kinds('herb')))
+    assert kinds == {'H1': SHARED_ALL, 'H2': EXCLUSIVE, 'H3': SHARED_SUBSET}
+    # Act2 is reached by all three, through different herbs (H2 for A, H3 for B and C)
+    assert sorted(comparison.shared_by_all('action')) == ['Act1', 'Act2']
+
+
+def test_too_many_prescriptions():
+    names = [f"P{i}" for i in range(65)]
+    big = pd.DataFrame({'Prescription_Name': names, 'Herb_Name': 'H1', 'Amount': 1.0})
+    with pytest.raises(ValueError):
+        MultiComparison(MechanismIndex(big, df_herb), names)
+
+
+def test_multi_sankey_conserves_flow():
+    nodes, links = analyzer.get_multi_sankey_data(('C', 'A', 'B'))
+    # Prescription nodes follow the selection order
+    assert list(nodes['label'][:3]) == ['C', 'A', 'B']
+    from_pres = links['value'][links['source'] < 3].sum()
+    assert from_pres == pytest.approx(df_pres['Amount'].sum())
+
+    color = dict(zip(nodes['label'], nodes['color']))
+    assert color['H1'] == color['Act1']  # shared by all
+    assert color['H2'] == color['A']  # exclusive to A
+    assert color['H3'] not in (color['H1'], color['B'], color['C'])
+
+
+def test_upset_view():
+    fig = analyzer.generate_upset(('A', 'B', 'C'), 'herb')
+    assert list(fig.data[0].y) == [1, 1, 1]
+    assert list(fig.data[-1].x) == [2, 2, 2]
+    assert fig.layout.title.text.endswith("(3 regions)")
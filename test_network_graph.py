@@ -1,42 +1,37 @@
 import pandas as pd
 from analysis import PrescriptionAnalyzer
-import graphviz
+import plotly.graph_objects as go
 
 # Mock Data
 df_pres = pd.DataFrame({
-    'Prescription_Name': ['A'],
-    'Herb_Name': ['H1'],
-    'Amount': [10]
+    'Prescription_Name': ['A', 'B'],
+    'Herb_Name': ['H1', 'H1'],
+    'Amount': [10, 5]
 })
 
 df_herb = pd.DataFrame({
     'Herb_Name': ['H1'],
-    'Compound_Name (성분)': ['C1'],
+    'Compound_Name': ['C1'],
     'Target_Protein': ['T1'],
-    'Pathway': ['P1']
+    'Core_Action': ['Test Action'],
+    'KM_Efficacy': ['E1']
 })
 
-df_path = pd.DataFrame({
-    'Target_Protein': ['T1'],
-    'Loop_Node': ['Energy Loop'],
-    'Action_Type': ['Activation'],
-    'Action': ['Test Action']
-})
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'B')
+
+
+def test_comparison_network():
+    # The herb network of two prescriptions is drawn as the comparison Sankey
+    fig = analyzer.generate_sankey()
+
+    assert isinstance(fig, go.Figure)
+    assert list(fig.data[0].node.label) == ['A', 'B', 'H1', 'C1', 'Test Action']
+    # Both prescriptions link to the shared herb
+    assert sorted(fig.data[0].link.source[:2]) == [0, 1]
+
+
+def test_common_insights():
+    targets, loops = analyzer.get_common_insights()
 
-# Initialize Analyzer (reverted signature, only 5 args)
-analyzer = PrescriptionAnalyzer(df_pres, df_herb, df_path, 'A', 'A')
-
-# Test
-try:
-    dot = analyzer.generate_network_graph('A')
-    print("Network Graph generated successfully.")
-    
-    if isinstance(dot, graphviz.Digraph):
-         print("Result is a valid Graphviz Digraph.")
-         # Render source to check content
-         # print(dot.source) 
-    else:
-        print("Result is NOT a Graphviz Digraph.")
-
-except Exception as e:
-    print(f"Error: {e}")
+    assert targets == ['T1']
+    assert loops == ['Test Action']
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mechanism_index import MechanismIndex
+from path_query import PathEngine, generate_path_sankey
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B'],
+    'Herb_Name': ['H1', 'H2', 'H2'],
+    'Amount': [10.0, 20.0, 5.0]
+})
+
+# H1 -> C1 -> T1 -> Act1 (1 row); H2 -> C2 (3 rows) -> T1 / T2 -> Act1 / Act2, H2 -> C3 -> T2 -> Act2
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2', 'H2', 'H2', 'H2'],
+    'Compound_Name': ['C1', 'C2', 'C2', 'C2', 'C3'],
+    'Target_Protein': ['T1', 'T1', 'T2', 'T2', 'T2'],
+    'Core_Action': ['Act1', 'Act1', 'Act2', 'Act2', 'Act2']
+})
+
+engine = PathEngine(MechanismIndex(df_pres, df_herb))
+
+
+def test_propagation_conserves_flow():
+    flows = engine.propagate(engine.source_flow('prescription', 'A'))
+    for layer in ('herb', 'compound', 'target', 'action'):
+        assert flows[layer].sum() == pytest.approx(30.0)
+    # H2 sends 3/4 of its 20 to C2, which splits 1/3 : 2/3 over T1 / T2
+    assert dict(zip(engine.names['compound'], flows['compound'])) == pytest.approx({'C1': 10.0, 'C2': 15.0, 'C3': 5.0})
+
+    reached = engine.reached('herb', 'H2', 'action')
+    assert reached['Name'].tolist() == ['Act2', 'Act1']
+    assert reached['Flow'].tolist() == pytest.approx([0.75, 0.25])
+
+
+def test_top_paths_are_ranked_by_flow():
+    paths = engine.top_paths('prescription', 'A', 'action', 'Act1', k=5)
+    assert paths[['Herb_Name', 'Compound_Name', 'Target_Protein']].values.tolist() == [
+        ['H1', 'C1', 'T1'], ['H2', 'C2', 'T1']]
+    assert paths['Flow'].tolist() == pytest.approx([10.0, 5.0])
+    assert paths['Share'].sum() == pytest.approx(1.0)
+
+    top = engine.top_paths('prescription', 'A', 'target', 'T2', k=1)
+    assert list(top.columns) == ['Herb_Name', 'Compound_Name', 'Target_Protein', 'Flow', 'Share']
+    assert top[['Compound_Name', 'Flow']].values.tolist() == [['C2', pytest.approx(10.0)]]
+    assert engine.top_paths('prescription', 'B', 'action', 'Act1')['Flow'].tolist() == pytest.approx([1.25])
+    assert engine.top_paths('prescription', 'A', 'action', 'Unknown').empty
+
+
+def test_pruned_search_matches_full_enumeration():
+    rng = np.random.default_rng(0)
+    herb = pd.DataFrame({
+        'Herb_Name': rng.choice([f"H{i}" for i in range(8)], 400),
+        'Compound_Name': rng.choice([f"C{i}" for i in range(30)], 400),
+        'Target_Protein': rng.choice([f"T{i}" for i in range(15)], 400),
+        'Core_Action': rng.choice([f"Act{i}" for i in range(5)], 400),
+    })
+    pres = pd.DataFrame({'Prescription_Name': 'P', 'Herb_Name': [f"H{i}" for i in range(8)],
+                         'Amount': rng.uniform(1, 10, 8)})
+    big = PathEngine(MechanismIndex(pres, herb))
+
+    full = big.top_paths('prescription', 'P', 'action', 'Act0', k=10 ** 6)
+    top = big.top_paths('prescription', 'P', 'action', 'Act0', k=7)
+    assert full['Flow'].sum() == pytest.approx(big.reached('prescription', 'P')
+                                               .set_index('Name')['Flow']['Act0'])
+    assert top['Flow'].tolist() == pytest.approx(full['Flow'].head(7).tolist())
+
+
+def test_path_sankey_highlights_the_top_paths():
+    paths = engine.top_paths('prescription', 'A', 'action', 'Act2', k=5)
+    fig = generate_path_sankey(paths, highlight=1)
+    link = fig.data[0].link
+    assert len([c for c in link.color if c.startswith('rgba(231')]) == 3  # one path, three links
+    assert sum(link.value) == pytest.approx(3 * paths['Flow'].sum())
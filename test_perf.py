@@ -0,0 +1,73 @@
+import json
+import pandas as pd
+import perf
+from analysis import PrescriptionAnalyzer
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A'],
+    'Herb_Name': ['H1', 'H2'],
+    'Amount': [10.0, 20.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2'],
+    'Compound_Name': ['C1', 'C2'],
+    'Target_Protein': ['T1', 'T2'],
+    'Core_Action': ['Act1', 'Act2'],
+    'KM_Efficacy': ['E1', 'E2']
+})
+
+
+def test_disabled_spans_are_noops():
+    perf.start_run(enabled=False)
+    with perf.span('nothing') as s:
+        s.note(rows=1)
+    assert not perf.enabled()
+    assert perf.finish_run() is None
+
+
+def test_logged_runs_skip_panel_only_measurements(tmp_path, monkeypatch):
+    monkeypatch.setattr(perf, "LOG_PATH", str(tmp_path / "perf.jsonl"))
+    perf.start_run(enabled=False)
+    assert perf.enabled() and not perf.panel_open()
+    perf.finish_run()
+    perf.start_run(enabled=True)
+    assert perf.panel_open()
+    perf.finish_run()
+
+
+def test_run_collects_nested_analyzer_spans(tmp_path):
+    analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'A')
+    log = tmp_path / "perf.jsonl"
+
+    perf.start_run(enabled=True, page='test')
+    with perf.span('render') as s:
+        analyzer.generate_single_sankey('A', mode='deep')
+        analyzer.get_inference_data('A')
+        s.note(bytes=123)
+    run = perf.finish_run(log_path=str(log))
+
+    names = [sp['name'] for sp in run.spans]
+    assert names[0] == 'render'
+    assert 'PrescriptionAnalyzer.generate_single_sankey' in names
+    # get_single_sankey_data runs inside generate_single_sankey
+    inner = run.spans[names.index('PrescriptionAnalyzer.get_single_sankey_data')]
+    assert inner['depth'] == 2
+    assert run.spans[names.index('PrescriptionAnalyzer.get_inference_data')]['rows'] == 2
+    assert run.spans[0]['bytes'] == 123
+
+    logged = json.loads(log.read_text().splitlines()[0])
+    assert logged['page'] == 'test' and len(logged['spans']) == len(run.spans)
+
+
+def test_summarize_percentiles(tmp_path):
+    log = tmp_path / "perf.jsonl"
+    with log.open('a') as f:
+        for ms in [10, 20, 30, 40]:
+            f.write(json.dumps({'total_s': ms / 1000, 'spans': [{'name': 'x', 'seconds': ms / 1000}]}) + "\n")
+
+    summary = perf.summarize(str(log))
+    assert summary.loc['x', 'count'] == 4
+    assert summary.loc['x', 'p50_ms'] == 25.0
+    assert summary.loc['x', 'max_ms'] == 40.0
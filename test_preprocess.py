@@ -0,0 +1,101 @@
+import io
+
+import pandas as pd
+from data_loader import _parse_tab, ingest_herb_library, preprocess_data
+
+# Mock Data (raw sheet values, before cleaning)
+df_pres = pd.DataFrame({
+    'Prescription_Name': [' A', 'A', 'B '],
+    'Herb_Name': ['H1 ', 'H2', 'H1'],
+    'Amount': ['10g', '20 g', '1.5돈'],
+    'Unnamed: 3': [None, None, None]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2', 'H3'],
+    'Compound_Name': ['C1, C2', 'C3', None],
+    'Target_Protein': ['T1', 'T2', 'T3'],
+    'Core_Action': ['Act1', 'Act2', 'Act1'],
+    'KM_Efficacy': ['E1', 'E2', 'E1']
+})
+
+df_script = pd.DataFrame({
+    'Prescription_Name': ['A'],
+    'Symptom_Status': [' S1 '],
+    'Explanation': ['E1']
+})
+
+
+def test_preprocess_values():
+    pres, herb, script = preprocess_data(df_pres, df_herb, df_script)
+
+    assert list(pres.columns) == ['Prescription_Name', 'Herb_Name', 'Amount']
+    assert pres['Prescription_Name'].tolist() == ['A', 'A', 'B']
+    assert pres['Amount'].tolist() == [10.0, 20.0, 1.5]
+
+    # One row per compound; a missing compound list keeps a single row
+    assert herb['Herb_Name'].tolist() == ['H1', 'H1', 'H2', 'H3']
+    assert herb['Compound_Name'].tolist()[:3] == ['C1', 'C2', 'C3']
+    assert pd.isna(herb['Compound_Name'].iloc[3])
+    assert script['Symptom_Status'].tolist() == ['S1']
+
+
+def test_preprocess_shares_categorical_dictionaries():
+    pres, herb, script = preprocess_data(df_pres, df_herb, df_script)
+
+    for col in ['Herb_Name', 'Compound_Name', 'Target_Protein', 'Core_Action', 'KM_Efficacy']:
+        assert isinstance(herb[col].dtype, pd.CategoricalDtype)
+    assert pres['Herb_Name'].dtype == herb['Herb_Name'].dtype
+    assert pres['Prescription_Name'].dtype == script['Prescription_Name'].dtype
+
+
+def test_preprocess_report():
+    report = []
+    preprocess_data(df_pres, df_herb, df_script, report=report)
+
+    stages = {(r['stage'], r['table'], r['when']) for r in report}
+    assert ('explode', 'Herb_Library', 'after') in stages
+    explode_rows = {r['when']: r['rows'] for r in report if r['stage'] == 'explode'}
+    assert explode_rows == {'before': 3, 'after': 4}
+    assert all(r['memory_bytes'] > 0 for r in report)
+
+
+def test_preprocess_passes_missing_tabs_through():
+    pres, herb, script = preprocess_data(df_pres, None, None)
+    assert herb is None and script is None
+    assert len(pres) == 3
+
+
+def test_streamed_herb_library_matches_preprocess():
+    raw = (
+        "Herb_Name,Compound_Name,Target_Protein,Core_Action,KM_Efficacy,\n"
+        "H1 ,\"C1, C2\",T1,Act1,E1,\n"
+        "H2,C3,T2,Act2,\"multi\nline\",\n"
+        "H9,C9,T9,Act9,E9,x,y\n"  # malformed: too many fields
+        "H3,,T3,Act1,E1,\n"
+        "H1,\" , C4\",T1,Act2,E2,\n"
+    ).encode("utf-8")
+    # Tiny blocks: every row is parsed in a separate block
+    streamed = ingest_herb_library(io.BufferedReader(io.BytesIO(raw)), block_size=64)
+    assert streamed.attrs['malformed_rows'] == 1
+
+    _, herb, _ = preprocess_data(df_pres, streamed, df_script)
+    _, expected, _ = preprocess_data(df_pres, _parse_tab("Herb_Library", raw), df_script)
+    pd.testing.assert_frame_equal(herb, expected)
+    assert herb['Compound_Name'].tolist()[:3] == ['C1', 'C2', 'C3']
+    assert herb.attrs['malformed_rows'] == 1
+
+
+def test_streamed_short_rows_are_padded():
+    raw = (
+        "Herb_Name,Compound_Name,Target_Protein,Core_Action,KM_Efficacy,\n"
+        "H1,C1,T1,Act1,E1,\n"
+        "H2,c\n"  # too few fields: padded with nulls, as pd.read_csv does
+        "H9,C9,T9,Act9,E9,x,y\n"  # too many fields: skipped
+        "H3,C3,T3,Act3,E3,\n"
+    ).encode("utf-8")
+    streamed = ingest_herb_library(io.BufferedReader(io.BytesIO(raw)), block_size=64)
+    assert streamed.attrs['malformed_rows'] == 1
+    assert sorted(streamed['Herb_Name']) == ['H1', 'H2', 'H3']
+    short = streamed[streamed['Herb_Name'] == 'H2'].iloc[0]
+    assert short['Compound_Name'] == 'c' and pd.isna(short['Target_Protein'])
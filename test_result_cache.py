@@ -0,0 +1,141 @@
+import pandas as pd
+from analysis import PrescriptionAnalyzer
+from data_loader import migrate_results, preprocess_data, tag_version
+from dataset_diff import DatasetDiff
+from result_cache import ResultCache
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B'],
+    'Herb_Name': ['H1', 'H2', 'H1'],
+    'Amount': [10.0, 20.0, 5.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2'],
+    'Compound_Name': ['C1', 'C2'],
+    'Target_Protein': ['T1', 'T2'],
+    'Core_Action': ['Act1', 'Act2'],
+    'KM_Efficacy': ['E1', 'E2']
+})
+
+
+def test_lru_eviction_by_size():
+    cache = ResultCache(max_bytes=100, sizeof=lambda value: value)
+    cache.put(('v1', 'a'), 40)
+    cache.put(('v1', 'b'), 40)
+    assert cache.get(('v1', 'a')) == 40  # 'a' becomes most recently used
+    cache.put(('v1', 'c'), 40)
+
+    assert cache.get(('v1', 'b')) is None
+    assert cache.get(('v1', 'a')) == 40
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+    assert stats['bytes'] == 80
+
+
+def test_new_version_invalidates_old_entries():
+    cache = ResultCache(sizeof=lambda value: 1, max_versions=2)
+    cache.put(('v1', 'a'), 1)
+    cache.put(('v1', 'b'), 2)
+    # Sessions on the previous (e.g. pinned) version and on the new one share the cache without evicting each other
+    cache.put(('v2', 'a'), 3)
+    assert cache.get(('v1', 'a')) == 1 and cache.get(('v2', 'a')) == 3
+    assert len(cache) == 3
+    # A third version drops the least recently used one
+    assert cache.get(('v3', 'a')) is None
+    assert len(cache) == 1 and cache.stats()['version'] == 'v3'
+    assert cache.get(('v2', 'a')) == 3
+
+
+def test_analyzer_results_are_shared_between_instances():
+    cache = ResultCache()
+    pres = df_pres.copy()
+    pres.attrs['dataset_version'] = 'v1'
+
+    first = PrescriptionAnalyzer(pres, df_herb, 'A', 'A', cache=cache)
+    fig = first.generate_single_sankey('A', mode='deep')
+    second = PrescriptionAnalyzer(pres, df_herb, 'A', 'A', cache=cache)
+    hits = cache.hits
+    shared = second.generate_single_sankey('A', mode='deep')
+    assert cache.hits == hits + 1 and shared.to_json() == fig.to_json()
+    assert second.generate_single_sankey('A', mode='condensed').to_json() != fig.to_json()
+
+    # Sessions get copies: one caller's changes do not reach the others
+    shared.update_layout(title_text="changed")
+    frame = first.get_inference_data('A')
+    frame['Amount'] *= 0
+    assert second.generate_single_sankey('A', mode='deep').layout.title.text != "changed"
+    assert second.get_inference_data('A')['Amount'].sum() > 0
+
+    profiles = second.get_comparison_profiles()
+    third = PrescriptionAnalyzer(pres, df_herb, 'A', 'B', cache=cache)
+    assert third.get_comparison_profiles() is not profiles
+
+
+def test_unversioned_data_is_not_cached():
+    cache = ResultCache()
+    analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'A', cache=cache)
+    analyzer.get_inference_data('A')
+    assert len(cache) == 0
+
+
+def test_migrate_keeps_unaffected_entries():
+    cache = ResultCache(max_bytes=1000, sizeof=lambda value: 1)
+    cache.put(('v1', 'generate_sunburst', (), (('target_pres', 'A'),)), 'fig A')
+    cache.put(('v1', 'generate_sunburst', (), (('target_pres', 'B'),)), 'fig B')
+
+    kept, dropped = cache.migrate('v1', 'v2', keep=lambda key: 'B' not in key[3][0])
+
+    assert (kept, dropped) == (1, 1)
+    assert cache.get(('v2', 'generate_sunburst', (), (('target_pres', 'A'),))) == 'fig A'
+    # A session still on the old version bypasses the cache instead of purging the new entries
+    assert cache.get(('v1', 'generate_sunburst', (), (('target_pres', 'A'),))) is None
+    cache.put(('v1', 'generate_sunburst', (), (('target_pres', 'B'),)), 'stale B')
+    assert len(cache) == 1
+
+
+def test_migration_drops_results_holding_index_ids():
+    old = tag_version(preprocess_data(df_pres.copy(), df_herb.copy(), None), 'v1')
+    # A new prescription brings an action that sorts first, shifting every action ID
+    pres = pd.concat([df_pres, pd.DataFrame({'Prescription_Name': ['C'], 'Herb_Name': ['H3'], 'Amount': [1.0]})])
+    herb = pd.concat([df_herb, pd.DataFrame({'Herb_Name': ['H3'], 'Compound_Name': ['C0'], 'Target_Protein': ['T0'],
+                                             'Core_Action': ['Act0'], 'KM_Efficacy': ['E3']})])
+    new = tag_version(preprocess_data(pres, herb, None), 'v2')
+
+    cache = ResultCache()
+    PrescriptionAnalyzer(old[0], old[1], 'A', 'A', cache=cache).get_flow('A')
+    diff = DatasetDiff(old, new)
+    assert 'A' not in diff.affected_prescriptions
+    kept, dropped = migrate_results('v1', 'v2', new[0]['Prescription_Name'].unique(), diff.affected_prescriptions,
+                                    cache=cache)
+    assert (kept, dropped) == (0, 1)
+
+    sunburst = PrescriptionAnalyzer(new[0], new[1], 'A', 'A', cache=cache).generate_sunburst('A')
+    fresh = PrescriptionAnalyzer(new[0], new[1], 'A', 'A').generate_sunburst('A')
+    assert sorted(sunburst.data[0].labels) == sorted(fresh.data[0].labels)
+    assert {'Act1', 'Act2'} <= set(sunburst.data[0].labels)
+
+
+def test_concurrent_lookups_get_independent_figures():
+    import threading
+    import plotly.graph_objects as go
+
+    cache = ResultCache()
+    cache.put(('v1', 'fig'), go.Figure(go.Sankey(link=dict(source=[0, 1], target=[1, 2], value=[1, 2]))))
+    errors, copies = [], []
+
+    def lookup():
+        try:
+            for _ in range(20):
+                copies.append(cache.get(('v1', 'fig')))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len({id(fig) for fig in copies}) == 80 and copies[0].data[0].type == 'sankey'
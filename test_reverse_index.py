@@ -0,0 +1,56 @@
+import pandas as pd
+from mechanism_index import MechanismIndex
+from reverse_index import ReverseIndex
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B', 'B', 'C'],
+    'Herb_Name': ['H1', 'H2', 'H1', 'H3', 'H3'],
+    'Amount': [10.0, 30.0, 5.0, 15.0, 4.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H1', 'H2', 'H3'],
+    'Compound_Name': ['C1', 'C2', 'C3', 'C4'],
+    'Target_Protein': ['TNF', 'IL6', 'TNF', 'IL6'],
+    'Core_Action': ['Anti-inflammation', 'Anti-inflammation', 'Analgesia', 'Analgesia'],
+    'KM_Efficacy': ['E1', 'E1', 'E2', 'E3']
+})
+
+reverse = ReverseIndex(MechanismIndex(df_pres, df_herb))
+
+
+def test_target_lookup_ranks_by_herb_mass():
+    prescriptions, herbs = reverse.lookup('target', ['TNF'])
+
+    assert prescriptions['Prescription_Name'].tolist() == ['A', 'B']
+    assert prescriptions['Contribution'].tolist() == [40.0, 5.0]
+    assert prescriptions['Share'].tolist() == [1.0, 0.25]
+    assert prescriptions['Herbs'].tolist() == ['H1, H2', 'H1']
+    assert herbs['Herb_Name'].tolist() == ['H1', 'H2']
+    assert herbs['Prescriptions'].tolist() == [2, 1]
+
+
+def test_action_lookup_counts_each_herb_once():
+    prescriptions, herbs = reverse.lookup('action', ['Anti-inflammation', 'Analgesia'])
+    by_name = dict(zip(prescriptions['Prescription_Name'], prescriptions['Contribution']))
+    assert by_name == {'A': 40.0, 'B': 20.0, 'C': 4.0}
+    assert dict(zip(herbs['Herb_Name'], herbs['Evidence_Rows']))['H1'] == 2
+
+
+def test_unknown_feature_returns_empty_frames():
+    prescriptions, herbs = reverse.lookup('compound', ['nope'])
+    assert prescriptions.empty and herbs.empty
+
+
+def test_match_is_case_insensitive_with_exact_first():
+    assert reverse.match('target', 'il') == ['IL6']
+    assert reverse.match('compound', 'C1') == ['C1']
+    assert len(reverse.match('compound', '')) == 4
+
+
+def test_herb_lookup_lists_the_formulas_using_it():
+    prescriptions, herbs = reverse.lookup('herb', ['H3'])
+    assert prescriptions['Prescription_Name'].tolist() == ['B', 'C']
+    assert prescriptions['Share'].tolist() == [0.75, 1.0]
+    assert herbs['Herb_Name'].tolist() == ['H3'] and herbs['Evidence_Rows'].tolist() == [1]
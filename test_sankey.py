@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from analysis import PrescriptionAnalyzer
+from result_cache import ResultCache
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'B'],
+    'Herb_Name': ['H1', 'H2', 'H1'],
+    'Amount': [10.0, 20.0, 5.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H1', 'H2'],
+    'Compound_Name': ['C1', 'C2', 'C2'],
+    'Target_Protein': ['T1', 'T2', 'T2'],
+    'Core_Action': ['Act1', 'Act2', 'Act2'],
+    'KM_Efficacy': ['E1', 'E1', 'E2']
+})
+
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'B')
+
+
+def test_single_sankey_deep_arrays():
+    nodes, links = analyzer.get_single_sankey_data('A', mode='deep')
+
+    assert nodes['label'].tolist() == ['A', 'H1', 'H2', 'C1', 'C2', 'T1', 'T2', 'Act1', 'Act2']
+    assert nodes['type'].tolist()[:3] == ['Prescription', 'Herb', 'Herb']
+    # Pres -> Herb sums the amount over the herb's merged library rows
+    first = links['source'] == 0
+    assert links['value'][first].tolist() == [20.0, 20.0]
+    # Herb H1 -> C2 and H2 -> C2 are separate links
+    c2 = nodes['label'].tolist().index('C2')
+    assert links['source'][links['target'] == c2].tolist() == [1, 2]
+
+
+def test_single_sankey_condensed_splits_amount_across_actions():
+    nodes, links = analyzer.get_single_sankey_data('A', mode='condensed')
+    labels = nodes['label'].tolist()
+    h1 = labels.index('H1')
+    assert links['value'][links['source'] == h1].tolist() == [5.0, 5.0]
+
+
+def test_single_structure_matches_arrays():
+    nodes, links = analyzer.get_single_structure('A', mode='deep')
+    node_arrays, link_arrays = analyzer.get_single_sankey_data('A', mode='deep')
+    assert [n['label'] for n in nodes] == node_arrays['label'].tolist()
+    assert [l['target'] for l in links] == link_arrays['target'].tolist()
+
+
+def test_comparison_structure_colors():
+    nodes, links = analyzer.get_structure()
+    colors = {n['label']: n['color'] for n in nodes if n['type'] == 'Herb'}
+    assert colors == {'H1': 'purple', 'H2': 'red'}
+    assert isinstance(analyzer.generate_sankey(), go.Figure)
+    assert isinstance(analyzer.generate_single_sankey('A', mode='deep'), go.Figure)
+
+
+def test_views_share_one_flow_tensor():
+    pres = df_pres.copy()
+    pres.attrs['dataset_version'] = 'v1'
+    cached = PrescriptionAnalyzer(pres, df_herb, 'A', 'A', cache=ResultCache())
+    calls = []
+    flow_ids = cached.index.flow_ids
+    cached.index.flow_ids = lambda names: calls.append(names) or flow_ids(names)
+
+    cached.generate_single_sankey('A', mode='deep')
+    cached.generate_single_sankey('A', mode='condensed')
+    cached.generate_sunburst('A')
+    assert cached.get_common_insights() == (['T1', 'T2'], ['Act1', 'Act2'])
+    assert calls == [['A']]
+    # One entry per distinct Herb -> Compound -> Target -> Action path
+    flow = cached.get_flow('A')
+    assert flow['amount'].tolist() == [10.0, 10.0, 20.0]
+    assert flow['max_amount'].tolist() == [10.0, 10.0, 20.0]
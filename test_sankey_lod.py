@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from analysis import PrescriptionAnalyzer
+from data_loader import preprocess_data
+from sankey_lod import OTHER, fold_flow
+from synthetic import generate_dataset
+
+# Mock Data: one large prescription over a long-tail library
+df_pres, df_herb, _ = preprocess_data(*generate_dataset(n_prescriptions=20, n_herbs=60, library_rows=20_000,
+                                                        herbs_per_prescription=(15, 20), seed=3))
+PRES = df_pres['Prescription_Name'].value_counts().index[0]
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, PRES, PRES)
+
+
+def layer_totals(nodes, links):
+    # Flow leaving each layer
+    return [links['value'][np.isin(links['source'], np.flatnonzero(nodes['type'] == t))].sum()
+            for t in ['Prescription', 'Herb', 'Ingredient', 'Target']]
+
+
+def test_folding_conserves_flow_and_respects_budget():
+    full_nodes, full_links = analyzer.get_single_sankey_data(PRES, 'deep', node_budget=None)
+    nodes, links = analyzer.get_single_sankey_data(PRES, 'deep', node_budget=60, link_budget=300)
+
+    assert len(nodes['label']) <= 60 < len(full_nodes['label'])
+    assert len(links['value']) <= 300
+    np.testing.assert_allclose(layer_totals(nodes, links), layer_totals(full_nodes, full_links))
+    others = [label for label in nodes['label'] if label.startswith('Other (')]
+    assert len(others) == 3
+
+
+def test_kept_items_are_the_largest_by_volume():
+    flow = analyzer.get_flow(PRES)
+    folded, buckets = fold_flow(flow, node_budget=60, link_budget=None)
+    kept = np.unique(folded['compound'][(folded['compound'] >= 0) & (folded['compound'] != OTHER)])
+    volume = pd.Series(flow['amount']).groupby(flow['compound']).sum()
+    assert volume[kept].min() >= volume[buckets['compound']].max()
+    # Every compound is either kept or in the bucket
+    assert len(kept) + len(buckets['compound']) == len(volume[volume.index >= 0])
+
+
+def test_drill_down_expands_a_bucket():
+    buckets = analyzer.get_single_lod_buckets(PRES, node_budget=60, link_budget=300)
+    nodes, links = analyzer.get_single_sankey_data(PRES, 'deep', node_budget=60, link_budget=300, drill=('compound',))
+    compounds = set(nodes['label'][nodes['type'] == 'Ingredient'])
+
+    assert len(nodes['label']) <= 60
+    # Only the bucket's compounds remain, the largest of them now as their own nodes
+    assert compounds - {label for label in compounds if label.startswith('Other (')} <= set(buckets['compound'])
+    assert buckets['compound'][0] in compounds
+    fig = analyzer.generate_single_sankey(PRES, node_budget=60, link_budget=300, drill=('compound',))
+    assert fig.layout.title.text.endswith("› Other Ingredients")
+
+
+def test_small_graphs_are_not_folded():
+    flow = analyzer.get_flow(PRES)
+    folded, buckets = fold_flow(flow, node_budget=10_000, link_budget=100_000)
+    assert buckets == {}
+    assert all(np.array_equal(folded[key], flow[key]) for key in flow)
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from script_index import ScriptIndex, name_key
+
+# Mock Data: the script tab spells 쌍화탕 with a space and uses a compatibility Hanja form (U+F9B5 例)
+df_script = pd.DataFrame({
+    'Prescription_Name': ['쌍화 탕', '갈근탕', '갈근탕', '\uf9b5方', 'Orphan', None],
+    'Symptom_Status': ['피로, 두통', '발열 두통 오한', '항강', 'Fever', '두통', 'x'],
+    'Explanation': ['기혈 양허', None, '목덜미가 뻣뻣함', 'High fever and chills', '', 'x']
+})
+
+scripts = ScriptIndex(df_script, pres_names=['쌍화탕', '갈근탕', '例方'])
+
+
+def test_names_are_matched_after_normalization():
+    assert name_key(' 쌍화  탕 ') == name_key('쌍화탕')
+    assert scripts.lookup('쌍화탕')['Symptom_Status'].tolist() == ['피로, 두통']
+    assert scripts.lookup('例方')['Explanation'].tolist() == ['High fever and chills']
+    assert scripts.lookup('갈근탕')['Symptom_Status'].tolist() == ['발열 두통 오한', '항강']
+    assert scripts.lookup('갈근탕')['Explanation'].tolist() == ['', '목덜미가 뻣뻣함']
+    assert scripts.lookup('Unknown').empty
+    assert len(scripts) == 5
+
+
+def test_full_text_search():
+    # Symptom matches first, every word required, rows listed under their Prescription_Input name
+    assert scripts.search('두통')['Prescription_Name'].tolist() == ['Orphan', '갈근탕', '쌍화탕']
+    assert scripts.search('두통 오한')['Prescription_Name'].tolist() == ['갈근탕']
+    assert scripts.search('FEVER chills')['Prescription_Name'].tolist() == ['例方']
+    assert scripts.search('뻣')['Symptom_Status'].tolist() == ['항강']
+    assert scripts.search('양허', limit=0).empty
+    assert scripts.search('통증').empty and scripts.search('  ').empty
+    assert ScriptIndex(None).search('두통').empty
@@ -0,0 +1,54 @@
+import pandas as pd
+from mechanism_index import MechanismIndex
+from search_index import SearchIndex, jamo, romanize
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['쌍화탕', '쌍화탕', '보중익기탕', 'Ginseng Decoction'],
+    'Herb_Name': ['감초(甘草)', '인삼', '인삼', 'Ginseng Radix'],
+    'Amount': [4.0, 8.0, 12.0, 10.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['인삼', '감초(甘草)', 'Ginseng Radix'],
+    'Compound_Name': ['Ginsenoside Rb1', 'Glycyrrhizin', 'Ginsenoside Rg1'],
+    'Target_Protein': ['TNF', 'IL6', 'TNF'],
+    'Core_Action': ['Act1', 'Act2', 'Act1']
+})
+
+search = SearchIndex(MechanismIndex(df_pres, df_herb))
+
+
+def names(text, **kwargs):
+    return search.search(text, **kwargs)['Name'].tolist()
+
+
+def test_normalization():
+    assert jamo('쌍화') == 'ㅆㅏㅇㅎㅗㅏ'
+    assert romanize('쌍화탕') == 'ssanghwatang'
+    # Full-width letters, case and punctuation
+    assert jamo('ＧＩＮＳＥＮＧ-Radix') == 'ginseng radix'
+
+
+def test_hangul_is_found_by_syllables_jamo_and_romanization():
+    assert names('쌍화') == ['쌍화탕']
+    assert names('쌍ㅎ') == ['쌍화탕']  # last syllable still being typed
+    assert names('ssanghwa') == ['쌍화탕']
+    assert names('insam') == ['인삼']
+    assert names('甘草') == ['감초(甘草)']
+
+
+def test_ranking_and_typos():
+    result = search.search('tnf')
+    assert result.iloc[0].tolist() == ['target', 'TNF', 1.0]
+
+    # Prefix matches first, shorter names (closer to the query) ahead
+    assert names('ginseng', limit=3) == ['Ginseng Radix', 'Ginseng Decoction', 'Ginsenoside Rb1']
+    assert names('ginseng', kinds=('prescription',)) == ['Ginseng Decoction']
+    assert 'Ginseng Radix' in names('ginsneg')  # transposed letters
+    assert names('zzzz') == [] and names('  ') == []
+
+
+def test_options_are_sorted_names():
+    assert search.options['prescription'] == sorted(df_pres['Prescription_Name'].unique().tolist())
+    assert search.options['herb'] == sorted(set(df_pres['Herb_Name']) | set(df_herb['Herb_Name']))
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import similarity
+from mechanism_index import MechanismIndex
+from similarity import SimilarityEngine
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A', 'A', 'B', 'B', 'C', 'D'],
+    'Herb_Name': ['H1', 'H2', 'H3', 'H1', 'H2', 'H4', 'H3'],
+    'Amount': [10.0, 5.0, 5.0, 10.0, 5.0, 8.0, 2.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2', 'H3', 'H4'],
+    'Compound_Name': ['C1', 'C2', 'C3', 'C1'],
+    'Target_Protein': ['T1', 'T2', 'T3', 'T1'],
+    'Core_Action': ['Act1', 'Act2', 'Act1', 'Act1'],
+    'KM_Efficacy': ['E1', 'E2', 'E3', 'E4']
+})
+
+engine = SimilarityEngine(MechanismIndex(df_pres, df_herb))
+
+
+def test_herb_jaccard_neighbors():
+    result = engine.neighbors('A', layer='herb', metric='jaccard', k=3)
+    assert result['Prescription_Name'].tolist() == ['B', 'D']
+    np.testing.assert_allclose(result['Similarity'], [2 / 3, 1 / 3])
+    assert result['Shared'].tolist() == [2, 1]
+
+
+def test_compound_layer_links_different_herbs():
+    # C only shares compound C1 (via H4) with A and B
+    result = engine.neighbors('C', layer='compound', metric='cosine', k=3)
+    assert sorted(result['Prescription_Name']) == ['A', 'B']
+
+
+def test_amount_weighted_cosine():
+    result = engine.neighbors('B', layer='herb', metric='amount', k=1)
+    a = np.array([10.0, 5.0, 5.0])
+    b = np.array([10.0, 5.0, 0.0])
+    expected = a @ b / (np.linalg.norm(a) * np.linalg.norm(b))
+    assert result['Prescription_Name'].tolist() == ['A']
+    np.testing.assert_allclose(result['Similarity'], [expected])
+
+
+def test_top_k_matches_single_row_queries():
+    for layer in ['herb', 'compound', 'target', 'action']:
+        ids, vals = engine.top_k(layer=layer, metric='jaccard', k=2)
+        for name in ['A', 'B', 'C', 'D']:
+            pid = engine.index.pres_names.get_loc(name)
+            s = engine.scores(np.array([pid]), layer, 'jaccard')[0]
+            s[pid] = 0
+            np.testing.assert_allclose(vals[pid], np.sort(s)[::-1][:2])
+
+
+def test_carry_over_matches_full_recompute(monkeypatch):
+    monkeypatch.setattr(similarity, 'CARRY_OVER_MAX_AFFECTED', 1.0)
+    base = engine
+    base.top_k('herb', 'jaccard', 2)
+    # B loses H2 and a new formula E appears
+    changed = pd.concat([df_pres[~((df_pres['Prescription_Name'] == 'B') & (df_pres['Herb_Name'] == 'H2'))],
+                         pd.DataFrame({'Prescription_Name': ['E', 'E'], 'Herb_Name': ['H1', 'H2'], 'Amount': [1.0, 1.0]})])
+    updated = SimilarityEngine(MechanismIndex(changed, df_herb))
+
+    rescored = updated.carry_over(base, ['B'])
+    fresh = SimilarityEngine(MechanismIndex(changed, df_herb)).top_k('herb', 'jaccard', 2)
+
+    np.testing.assert_allclose(updated.top_k('herb', 'jaccard', 2)[1], fresh[1])
+    # Only B, the new E and rows whose old list could hide a candidate are rescored
+    assert rescored[('herb', 'jaccard', 2)] < len(updated.index.pres_names)
+
+
+def test_neighbors_are_served_from_the_precomputed_table():
+    precomputed, single_row = (SimilarityEngine(MechanismIndex(df_pres, df_herb)) for _ in range(2))
+    precomputed.precompute(k=3)
+    assert len(precomputed._top_k) == len(similarity.LAYERS) * len(similarity.METRICS)
+    for name in ['A', 'B', 'C', 'D']:
+        for k in (1, 3):
+            # The k=3 table serves smaller k as well, with the single-row results
+            pd.testing.assert_frame_equal(precomputed.neighbors(name, 'target', 'cosine', k=k),
+                                          single_row.neighbors(name, 'target', 'cosine', k=k))
+    precomputed._top_k.clear()
+    precomputed._top_k[('herb', 'jaccard', 3)] = (np.full((4, 3), -1), np.zeros((4, 3)))  # table wins
+    assert precomputed.neighbors('A', 'herb', 'jaccard', k=2).empty
@@ -0,0 +1,136 @@
+import pandas as pd
+import pytest
+import snapshot
+
+# Mock Data
+df_pres = pd.DataFrame({
+    'Prescription_Name': ['A', 'A'],
+    'Herb_Name': ['H1', 'H2'],
+    'Amount': [10.0, 20.0]
+})
+
+df_herb = pd.DataFrame({
+    'Herb_Name': ['H1', 'H2'],
+    'Compound_Name': ['C1', 'C2'],
+    'Target_Protein': ['T1', 'T2'],
+    'Core_Action': ['Act1', 'Act2']
+})
+
+df_script = pd.DataFrame({
+    'Prescription_Name': ['A'],
+    'Symptom_Status': ['S1'],
+    'Explanation': ['E1']
+})
+
+
+def test_snapshot_roundtrip(tmp_path):
+    assert snapshot.load_snapshot(str(tmp_path)) is None
+
+    version = snapshot.save_snapshot((df_pres, df_herb, df_script), str(tmp_path))
+    assert snapshot.current_version(str(tmp_path)) == version
+
+    pres, herb, script, loaded_version = snapshot.load_snapshot(str(tmp_path))
+    assert loaded_version == version
+    pd.testing.assert_frame_equal(pres, df_pres)
+    pd.testing.assert_frame_equal(herb, df_herb)
+    pd.testing.assert_frame_equal(script, df_script)
+
+
+def test_snapshot_version_follows_content(tmp_path):
+    v1 = snapshot.save_snapshot((df_pres, df_herb, df_script), str(tmp_path))
+    assert snapshot.save_snapshot((df_pres.copy(), df_herb, df_script), str(tmp_path)) == v1
+
+    changed = df_pres.assign(Amount=[10.0, 25.0])
+    v2 = snapshot.save_snapshot((changed, df_herb, df_script), str(tmp_path))
+    assert v2 != v1
+    assert snapshot.current_version(str(tmp_path)) == v2
+
+
+def test_offline_store_serves_the_snapshot(tmp_path, monkeypatch):
+    import data_loader
+    version = snapshot.save_snapshot((df_pres, df_herb, df_script), str(tmp_path))
+
+    monkeypatch.setattr(data_loader, "OFFLINE", True)
+    (pres, herb, script), as_of = data_loader.dataset_store(str(tmp_path)).get()
+    assert data_loader.dataset_version(pres) == version
+    assert len(herb) == 2 and as_of is not None
+
+    empty = data_loader.dataset_store(str(tmp_path / "empty"))
+    assert empty.get() == (None, None)
+    assert "Offline mode" in empty.status()['last_error']
+
+
+def test_mapped_snapshot_matches_and_is_shared(tmp_path):
+    import numpy as np
+    from data_loader import preprocess_data
+    from mechanism_index import MechanismIndex
+
+    frames = preprocess_data(df_pres, df_herb.assign(KM_Efficacy=['E1', None]), df_script)
+    version = snapshot.save_snapshot(frames, str(tmp_path))
+
+    *mapped, mapped_version = snapshot.load_mapped(str(tmp_path))
+    assert mapped_version == version
+    for original, loaded in zip(frames, mapped):
+        pd.testing.assert_frame_equal(loaded, original, check_exact=True)
+    # Shared dictionaries stay shared; the codes are the read-only mapped file
+    assert mapped[0]['Herb_Name'].cat.categories is mapped[1]['Herb_Name'].cat.categories
+    assert not mapped[1]['Compound_Name'].cat.codes.to_numpy().flags.writeable
+
+    index = snapshot.load_index(mapped[0], mapped[1])
+    assert isinstance(index.row_compound, np.memmap)
+    built = MechanismIndex(*frames[:2])
+    flow, expected = index.flow_ids(['A']), built.flow_ids(['A'])
+    assert all(np.array_equal(flow[k], expected[k]) for k in expected)
+
+
+def test_mapped_copy_is_published_for_older_snapshots(tmp_path):
+    import shutil
+
+    version = snapshot.save_snapshot((df_pres, df_herb, df_script), str(tmp_path))
+    shutil.rmtree(tmp_path / version / snapshot.MAPPED_DIR)
+
+    pres, herb, script, _ = snapshot.load_mapped(str(tmp_path))
+    assert (tmp_path / version / snapshot.MAPPED_DIR).is_dir()
+    pd.testing.assert_frame_equal(herb, df_herb)
+    # A second publish of the same directory keeps the first copy
+    snapshot.publish_dir(str(tmp_path / version / snapshot.MAPPED_DIR), lambda tmp: None)
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith(".tmp-")) == []
+
+
+def test_versions_can_be_listed_pinned_and_rolled_back(tmp_path, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(snapshot.time, "time", lambda: next(clock))
+    d = str(tmp_path)
+    versions = [snapshot.save_snapshot((df_pres.assign(Amount=[10.0, amount]), df_herb, df_script), d)
+                for amount in (20.0, 25.0, 30.0)]
+    listed = snapshot.list_versions(d)
+    assert [v['version'] for v in listed] == versions[::-1]
+    assert listed[0]['current'] and listed[0]['rows']['Prescription_Input'] == 2
+
+    assert snapshot.rollback(d) == versions[1]
+    assert snapshot.current_version(d) == snapshot.pinned_version(d) == versions[1]
+    # New content is stored while pinned, but CURRENT stays on the pinned version
+    latest = snapshot.save_snapshot((df_pres.assign(Amount=[10.0, 35.0]), df_herb, df_script), d)
+    assert snapshot.current_version(d) == versions[1]
+    assert snapshot.list_versions(d)[0]['version'] == latest
+
+    snapshot.unpin_version(d)
+    assert snapshot.pinned_version(d) is None
+    assert snapshot.current_version(d) == latest
+    with pytest.raises(ValueError):
+        snapshot.pin_version(d, "unknown")
+
+
+def test_old_versions_are_pruned(tmp_path, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(snapshot.time, "time", lambda: next(clock))
+    d = str(tmp_path)
+    first = snapshot.save_snapshot((df_pres, df_herb, df_script), d)
+    snapshot.pin_version(d, first)
+    for amount in (21.0, 22.0, 23.0):
+        snapshot.save_snapshot((df_pres.assign(Amount=[10.0, amount]), df_herb, df_script), d, keep=2)
+
+    # The pinned version survives pruning however old it is
+    kept = [v['version'] for v in snapshot.list_versions(d)]
+    assert len(kept) == 3 and kept[-1] == first
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith(".tmp-")]
@@ -11,29 +11,19 @@ df_pres = pd.DataFrame({
 
 df_herb = pd.DataFrame({
     'Herb_Name': ['H1', 'H2'],
-    'Compound_Name (성분)': ['C1', 'C2'],
+    'Compound_Name': ['C1', 'C2'],
     'Target_Protein': ['T1', 'T2'],
-    'Pathway': ['P1', 'P2']
+    'Core_Action': ['Act1', 'Inh1'],
+    'KM_Efficacy': ['E1', 'E2']
 })
 
-df_path = pd.DataFrame({
-    'Target_Protein': ['T1', 'T2'],
-    'Loop_Node': ['Loop1', 'Loop2'],
-    'Action_Type': ['Activation', 'Inhibition'],
-    'Action': ['Act1', 'Inh1']
-})
+analyzer = PrescriptionAnalyzer(df_pres, df_herb, 'A', 'A')
+
 
-# Initialize Analyzer
-analyzer = PrescriptionAnalyzer(df_pres, df_herb, df_path, 'A', 'A')
+def test_sunburst():
+    fig = analyzer.generate_sunburst('A')
 
-# Test generate_inference_sunburst
-try:
-    fig = analyzer.generate_inference_sunburst('A')
-    print("Sunburst generated successfully.")
-    # Check if fig is a Plotly figure
-    if isinstance(fig, go.Figure):
-        print("Result is a valid Plotly Figure.")
-    else:
-        print("Result is NOT a Plotly Figure.")
-except Exception as e:
-    print(f"Error generating Sunburst: {e}")
+    assert isinstance(fig, go.Figure)
+    assert fig.data[0].type == 'sunburst'
+    # Herb -> Core Action hierarchy
+    assert set(fig.data[0].ids) == {'H1', 'H2', 'H1/Act1', 'H2/Inh1'}
@@ -0,0 +1,45 @@
+import pandas as pd
+from synthetic import generate_dataset
+from data_loader import preprocess_data
+from bench import run_suite
+
+frames = generate_dataset(n_prescriptions=50, n_herbs=30, library_rows=2_000, n_actions=20, seed=7)
+
+
+def test_generate_dataset_is_seeded():
+    again = generate_dataset(n_prescriptions=50, n_herbs=30, library_rows=2_000, n_actions=20, seed=7)
+    for df, df_again in zip(frames, again):
+        pd.testing.assert_frame_equal(df, df_again)
+
+
+def test_generate_dataset_shape():
+    df_pres, df_herb, df_script = frames
+
+    assert df_pres['Prescription_Name'].nunique() == 50
+    assert df_script['Prescription_Name'].nunique() == 50
+    # Herbs are distinct within a prescription
+    assert not df_pres.duplicated(['Prescription_Name', 'Herb_Name']).any()
+    assert df_pres['Amount'].str.endswith('g').all()
+
+    pres, herb, _ = preprocess_data(*(df.copy() for df in frames))
+    assert pres['Amount'].gt(0).all()
+    # Compound lists explode to about library_rows rows
+    assert 1_800 <= len(herb) <= 2_200
+
+
+def test_generate_dataset_long_tail():
+    # A few actions are reached by most library rows
+    counts = frames[1]['Core_Action'].value_counts()
+    assert counts.iloc[0] > 5 * counts.median()
+
+
+def test_run_suite_times_every_method():
+    results = run_suite(frames, repeat=1)
+    names = {r['name'] for r in results}
+
+    assert {'preprocess_data', 'MechanismIndex', 'generate_sankey', 'get_comparison_profiles'} <= names
+    assert 'generate_single_sankey[median,condensed]' in names
+    # Later paths: level of detail, the flow tensor, mechanism paths and the N-way comparison
+    assert {'get_flow[heavy]', 'get_single_lod_buckets[heavy]', 'PathEngine.top_paths[heavy]',
+            'generate_upset[8,herb]', 'generate_multi_sankey[8]'} <= names
+    assert all(r['best_s'] >= 0 and len(r['runs']) == 1 for r in results)